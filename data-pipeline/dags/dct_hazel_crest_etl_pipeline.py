@@ -9,12 +9,14 @@ extracting data, data validation, transformation, and uploading data to differen
 The workflow is scheduled to run daily, extracting and processing data from various sources, 
 transforming it as required, and then loading it into designated databases and storage systems.
 """
+import json
 import os
 import sys
 import yaml
 import pendulum
 
 from airflow import DAG
+from airflow.exceptions import AirflowFailException, AirflowSkipException
 from airflow.operators.bash import BashOperator
 from airflow.operators.python import PythonOperator
 from airflow.utils.trigger_rule import TriggerRule
@@ -36,10 +38,36 @@ report_scripts_dir = os.path.join(home, config['paths']['report_scripts_dir'])
 load_scripts_dir = os.path.join(home, config['paths']['load_scripts_dir'])
 transform_scripts_dir = os.path.join(home, config['paths']['transform_scripts_dir'])
 frontend_scripts_dir = os.path.join(home, config['paths']['frontend_scripts_dir'])
+backup_requirements = config.get('backup_requirements') or {}
+backup_store_dir = config['paths'].get('backup_store_dir')
+backup_store = config.get('backup_store') or {}
+extract_status_dir = os.path.join(home, config['paths']['logs_dir'], "scripts=extract", "extract_runner")
 
 # Append source directory to system path
 sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
 from src_backup_sqlite_db import backup_sqlite_db
+from src_backup_store import backup_sqlite_db_to_store
+
+
+def check_extract_status(status_file, spec_name):
+    """
+    Sets the state of the task of an extract spec from the outcome saved by the extract runner.
+
+    Parameters:
+    status_file (str): The JSON file of the outcomes, written by extract_runner.py --status-file.
+    spec_name (str): The name of the extract spec.
+
+    Raises:
+    AirflowSkipException: If the extract returned no data for a table, like the exit code 99 of an extract script.
+    AirflowFailException: If the extract failed, or the runner saved no outcome for it.
+    """
+    with open(status_file, 'r') as file:
+        status = json.load(file).get(spec_name)
+    if status == "empty":
+        raise AirflowSkipException(f"No data found for at least one table of {spec_name}")
+    if status != "success":
+        raise AirflowFailException(f"Extract {spec_name} finished with status: {status}")
+
 
 # Script List: Contains mapping of tasks to script files
 scripts_list = {
@@ -92,22 +120,47 @@ with DAG(
     )
 
     # Backup DB Raw Tables: Back-up SQLite file for Raw Tables
-    backup_db_raw_tables = PythonOperator(
-        task_id='backup_db_raw_tables',
-        python_callable=backup_sqlite_db,
-        op_kwargs={'db_path': f'{raw_db}',
-                   'backup_dir': f'{backup_db_dir}/raw',
-                   'db_name': 'HazelCrestRawTables'}
-    )
+    # With a backup store configured, snapshots are deduplicated into the store instead of copied
+    if backup_store_dir:
+        backup_db_raw_tables = PythonOperator(
+            task_id='backup_db_raw_tables',
+            python_callable=backup_sqlite_db_to_store,
+            op_kwargs={'db_path': f'{raw_db}',
+                       'store_dir': os.path.join(home, backup_store_dir, 'raw'),
+                       'db_name': 'HazelCrestRawTables',
+                       **backup_requirements,
+                       **backup_store}
+        )
+    else:
+        backup_db_raw_tables = PythonOperator(
+            task_id='backup_db_raw_tables',
+            python_callable=backup_sqlite_db,
+            op_kwargs={'db_path': f'{raw_db}',
+                       'backup_dir': f'{backup_db_dir}/raw',
+                       'db_name': 'HazelCrestRawTables',
+                       **backup_requirements}
+        )
 
     # Backup DB Derived Tables:  Back-up SQLite file for Derived Tables
-    backup_db_derived_tables = PythonOperator(
-        task_id='backup_db_derived_tables',
-        python_callable=backup_sqlite_db,
-        op_kwargs={'db_path': f'{derived_db}',
-                   'backup_dir': f'{backup_db_dir}/derived',
-                   'db_name': 'HazelCrestDerivedTables'}
-    )
+    if backup_store_dir:
+        backup_db_derived_tables = PythonOperator(
+            task_id='backup_db_derived_tables',
+            python_callable=backup_sqlite_db_to_store,
+            op_kwargs={'db_path': f'{derived_db}',
+                       'store_dir': os.path.join(home, backup_store_dir, 'derived'),
+                       'db_name': 'HazelCrestDerivedTables',
+                       **backup_requirements,
+                       **backup_store}
+        )
+    else:
+        backup_db_derived_tables = PythonOperator(
+            task_id='backup_db_derived_tables',
+            python_callable=backup_sqlite_db,
+            op_kwargs={'db_path': f'{derived_db}',
+                       'backup_dir': f'{backup_db_dir}/derived',
+                       'db_name': 'HazelCrestDerivedTables',
+                       **backup_requirements}
+        )
 
     # Start Extract: Marks the start of the extract jobs
     start_extract = BashOperator(
@@ -115,13 +168,25 @@ with DAG(
         bash_command='echo Start Extract'
     )
 
-    # Run all Extract files
+    # Run all Extracts concurrently in one process, sharing a pooled connection to the API. The outcome of
+    # every extract is saved for the run, and given to the task of its spec below.
+    extract_status_file = os.path.join(extract_status_dir, "status_{{ ts_nodash }}.json")
+    extract_all_tables = BashOperator(
+        task_id="extract_all_tables",
+        bash_command=f'python3 {extract_scripts_dir}/extract_runner.py --specs {" ".join(scripts_list["extract"])} '
+                     f'--status-file "{extract_status_file}" '
+    )
+
+    # One task per extract spec, skipped when its extract returned no data and failed when it failed
     extract_task_list = []
-    for table_name, file_name in scripts_list['extract'].items():
+    for table_name in scripts_list['extract']:
 
-        extract_task = BashOperator(
+        extract_task = PythonOperator(
             task_id=f"{table_name}",
-            bash_command=f'python3 {extract_scripts_dir}/{file_name} '
+            python_callable=check_extract_status,
+            op_kwargs={'status_file': extract_status_file,
+                       'spec_name': table_name},
+            trigger_rule=TriggerRule.ALL_DONE
         )
         extract_task_list.append(extract_task)
 
@@ -211,7 +276,7 @@ with DAG(
     )
 
 (start_dag >> [backup_db_raw_tables, backup_db_derived_tables]
- >> start_extract >> extract_task_list
+ >> start_extract >> extract_all_tables >> extract_task_list
  >> validate_log_data >> upload_sqlite_raw_tables
  >> transform_task_list
  >> start_frontend_data_prep >> frontend_24hour_data_to_json_file >> frontend_landingpage_stats_calculate
@@ -0,0 +1,121 @@
+"""
+Resumable API Data Backfill
+
+This Python script reloads historical data for one extract spec over any date range, for example
+after a schema change. The range is extracted in windows whose size adapts to the number of records
+and bytes the previous windows returned, and every completed window is checkpointed to a state file.
+If the backfill stops (a failed query, a crash or a restart of the server), running the same command
+again resumes with the first window that was not completed.
+
+Each window writes its own CSV files to the extracted CSV directory, with the start of the window
+prefixed to the file name (e.g. `20240201T000000_hashed_Victim.csv`), so no window overwrites another
+and the files can be loaded with the regular load scripts.
+
+Usage:
+    python3 extract_backfill.py --spec extract_victim --start-date "2023-01-01 00:00:00"
+                                --end-date "2024-01-01 00:00:00" [--initial-window-days 10]
+                                [--state-file STATE_FILE] [--output-directory OUTPUT_DIRECTORY]
+
+The script exits with code 1 if the backfill stopped before the end of the range.
+"""
+import argparse
+import logging
+import os
+import sys
+import yaml
+from datetime import datetime, timedelta
+
+home = os.environ.get('HOME')
+script_name = "extract_backfill"
+
+# Load the YAML configuration file for paths
+with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
+    config = yaml.safe_load(file)
+
+# Set directory paths
+extracted_csv_dir = os.path.join(home, config['paths']['extracted_csv_dir'])
+backfill_state_dir = os.path.join(home, config['paths'].get('backfill_state_dir', 'airflow/data/backfill/'))
+src_path = os.path.join(home, config['paths']['src_dir'])
+log_dir = os.path.join(home, config['paths']['logs_dir'], "scripts=extract", script_name)
+
+# Include the src directory in the system path for importing modules
+sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
+
+# Import custom modules from the src directory
+from src_extract_backfill import backfill
+from src_extract_runner import QUERY_DATE_FORMAT, create_session
+from src_extract_specs import EXTRACT_SPECS
+
+# Parse the command line arguments
+parser = argparse.ArgumentParser(description="Backfill an extract spec over a date range in resumable windows.")
+parser.add_argument("--spec", required=True, choices=list(EXTRACT_SPECS),
+                    help="Extract spec to backfill.")
+parser.add_argument("--start-date", required=True, type=lambda value: datetime.strptime(value, QUERY_DATE_FORMAT),
+                    help="Start datetime of the backfill, formatted as 'YYYY-mm-dd HH:MM:SS'.")
+parser.add_argument("--end-date", required=True, type=lambda value: datetime.strptime(value, QUERY_DATE_FORMAT),
+                    help="End datetime of the backfill, formatted as 'YYYY-mm-dd HH:MM:SS'.")
+parser.add_argument("--initial-window-days", type=float, default=10,
+                    help="Size of the first window in days. Later windows are sized from the data. Defaults to 10.")
+parser.add_argument("--state-file",
+                    help="JSON file the progress is checkpointed to. Defaults to a file named after the spec and "
+                         "date range in the backfill state directory.")
+parser.add_argument("--output-directory", default=extracted_csv_dir,
+                    help="Directory for the hashed CSV files. Defaults to the extracted CSV directory.")
+args = parser.parse_args()
+
+if args.start_date >= args.end_date:
+    parser.error("--start-date must be before --end-date")
+
+state_file = args.state_file or os.path.join(
+    backfill_state_dir,
+    f"{args.spec}__{args.start_date:%Y%m%dT%H%M%S}__{args.end_date:%Y%m%dT%H%M%S}.json")
+output_directory = os.path.join(args.output_directory, "")
+
+# Check if the directories exist, if not, create them
+for directory in [log_dir, output_directory]:
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+        logging.info(f"Created directory: {directory}")
+
+# Set-up Logging
+log_file_name = datetime.now().strftime("%Y%m%dT%H%M%S") + f"__{script_name}.log"
+log_file_path = os.path.join(log_dir, log_file_name)
+logging.basicConfig(filename=log_file_path,
+                    level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    filemode='w'
+                    )
+
+logging.info("Setting up API authentication and configuration")
+# API Authentication and Configuration
+try:
+    AUTH = (config['ecom_vmware']['username'], config['ecom_vmware']['password'])
+except Exception as e:
+    logging.exception("Error in setting up authentication: " + str(e))
+
+BASE_URL = f"http://{config['ecom_vmware']['hostname']}:{config['ecom_vmware']['port']}/DataExchange/REST"
+HEADERS = {'Content-type': 'text/xml'}
+
+logging.info("Configuring data salt")
+# Salting Configurations
+DATA_SALT = config['extract_requirements']['data_salt']
+
+logging.info(f"Backfilling {args.spec} with state file {state_file}")
+session = create_session(auth=AUTH, headers=HEADERS)
+try:
+    completed = backfill(spec_name=args.spec,
+                         start_date=args.start_date,
+                         end_date=args.end_date,
+                         state_file=state_file,
+                         session=session,
+                         base_url=BASE_URL,
+                         output_directory=output_directory,
+                         salt=DATA_SALT,
+                         initial_window=timedelta(days=args.initial_window_days))
+finally:
+    session.close()
+
+if not completed:
+    sys.exit(1)
+
+logging.info("Script execution completed.")
@@ -3,13 +3,20 @@ API Data Extraction and Hashing Module
 
 This Python script is designed for extracting data from an API, transforming it, and
 then hashing specific columns for privacy and security reasons.
+
+Usage:
+    python3 extract_cad_traffic_stops.py [--replay]
+
+The extract is incremental: it queries the records from the watermark of the spec up to now. With
+--replay the latest archived API response of the spec is reprocessed instead of querying the API, and
+the watermark is left alone (see extract_runner.py to replay a date range).
 """
+import argparse
 import logging
 import os
-import requests
 import sys
 import yaml
-from datetime import datetime, timedelta
+from datetime import datetime
 
 home = os.environ.get('HOME')
 script_name = "extract_cad_traffic_stops"
@@ -21,6 +28,7 @@ with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
 # Set directory paths
 extracted_csv_dir = os.path.join(home, config['paths']['extracted_csv_dir'])
 src_path = os.path.join(home, config['paths']['src_dir'])
+raw_db = os.path.join(home, config['databases']['raw_tables'])
 log_dir = os.path.join(home, config['paths']['logs_dir'], "scripts=extract", script_name)
 OUTPUT_DIRECTORY = os.path.join(home, extracted_csv_dir)
 
@@ -28,7 +36,15 @@ OUTPUT_DIRECTORY = os.path.join(home, extracted_csv_dir)
 sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
 
 # Import custom modules from the src directory
-from src_extract_hash_raw_data import parse_xml, salted_hash, hash_columns
+from src_extract_runner import (EXTRACT_EMPTY, EXTRACT_FAILED, create_session, incremental_date_range,
+                                replay_extract, run_extract)
+from src_address_cache import get_address_cache
+
+# Parse the command line arguments
+parser = argparse.ArgumentParser(description="Extract and hash the tables of this extract spec.")
+parser.add_argument("--replay", action="store_true",
+                    help="Reprocess the latest archived API response instead of querying the API.")
+args = parser.parse_args()
 
 # Check if the directory exists, if not, create it
 if not os.path.exists(log_dir):
@@ -62,103 +78,39 @@ logging.info("Configuring PII and data salts")
 PII_SALT = config['extract_requirements']['pii_salt']
 DATA_SALT = config['extract_requirements']['data_salt']
 
-logging.info("Calculating dates for API query")
-# Calculate the dates for the API query
-yesterday = datetime.now() - timedelta(days=1)
-start_date = yesterday.replace(hour=0,
-                               minute=0,
-                               second=0,
-                               microsecond=0)
-end_date = start_date + timedelta(days=1)
-
-# start_date = datetime(2022, 1, 1, 0, 0, 0)
-# end_date = datetime(2024, 2, 13, 0, 0, 0)
-
-logging.info("Defining files to hash and their corresponding columns")
-# Define files to hash and their corresponding columns
-files_to_hash = {
-    "CADTrafficStopTable": {'output_file': 'hashed_CADTrafficStopTable_main.csv',
-                        'columns_to_hash': ["CallTaker", "PlateNumberOfStoppedVeh",
-                                            "UnitNumber", "UserWhoLastModifiedRecord",
-                                            "LongTermCallID"
-                                            ]
-                        },
-    "GeobaseAddressIDMaintenance": {'output_file': 'hashed_GeobaseAddressIDMaintenance_cdtrstop.csv',
-                                    'columns_to_hash': []
-                                    },
-}
-
-def query_api(start_date, end_date, auth, base_url, headers):
-    """
-    Queries API using XML query and returns the response text.
-
-    Parameters:
-    - start_date (datetime): Start datetime for the query.
-    - end_date (datetime): End datetime for the query.
-    - auth (tuple): Authentication credentials for the API.
-    - base_url (str): Base URL for the API.
-    - headers (dict): Headers for the API request.
-
-    Returns:
-    - str: Response text from the API if successful, otherwise None.
-    """
-    logging.info(f"Preparing to query API between {start_date} and {end_date}.")
-    # XML query for the API
-    xml_query=f'''<?xml version="1.0" encoding="UTF-8"?>
-                    <PublicSafetyEnvelope version="1.0">
-                        <MessageIdentification/>
-                        <From>Ecom 911</From>
-                        <To/>
-                        <Creation/>
-                        <PublicSafety id="">
-                            <Query modby="true" modwhen="true" addby="true" addwhen="true">
-                                <LawIncidentTable>
-                                    <AgencyCode search_type="equal_to">HCPD</AgencyCode>
-                                    <IncidentNature search_type="equal_to">Traffic Stop</IncidentNature>
-                                    <TimeDateOccurredAfter search_type="between">
-                                        <SearchValue>{start_date}</SearchValue>
-                                        <SearchValue>{end_date}</SearchValue>
-                                    </TimeDateOccurredAfter>
-                                <CADTrafficStopTable parentField="LongTermCallID" childField="LongTermCallID"></CADTrafficStopTable>
-                                <GeobaseAddressIDMaintenance parentField="GeobaseAddressID" childField="IDNumberOfAddress"></GeobaseAddressIDMaintenance>
-                                </LawIncidentTable>
-                            </Query>
-                        </PublicSafety>
-                    </PublicSafetyEnvelope>'''
-
-    try:
-        response = requests.post(base_url, headers=headers, auth=auth, data=xml_query)
-        return response.text
-    except requests.exceptions.HTTPError as http_err:
-        logging.error(f"HTTP error occurred during API request: {http_err}")
-    except Exception as err:
-        logging.critical(f"Critical error during API request: {err}")
-    return None
-
-# Process each table and hash the specified columns
-logging.info("Starting file processing")
-for table_name, info in files_to_hash.items():
-    try:
-        logging.info(f"Processing table: {table_name}")
-        html_text = query_api(start_date=start_date.strftime("%Y-%m-%d %H:%M:%S"),
-                              end_date=end_date.strftime("%Y-%m-%d %H:%M:%S"),
-                              auth=AUTH, base_url=BASE_URL, headers=HEADERS)
-
-        if html_text:
-            data_frame = parse_xml(text_file=html_text, table_name=table_name)
-            if data_frame is not None and not data_frame.empty:
-                hash_columns(data_frame=data_frame,
-                             output_file=info['output_file'],
-                             output_directory=OUTPUT_DIRECTORY,
-                             columns_to_hash=info['columns_to_hash'],
-                             salt=DATA_SALT)
-                logging.info(f"Successfully processed and hashed data for table {table_name}")
-            else:
-                logging.warning(f"No data found or empty DataFrame for table {table_name}. Skipping Task.")
-                sys.exit(99)
-        else:
-            logging.error(f"Failed to get a valid response for table {table_name}")
-    except Exception as e:
-        logging.critical(f"Critical error while processing table {table_name}: {e}")
+if args.replay:
+    # Reprocess the latest archived response, without changing the watermark
+    logging.info("Replaying the latest archived response")
+    status = replay_extract(spec_name=script_name,
+                            start_date=None,
+                            end_date=None,
+                            output_directory=OUTPUT_DIRECTORY,
+                            salt=DATA_SALT)
+else:
+    logging.info("Calculating dates for API query")
+    # Calculate the dates for the API query: from the watermark of the last loaded extract up to now
+    start_date, end_date = incremental_date_range(script_name, raw_db)
+
+    # Query the API once and hash every table of the extract spec
+    logging.info("Starting file processing")
+    session = create_session(auth=AUTH, headers=HEADERS)
+    status = run_extract(spec_name=script_name,
+                         start_date=start_date,
+                         end_date=end_date,
+                         session=session,
+                         base_url=BASE_URL,
+                         output_directory=OUTPUT_DIRECTORY,
+                         salt=DATA_SALT,
+                         watermark_db=raw_db,
+                         address_cache=get_address_cache(raw_db))
+    session.close()
+
+if status == EXTRACT_FAILED:
+    logging.error("The extract failed.")
+    sys.exit(1)
+
+if status == EXTRACT_EMPTY:
+    logging.warning("No data found for at least one table. Skipping Task.")
+    sys.exit(99)
 
 logging.info("Script execution completed.")
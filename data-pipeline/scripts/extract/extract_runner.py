@@ -0,0 +1,153 @@
+"""
+Concurrent API Data Extraction Runner
+
+This Python script runs several extracts in a single process. It is used by the pipeline in
+place of starting one process per extract script: the interpreter, pandas and the YAML
+configuration are loaded once, and all extracts share one pooled keep-alive HTTP session to
+the DataExchange REST endpoint. The number of extracts querying the server at the same time is
+capped with --max-workers (or `max_concurrent_requests` under `extract_requirements` in
+config.yaml) so the Spillman server is not overloaded.
+
+Usage:
+    python3 extract_runner.py [--specs extract_victim extract_offender ...] [--max-workers 3]
+                              [--start-date "2024-03-01 00:00:00" --end-date "2024-03-02 00:00:00"]
+                              [--replay] [--status-file status.json]
+
+By default the extracts are incremental: every spec is queried from its watermark (the newest date
+of its last loaded extract) up to now, and its pending watermark is advanced once the load script has
+committed the data. With --start-date and --end-date the given range is extracted instead and the
+watermarks are left alone. The runner exits with code 1 if any extract failed, and otherwise, like
+the individual extract scripts, with code 99 if any extract returned no data.
+
+With --status-file the outcome of every extract ("success", "empty" or "failed") is written to a JSON
+file, so the pipeline can give each extract spec its own task state (see the DAG).
+
+Every API response is archived under `archive_dir`. With --replay the archived responses are
+reprocessed instead of querying the API: the latest archived window of each spec, or with a date range
+every archived window inside it (each saved to files prefixed with the start of its window). Replays
+do not change the watermarks.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import yaml
+from datetime import datetime
+
+home = os.environ.get('HOME')
+script_name = "extract_runner"
+
+# Load the YAML configuration file for paths
+with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
+    config = yaml.safe_load(file)
+
+# Set directory paths
+extracted_csv_dir = os.path.join(home, config['paths']['extracted_csv_dir'])
+src_path = os.path.join(home, config['paths']['src_dir'])
+raw_db = os.path.join(home, config['databases']['raw_tables'])
+log_dir = os.path.join(home, config['paths']['logs_dir'], "scripts=extract", script_name)
+OUTPUT_DIRECTORY = os.path.join(home, extracted_csv_dir)
+
+# Include the src directory in the system path for importing modules
+sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
+
+# Import custom modules from the src directory
+from src_extract_runner import EXTRACT_EMPTY, EXTRACT_FAILED, QUERY_DATE_FORMAT, run_extracts
+from src_extract_specs import EXTRACT_SPECS
+from src_address_cache import get_address_cache
+
+# Parse the command line arguments
+parser = argparse.ArgumentParser(description="Run extract specs concurrently in one process.")
+parser.add_argument("--specs", nargs="+", default=list(EXTRACT_SPECS), choices=list(EXTRACT_SPECS),
+                    help="Extract specs to run. Defaults to all of them.")
+parser.add_argument("--max-workers", type=int,
+                    default=config['extract_requirements'].get('max_concurrent_requests', 3),
+                    help="Maximum number of extracts querying the API at the same time.")
+parser.add_argument("--start-date", type=lambda value: datetime.strptime(value, QUERY_DATE_FORMAT),
+                    help="Start datetime of the extract, formatted as 'YYYY-mm-dd HH:MM:SS'. "
+                         "Defaults to the watermark of each spec.")
+parser.add_argument("--end-date", type=lambda value: datetime.strptime(value, QUERY_DATE_FORMAT),
+                    help="End datetime of the extract, formatted as 'YYYY-mm-dd HH:MM:SS'. Defaults to now.")
+parser.add_argument("--replay", action="store_true",
+                    help="Reprocess archived API responses instead of querying the API.")
+parser.add_argument("--status-file",
+                    help="JSON file the outcome of every extract is written to.")
+args = parser.parse_args()
+
+if (args.start_date is None) != (args.end_date is None):
+    parser.error("--start-date and --end-date must be given together")
+
+# Check if the directory exists, if not, create it
+if not os.path.exists(log_dir):
+    os.makedirs(log_dir)
+    logging.info(f"Created log directory: {log_dir}")
+
+# Set-up Logging, naming the thread (the extract spec) of each line
+log_file_name = datetime.now().strftime("%Y%m%dT%H%M%S") + f"__{script_name}.log"
+log_file_path = os.path.join(log_dir, log_file_name)
+logging.basicConfig(filename=log_file_path,
+                    level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(threadName)s - %(levelname)s - %(message)s',
+                    filemode='w'
+                    )
+
+logging.info("Setting up API authentication and configuration")
+# API Authentication and Configuration
+try:
+    AUTH = (config['ecom_vmware']['username'], config['ecom_vmware']['password'])
+except Exception as e:
+    logging.exception("Error in setting up authentication: " + str(e))
+
+BASE_URL = f"http://{config['ecom_vmware']['hostname']}:{config['ecom_vmware']['port']}/DataExchange/REST"
+HEADERS = {'Content-type': 'text/xml'}
+
+logging.info("Configuring data salt")
+# Salting Configurations
+DATA_SALT = config['extract_requirements']['data_salt']
+
+# Extract the given date range, or incrementally from the watermark of each spec
+if args.replay:
+    logging.info("Replaying archived responses, watermarks are not changed")
+    watermark_db = None
+elif args.start_date:
+    logging.info(f"Extracting from {args.start_date} to {args.end_date}, watermarks are not changed")
+    watermark_db = None
+else:
+    logging.info("Extracting incrementally from the watermark of each spec")
+    watermark_db = raw_db
+
+results = run_extracts(spec_names=args.specs,
+                       start_date=args.start_date,
+                       end_date=args.end_date,
+                       auth=AUTH,
+                       base_url=BASE_URL,
+                       headers=HEADERS,
+                       output_directory=OUTPUT_DIRECTORY,
+                       salt=DATA_SALT,
+                       max_workers=args.max_workers,
+                       watermark_db=watermark_db,
+                       replay=args.replay,
+                       address_cache=get_address_cache(raw_db))
+
+if args.status_file:
+    # Write the statuses atomically, so the tasks reading them never see a partial file
+    os.makedirs(os.path.dirname(os.path.abspath(args.status_file)), exist_ok=True)
+    temporary_file = args.status_file + ".tmp"
+    with open(temporary_file, 'w') as file:
+        json.dump(results, file, indent=4)
+    os.replace(temporary_file, args.status_file)
+    logging.info(f"Extract statuses written to {args.status_file}")
+
+# A failed extract takes precedence over an empty one, so it is never reported as skipped
+failed_extracts = [spec_name for spec_name, status in results.items() if status == EXTRACT_FAILED]
+if failed_extracts:
+    logging.error(f"Extracts failed: {', '.join(failed_extracts)}")
+    sys.exit(1)
+
+empty_extracts = [spec_name for spec_name, status in results.items() if status == EXTRACT_EMPTY]
+if empty_extracts:
+    logging.warning(f"No data found for extracts: {', '.join(empty_extracts)}. Skipping Task.")
+    sys.exit(99)
+
+logging.info("Script execution completed.")
@@ -2,7 +2,7 @@ import json
 import os
 import pandas as pd
 import pytz
-import sqlite3
+import sys
 import yaml
 import numpy as np
 
@@ -17,6 +17,12 @@ try:
     with open(config_path, 'r') as file:
         config = yaml.safe_load(file)
 
+    # Include the src directory in the system path for importing modules
+    src_path = os.path.join(home, config['paths']['src_dir'])
+    sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
+
+    from src_sqlite_connection import connect
+
     # JSON Directory
     json_data_dir = config['paths']['json_storage_dir']
 
@@ -27,8 +33,8 @@ try:
     central_tz = pytz.timezone('US/Central')
     yesterday = (datetime.now(central_tz) - timedelta(days=1)).date()
 
-    # Connect to SQLite database
-    with sqlite3.connect(db_path) as conn:
+    # Connect to SQLite database, read-only
+    with connect(db_path, profile="read-export") as conn:
         cursor = conn.cursor()
 
         # Function to load data and process it
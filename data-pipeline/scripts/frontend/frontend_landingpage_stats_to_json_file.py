@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 import json
 import yaml
 import os
-import sqlite3
+import sys
 import pytz
 
 # Set Home Directory
@@ -15,11 +15,17 @@ cst_timezone = pytz.timezone('America/Chicago')
 with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
     config = yaml.safe_load(file)
 
+# Include the src directory in the system path for importing modules
+src_path = os.path.join(home, config['paths']['src_dir'])
+sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
+
+from src_sqlite_connection import connect
+
 # Path to your SQLite database
 db_path = os.path.join(home, config['databases']['derived_tables'])
 
-# Connect to SQLite database
-conn = sqlite3.connect(db_path)
+# Connect to SQLite database, read-only
+conn = connect(db_path, profile="read-export")
 cursor = conn.cursor()
 
 # Execute SQL query
@@ -1,9 +1,9 @@
-import sqlite3
 import csv
 import zipfile
 from pathlib import Path
 import time
 import os
+import sys
 import iam_rolesanywhere_session
 import yaml
 from boto3.s3.transfer import TransferConfig
@@ -15,6 +15,12 @@ home = os.environ.get('HOME')
 with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
     config = yaml.safe_load(file)
 
+# Include the src directory in the system path for importing modules
+src_path = os.path.join(home, config['paths']['src_dir'])
+sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
+
+from src_sqlite_connection import connect
+
 # Define the environment as 'prod'
 environment = "prod"
 
@@ -37,8 +43,8 @@ certificate = os.path.join(home, config['aws'][environment]['iamanywhere']['cert
 private_key = os.path.join(home, config['aws'][environment]['iamanywhere']['private_key'])
 region = config['aws'][environment]['iamanywhere']['region']
 
-# Connect to SQLite database
-conn = sqlite3.connect(db_path)
+# Connect to SQLite database, read-only
+conn = connect(db_path, profile="read-export")
 cursor = conn.cursor()
 
 # Define your tables
@@ -4,6 +4,32 @@ CSV File Processing and Database Loading Module
 This module is designed for automated processing and loading of CSV files into an SQLite database. It is particularly
 useful in scenarios where raw data extraction results in multiple CSV files that need to be processed and stored in a
 structured database format.
+
+Once every file has been loaded, the pending watermarks of the extracts are promoted so that the next
+extracts continue from the newest data now committed to the raw tables. If a file could not be loaded, or
+some of its rows were quarantined in LoadQuarantine, the watermark of the extract spec writing the file is
+left unchanged and its next extract queries the same records again; the other specs move on. Rows that were
+already quarantined by an earlier load are settled: they failed again when loaded again, so they do not
+hold the watermark back a second time and are left in LoadQuarantine to be fixed by hand. A file that fails
+with an error does not stop the load of the other files, but the script exits with an error once they are
+loaded.
+
+By default every file is merged through a staging table in one set-based statement, and the number of
+inserted, updated and unchanged rows is saved to the LoadStatistics table. Set `load_mode` to "upsert" in
+the `load_requirements` section of config.yaml to upsert the rows in batches instead.
+
+The keys of the rows inserted or updated by a merge are published to the ChangedKeys table under the run ID
+of the load (its start time, e.g. 20240101T020000), so the later stages can process only what changed.
+
+Set `defer_indexes` to true in `load_requirements` to drop the secondary indexes of the loaded tables during
+the load and rebuild them once afterwards, which is faster for large loads such as backfills.
+
+Files already loaded are skipped: the load manifest records the path, size, modification time and content
+hash of every loaded file. If `loaded_csv_archive_dir` is set in the `paths` section of config.yaml, loaded
+files are moved to a dated subdirectory of it.
+
+The addresses of every fully loaded address file are recorded in the address cache, so the next extracts
+only save new or changed addresses.
 """
 from datetime import datetime
 import logging
@@ -24,12 +50,18 @@ extracted_csv_dir = os.path.join(home, config['paths']['extracted_csv_dir'])
 db_path = os.path.join(home, config['databases']['raw_tables'])
 src_path = os.path.join(home, config['paths']['src_dir'])
 log_dir = os.path.join(home, config['paths']['logs_dir'], "scripts=load", script_name)
+loaded_csv_archive_dir = config['paths'].get('loaded_csv_archive_dir')
 
 # Dynamically adjust the system path to include the source directory
 sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
 
 # Import custom functions for database processing
-from src_load_raw_data_sqlite_db import process_csv, get_primary_key, get_table_name
+from src_load_raw_data_sqlite_db import DEFAULT_BATCH_SIZE, process_csv, merge_csv, get_primary_key, get_table_name
+from src_sqlite_connection import connect, defer_indexes
+from src_extract_watermarks import commit_pending_watermarks
+from src_extract_specs import get_spec_name
+from src_address_cache import ADDRESS_TABLE, record_loaded_addresses
+from src_load_manifest import LoadManifest, archive_loaded_file
 
 # Check if the directory exists, if not, create it
 if not os.path.exists(log_dir):
@@ -45,28 +77,117 @@ logging.basicConfig(filename=log_file_path,
                     filemode='w'
                     )
 
+load_requirements = config.get('load_requirements', {})
+
+# Number of rows upserted per transaction
+batch_size = load_requirements.get('batch_size', DEFAULT_BATCH_SIZE)
+
+# Merge each file through a staging table, or upsert its rows in batches
+load_mode = load_requirements.get('load_mode', 'merge')
+
+# Rebuild the secondary indexes once after the load instead of updating them row by row, for large loads
+deferred_index_builds = load_requirements.get('defer_indexes', False)
+
+# ID of this load in the ChangedKeys table
+run_id = datetime.now().strftime("%Y%m%dT%H%M%S")
+
 # Get a list of all files in the specified directory
 export_file_list = os.listdir(os.path.join(home, extracted_csv_dir))
 
-logging.info("Start processing files.")
-for file_name in export_file_list:
-    file_path = os.path.join(extracted_csv_dir, file_name)
 
+def load_files():
+    """
+    Loads every supported file of the extracted files directory into the raw tables.
+
+    Returns:
+    tuple: The extract specs whose files or rows could not all be loaded, and the names of the files that
+           failed with an error.
+    """
+    held_specs = set()
+    error_files = []
+    manifest = LoadManifest(db_path)
+    for file_name in export_file_list:
+        file_path = os.path.join(extracted_csv_dir, file_name)
+
+        try:
+            # Retrieve primary key and table name for the file
+            logging.info("Retrieve primary key and table name for the file")
+            primary_key = get_primary_key(file_name)
+            table_name = get_table_name(file_name)
+
+            # Check if the file type is supported and process the CSV
+            logging.info("Check if the file type is supported and process the CSV")
+            if primary_key and table_name:
+                # Skip the files already loaded, such as stale files of extracts that had nothing new
+                loaded, content_hash = manifest.is_loaded(file_path, table_name)
+                if loaded:
+                    logging.info(f"Skipping already loaded file: {file_path}")
+                    continue
+
+                if load_mode == 'upsert':
+                    rows_loaded, failed_inserts, settled_inserts = process_csv(
+                        file_name=file_path, table_name=table_name, primary_key=primary_key, db_path=db_path,
+                        batch_size=batch_size)
+                else:
+                    statistics = merge_csv(file_name=file_path, table_name=table_name,
+                                           primary_key=primary_key, db_path=db_path, batch_size=batch_size,
+                                           run_id=run_id)
+                    failed_inserts = statistics['failed']
+                    settled_inserts = statistics['settled']
+                    rows_loaded = statistics['inserted'] + statistics['updated'] + statistics['unchanged']
+                logging.info(f"Processed CSV: {file_path}, Table Name: {table_name}")
+                if settled_inserts:
+                    logging.warning(f"{settled_inserts} rows of {file_path} were already quarantined by an earlier "
+                                    f"load and are settled, fix them in LoadQuarantine")
+
+                # Remember the loaded addresses, unless some rows failed and must be extracted again
+                if table_name == ADDRESS_TABLE and failed_inserts == settled_inserts:
+                    record_loaded_addresses(db_path, file_path)
+
+                # Record and archive loaded files; files with unsettled failed rows are loaded again next time
+                if failed_inserts > settled_inserts:
+                    logging.warning(f"{failed_inserts - settled_inserts} rows of {file_path} were quarantined "
+                                    f"in LoadQuarantine")
+                    held_specs.add(get_spec_name(file_name))
+                else:
+                    manifest.record(file_path, table_name, rows_loaded, content_hash)
+                    if loaded_csv_archive_dir:
+                        archive_loaded_file(file_path, os.path.join(home, loaded_csv_archive_dir))
+            else:
+                # Log a warning for unsupported file types
+                logging.warning(f"Unsupported file type: {file_name}")
+        except FileNotFoundError:
+            # Log an error if the file is not found and continue with the next file
+            logging.error(f"File not found: {extracted_csv_dir}/{file_name}")
+            held_specs.add(get_spec_name(file_name))
+            continue
+        except Exception:
+            # Log the error and continue with the next file; the script fails once all files are processed
+            logging.exception(f"Failed to load file: {file_path}")
+            held_specs.add(get_spec_name(file_name))
+            error_files.append(file_name)
+    # Files that no extract spec writes, like the files of backfills, hold back no watermark
+    return held_specs - {None}, error_files
+
+
+logging.info("Start processing files.")
+if deferred_index_builds:
+    loaded_tables = sorted({get_table_name(file_name) for file_name in export_file_list} - {None})
+    index_connection = connect(db_path, profile="bulk-load", isolation_level=None)
     try:
-        # Retrieve primary key and table name for the file
-        logging.info("Retrieve primary key and table name for the file")
-        primary_key = get_primary_key(file_name)
-        table_name = get_table_name(file_name)
-
-        # Check if the file type is supported and process the CSV
-        logging.info("Check if the file type is supported and process the CSV")
-        if primary_key and table_name:
-            process_csv(file_name=file_path, table_name=table_name, primary_key=primary_key, db_path=db_path)
-            logging.info(f"Processed CSV: {file_path}, Table Name: {table_name}")
-        else:
-            # Log a warning for unsupported file types
-            logging.warning(f"Unsupported file type: {file_name}")
-    except FileNotFoundError:
-        # Log an error if the file is not found and continue with the next file
-        logging.error(f"File not found: {extracted_csv_dir}/{file_name}")
-        continue
\ No newline at end of file
+        with defer_indexes(index_connection, loaded_tables):
+            held_specs, error_files = load_files()
+    finally:
+        index_connection.close()
+else:
+    held_specs, error_files = load_files()
+
+# Advance the extract watermarks once the files are committed, except those of the specs with unloaded files
+if held_specs:
+    logging.warning(f"Not all files were loaded, the watermarks of {', '.join(sorted(held_specs))} are not advanced.")
+advanced = commit_pending_watermarks(db_path, held_specs=held_specs)
+logging.info(f"Advanced {advanced} extract watermarks.")
+
+if error_files:
+    logging.error(f"{len(error_files)} files failed to load: {', '.join(error_files)}")
+    sys.exit(1)
@@ -0,0 +1,85 @@
+"""
+Mock Spillman Flex DataExchange Server
+
+This Python script runs a local stand-in for the DataExchange REST API of the `ecom_vmware` host, so
+the extract scripts can be run, tested and benchmarked without access to the real server. It answers
+the `PublicSafetyEnvelope` queries of the extract scripts with synthetic records that have the columns
+of the raw tables schema and dates inside the queried range.
+
+Usage:
+    python3 mock_dataexchange_server.py [--port 8000] [--records-per-day 100] [--latency 0.5]
+                                        [--reference-records 5000] [--seed 0]
+
+To point the extracts at the mock server, set `hostname` to 127.0.0.1 and `port` to the port of the
+mock server in the `ecom_vmware` section of config.yaml. To benchmark at a multiple of the Hazel Crest
+volume, raise --records-per-day accordingly.
+"""
+import argparse
+import logging
+import os
+import sys
+import yaml
+from datetime import datetime
+
+home = os.environ.get('HOME')
+script_name = "mock_dataexchange_server"
+
+# Load the YAML configuration file for paths
+with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
+    config = yaml.safe_load(file)
+
+# Set directory paths
+src_path = os.path.join(home, config['paths']['src_dir'])
+log_dir = os.path.join(home, config['paths']['logs_dir'], "scripts=mock", script_name)
+schema_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "schema",
+                           "schema_database_setup_raw_tables.py")
+
+# Include the src directory in the system path for importing modules
+sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
+
+# Import custom modules from the src directory
+from src_mock_dataexchange import MockDataExchange, create_server, load_schema_columns
+
+# Parse the command line arguments
+parser = argparse.ArgumentParser(description="Run a local mock of the Spillman Flex DataExchange REST API.")
+parser.add_argument("--host", default="127.0.0.1", help="Host name or address to listen on.")
+parser.add_argument("--port", type=int, default=8000, help="Port to listen on.")
+parser.add_argument("--records-per-day", type=float, default=100,
+                    help="Number of records returned per day of the queried range.")
+parser.add_argument("--latency", type=float, default=0.0,
+                    help="Seconds waited before answering each query.")
+parser.add_argument("--reference-records", type=int, default=5000,
+                    help="Number of distinct records of joined tables, e.g. distinct addresses.")
+parser.add_argument("--seed", type=int, default=0, help="Seed of the generated data.")
+parser.add_argument("--schema-file", default=schema_file,
+                    help="Schema script the table columns are read from.")
+args = parser.parse_args()
+
+# Check if the directory exists, if not, create it
+if not os.path.exists(log_dir):
+    os.makedirs(log_dir)
+
+# Set-up Logging
+log_file_name = datetime.now().strftime("%Y%m%dT%H%M%S") + f"__{script_name}.log"
+log_file_path = os.path.join(log_dir, log_file_name)
+logging.basicConfig(filename=log_file_path,
+                    level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(threadName)s - %(levelname)s - %(message)s',
+                    filemode='w'
+                    )
+
+mock = MockDataExchange(load_schema_columns(args.schema_file),
+                        records_per_day=args.records_per_day,
+                        reference_records=args.reference_records,
+                        seed=args.seed)
+server = create_server(mock, host=args.host, port=args.port, latency=args.latency)
+
+logging.info(f"Serving mock DataExchange API on http://{args.host}:{args.port}/DataExchange/REST "
+             f"with {args.records_per_day} records per day and {args.latency} seconds latency")
+print(f"Serving mock DataExchange API on http://{args.host}:{args.port}/DataExchange/REST (Ctrl+C to stop)")
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    logging.info("Mock DataExchange API stopped")
+finally:
+    server.server_close()
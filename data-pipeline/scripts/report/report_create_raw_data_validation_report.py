@@ -4,11 +4,15 @@ CSV Data Validation Module
 This module is designed to read and validate CSV files extracted from various sources. It is particularly useful in data
 processing pipelines where validation of extracted data is crucial before further processing or analysis.
 
-The main functionality of the script is to iterate over all CSV files in the specified directory, read each file into
-a pandas DataFrame, and then validate the data using a custom validation function. This process ensures that each CSV
-file is checked for data integrity and consistency.
+The main functionality of the script is to profile all CSV files in the specified directory (row counts and missing
+values per column, and sketches of the distinct values, most frequent values and timestamp range of each column) and
+save a single validation report for the run. The profiles saved during the extraction are used when they still match
+the files; other files are read in chunks, so memory use does not grow with the file size.
+
+The metrics of the run are appended to the validation history in the raw tables database and compared with their
+rolling baselines (see `validation_requirements` in config.yaml). With `fail_on_anomaly` the script exits with code 1
+when a metric is flagged, which stops the DAG before the files are loaded.
 """
-import pandas as pd
 import sys
 import os
 import logging
@@ -25,9 +29,14 @@ src_path = os.path.join(home, config['paths']['src_dir'])
 sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
 
 # import functions from src folder
-from src_create_report_raw_data import validate_table
+from src_create_report_raw_data import DEFAULT_CHUNK_SIZE, DEFAULT_TOP_VALUES, create_run_report
 
 directory_path = os.path.join(home, config['paths']['extracted_csv_dir'])
+db_path = os.path.join(home, config['databases']['raw_tables'])
+report_requirements = config.get('report_requirements') or {}
+chunk_size = report_requirements.get('chunk_size', DEFAULT_CHUNK_SIZE)
+top_values = report_requirements.get('top_values', DEFAULT_TOP_VALUES)
+validation_requirements = config.get('validation_requirements') or {}
 
 # Log Path
 log_name = os.path.join("scripts=report", "report_create_raw_data_validation_report")
@@ -47,16 +56,16 @@ logging.basicConfig(filename=log_file_path,
                     filemode='w'
                     )
 
-# Initialize the list to store file names
-export_file_list = os.listdir(f'{directory_path}/')
-
-for file_path in export_file_list:
-    try:
-        logging.info(f"Reading csv file: {file_path}")
-        df = pd.read_csv(f'{directory_path}/{file_path}')
+logging.info("Running create_run_report function")
+run_report = create_run_report(directory_path, chunk_size=chunk_size, history_db=db_path,
+                               baseline_runs=validation_requirements.get('baseline_runs', 14),
+                               min_history=validation_requirements.get('min_history', 5),
+                               threshold=validation_requirements.get('threshold', 3.0),
+                               top_values=top_values,
+                               accept_after=validation_requirements.get('accept_after', 3))
 
-        logging.info("Running validate_table function")
-        validate_table(dataframe=df, csv=file_path)
-    except FileNotFoundError:
-        logging.error(f"File not found: {directory_path + file_path}")
-        continue
+if run_report['anomalies']:
+    logging.error(f"{len(run_report['anomalies'])} metrics deviate from their baseline: "
+                  f"{', '.join(sorted({anomaly['table_name'] for anomaly in run_report['anomalies']}))}")
+    if validation_requirements.get('fail_on_anomaly', False):
+        sys.exit(1)
@@ -0,0 +1,71 @@
+"""
+Raw Data Profile Roll-up Module
+
+This module merges the raw data validation reports of the last days into a single profile of each extracted file over
+the period: its row count, the missing values of each column and the sketches of its columns (distinct values, most
+frequent values and timestamp range). The sketches saved with the daily reports are merged, so the extracted files are
+not read again, and the merged report can itself be merged into longer periods.
+
+Usage:
+    python report_merge_raw_data_profiles.py [--days 7] [--name weekly]
+
+The merged report is saved next to the daily reports as <timestamp>_raw_data_profile_<name>.json.
+"""
+import sys
+import os
+import argparse
+import logging
+import yaml
+from datetime import datetime, timedelta
+
+home = os.environ.get('HOME')
+
+# Load the YAML configuration file for paths
+with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
+    config = yaml.safe_load(file)
+
+src_path = os.path.join(home, config['paths']['src_dir'])
+sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
+
+# import functions from src folder
+from src_create_report_raw_data import DEFAULT_TOP_VALUES, merge_run_reports, reports_dir, save_report_to_file
+
+parser = argparse.ArgumentParser(description="Merge the raw data validation reports of the last days.")
+parser.add_argument("--days", type=int, default=7, help="Number of days of reports merged. Default is 7.")
+parser.add_argument("--name", default="weekly", help="Name of the merged profile. Default is weekly.")
+args = parser.parse_args()
+
+top_values = (config.get('report_requirements') or {}).get('top_values', DEFAULT_TOP_VALUES)
+
+# Log Path
+log_name = os.path.join("scripts=report", "report_merge_raw_data_profiles")
+log_dir = os.path.join(home, config['paths']['logs_dir'], log_name)
+
+# Check if the directory exists, if not, create it
+if not os.path.exists(log_dir):
+    os.makedirs(log_dir)
+    logging.info(f"Created log directory: {log_dir}")
+
+# Set-up Logging
+log_file_name = datetime.now().strftime("%Y%m%dT%H%M%S") + "__report_merge_raw_data_profiles.log"
+log_file_path = os.path.join(log_dir, log_file_name)
+logging.basicConfig(filename=log_file_path,
+                    level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    filemode='w'
+                    )
+
+# Run reports are named <YYYYMMDDTHHMMSS.ffffff>_raw_data_validation_run.json, so the names sort by time
+report_dir = os.path.join(reports_dir, "script=validate_tables")
+since = (datetime.now() - timedelta(days=args.days)).strftime("%Y%m%dT%H%M%S")
+report_paths = [os.path.join(report_dir, file_name) for file_name in sorted(os.listdir(report_dir))
+                if file_name.endswith("_raw_data_validation_run.json") and file_name >= since]
+
+if not report_paths:
+    logging.error(f"No run reports found in {report_dir} over the last {args.days} days")
+    sys.exit(1)
+
+logging.info(f"Merging {len(report_paths)} run reports over the last {args.days} days")
+merged_report = merge_run_reports(report_paths, top_values=top_values)
+merged_report['name'] = args.name
+save_report_to_file(report=merged_report, directory=report_dir, filename=f"raw_data_profile_{args.name}.json")
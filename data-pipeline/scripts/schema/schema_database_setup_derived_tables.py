@@ -13,8 +13,8 @@ and use of force incidents.
 Each table is carefully structured with relevant fields and data types, and foreign key relationships are established
 where necessary to maintain data integrity and relational links between tables.
 """
-import sqlite3
 import os
+import sys
 import yaml
 
 home = os.environ.get('HOME')
@@ -23,6 +23,12 @@ home = os.environ.get('HOME')
 with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
     config = yaml.safe_load(file)
 
+# Include the src directory in the system path for importing modules
+src_path = os.path.join(home, config['paths']['src_dir'])
+sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
+
+from src_sqlite_connection import connect
+
 DB_PATH = os.path.join(home, config['databases']['derived_tables'])
 
 # Check if the database file exists
@@ -31,7 +37,7 @@ if os.path.exists(DB_PATH):
 else:
 
     # Connect to your SQLite database
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     cursor = conn.cursor()
 
     # Create each table
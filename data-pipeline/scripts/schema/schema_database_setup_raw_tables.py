@@ -13,8 +13,8 @@ and use of force incidents.
 Each table is carefully structured with relevant fields and data types, and foreign key relationships are established
 where necessary to maintain data integrity and relational links between tables.
 """
-import sqlite3
 import os
+import sys
 import yaml
 
 home = os.environ.get('HOME')
@@ -23,6 +23,14 @@ home = os.environ.get('HOME')
 with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
     config = yaml.safe_load(file)
 
+# Include the src directory in the system path for importing modules
+src_path = os.path.join(home, config['paths']['src_dir'])
+sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
+
+from src_sqlite_connection import connect
+from src_raw_indexes import create_secondary_indexes
+from src_raw_timestamps import add_timestamp_columns
+
 DB_PATH = os.path.join(home, config['databases']['raw_tables'])
 
 # Check if the database file exists
@@ -31,7 +39,7 @@ if os.path.exists(DB_PATH):
 else:
 
     # Connect to your SQLite database
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     cursor = conn.cursor()
 
     cursor.execute("""CREATE Table JailInmateTable (
@@ -273,7 +281,7 @@ else:
      "ArsonDamageAmount" TEXT,
      "IncidentNumber" TEXT, 
      Primary Key ("IncidentNumber", "StatuteCode", "OffenseCode", "SequenceNumber")
-     )"""
+     ) WITHOUT ROWID"""
     )
 
     cursor.execute("""CREATE Table Offender (
@@ -693,7 +701,7 @@ else:
      "SequenceNumber" TEXT,
      "TypeOfThisRecord" TEXT,
      Primary Key ("DateInvolvementOccurred", "RecIDThisRecordsIDNo", "RelIDRelatedRecordsID", "RecordSecurityID", "TypeOfThisRecord")
-     )""")
+     ) WITHOUT ROWID""")
 
     cursor.execute("""CREATE Table JailOffenseTable (
      "OffenseNumber" TEXT PRIMARY KEY,
@@ -762,7 +770,7 @@ else:
      "UnitNumber" TEXT,
      "UnitZoneCode" TEXT,
      Primary Key ("LongTermCallID", "OfficerName", "UnitStatus", "TimeOfStatusChange")
-     )""")
+     ) WITHOUT ROWID""")
 
     cursor.execute("""CREATE Table OfficerStatusCodeTable (
      "OfficerStatus" TEXT PRIMARY KEY,
@@ -806,5 +814,81 @@ else:
                         "CrimeType" TEXT,
                         "CrimeCategory" TEXT)""")
 
+    # High-water marks of the incremental extracts, see src_extract_watermarks
+    cursor.execute("""CREATE Table ExtractWatermarks (
+                        "SpecName" TEXT PRIMARY KEY,
+                        "Watermark" TEXT,
+                        "PendingWatermark" TEXT,
+                        "WhenModified" TEXT)""")
+
+    # Hashes of the loaded addresses, see src_address_cache
+    cursor.execute("""CREATE Table AddressDimensionCache (
+                        "IDNumberOfAddress" TEXT PRIMARY KEY,
+                        "RowHash" TEXT,
+                        "WhenModified" TEXT)""")
+
+    # Rows that could not be loaded into the raw tables, see src_load_raw_data_sqlite_db
+    cursor.execute("""CREATE Table LoadQuarantine (
+                        "FileName" TEXT,
+                        "LineNumber" INTEGER,
+                        "TableName" TEXT,
+                        "RowData" TEXT,
+                        "Error" TEXT,
+                        "WhenQuarantined" TEXT)""")
+
+    # Inserted, updated and unchanged rows of every merged file, see src_load_raw_data_sqlite_db
+    cursor.execute("""CREATE Table LoadStatistics (
+                        "FileName" TEXT,
+                        "TableName" TEXT,
+                        "Inserted" INTEGER,
+                        "Updated" INTEGER,
+                        "Unchanged" INTEGER,
+                        "Failed" INTEGER,
+                        "WhenLoaded" TEXT)""")
+
+    # Content fingerprints of the merged rows, and the keys changed by each load, see src_load_raw_data_sqlite_db
+    cursor.execute("""CREATE Table RowFingerprints (
+                        "TableName" TEXT,
+                        "PrimaryKey" TEXT,
+                        "Fingerprint" TEXT,
+                        PRIMARY KEY ("TableName", "PrimaryKey"))""")
+
+    cursor.execute("""CREATE Table ChangedKeys (
+                        "RunID" TEXT,
+                        "TableName" TEXT,
+                        "PrimaryKey" TEXT,
+                        "ChangeType" TEXT,
+                        "WhenChanged" TEXT)""")
+    cursor.execute("""CREATE INDEX ChangedKeys_RunID ON ChangedKeys ("RunID", "TableName")""")
+
+    # Extracted files already loaded, see src_load_manifest
+    cursor.execute("""CREATE Table LoadManifest (
+                        "FilePath" TEXT PRIMARY KEY,
+                        "FileSize" INTEGER,
+                        "FileModified" INTEGER,
+                        "ContentHash" TEXT,
+                        "TableName" TEXT,
+                        "RowsLoaded" INTEGER,
+                        "WhenLoaded" TEXT)""")
+
+    # Row counts and null rates of every validation report, see src_create_report_raw_data
+    cursor.execute("""CREATE Table ValidationHistory (
+                        "FileName" TEXT,
+                        "ColumnName" TEXT,
+                        "Metric" TEXT,
+                        "RunID" TEXT,
+                        "Value" REAL,
+                        "Baseline" REAL,
+                        "Deviation" REAL,
+                        "Anomaly" INTEGER,
+                        "WhenRecorded" TEXT,
+                        PRIMARY KEY ("FileName", "ColumnName", "Metric", "RunID"))""")
+
+    # Sortable companion columns of the timestamp columns, see src_raw_timestamps
+    add_timestamp_columns(conn)
+
+    # Secondary indexes on the partition columns used by the rollover, see src_raw_indexes
+    create_secondary_indexes(conn)
+
     # Close the connection
     conn.close()
@@ -0,0 +1,81 @@
+"""
+Raw Tables Index Migration
+
+This Python script adds the sortable timestamp columns (see src_raw_timestamps) and creates the secondary
+indexes of the raw tables (see src_raw_indexes) on an existing raw tables database, dropping the retired
+ones, then runs the index advisor: `EXPLAIN QUERY PLAN` over the registry of pipeline queries, reporting
+every lookup that is still a full table scan.
+
+Usage:
+    python3 schema_migrate_raw_indexes.py [--advise-only]
+
+With --advise-only the database is not changed and only the advisor report is written. Creating the
+indexes takes a write lock on the database, so run the migration outside of the nightly DAG run.
+"""
+import argparse
+import logging
+import os
+import sys
+import yaml
+from datetime import datetime
+
+home = os.environ.get('HOME')
+script_name = "schema_migrate_raw_indexes"
+
+# Load the YAML configuration file for paths
+with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
+    config = yaml.safe_load(file)
+
+# Set directory paths
+db_path = os.path.join(home, config['databases']['raw_tables'])
+src_path = os.path.join(home, config['paths']['src_dir'])
+log_dir = os.path.join(home, config['paths']['logs_dir'], "scripts=schema", script_name)
+
+# Include the src directory in the system path for importing modules
+sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
+
+# Import custom modules from the src directory
+from src_sqlite_connection import connect
+from src_raw_indexes import advise, create_secondary_indexes, drop_retired_indexes
+from src_raw_timestamps import add_timestamp_columns
+
+# Parse the command line arguments
+parser = argparse.ArgumentParser(description="Add the timestamp columns and secondary indexes of the raw tables and report full scans.")
+parser.add_argument("--advise-only", action="store_true",
+                    help="Only report the pipeline queries not served by an index, without creating indexes.")
+args = parser.parse_args()
+
+# Check if the directory exists, if not, create it
+if not os.path.exists(log_dir):
+    os.makedirs(log_dir)
+
+# Set-up Logging
+log_file_name = datetime.now().strftime("%Y%m%dT%H%M%S") + f"__{script_name}.log"
+log_file_path = os.path.join(log_dir, log_file_name)
+logging.basicConfig(filename=log_file_path,
+                    level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    filemode='w'
+                    )
+
+if not os.path.exists(db_path):
+    logging.error(f"Raw tables database not found at {db_path}")
+    sys.exit(1)
+
+conn = connect(db_path)
+try:
+    if not args.advise_only:
+        added = add_timestamp_columns(conn)
+        print(f"Added {len(added)} timestamp columns: {', '.join(added) if added else 'none'}")
+        created = create_secondary_indexes(conn)
+        dropped = drop_retired_indexes(conn)
+        conn.execute("ANALYZE")
+        print(f"Created {len(created)} indexes: {', '.join(created) if created else 'none'}")
+        print(f"Dropped {len(dropped)} retired indexes: {', '.join(dropped) if dropped else 'none'}")
+
+    findings = advise(conn)
+    for name, detail in findings:
+        print(f"{name}: {detail}")
+    print(f"{len(findings)} lookups not served by an index, see {log_file_path}")
+finally:
+    conn.close()
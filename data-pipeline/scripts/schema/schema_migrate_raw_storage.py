@@ -0,0 +1,103 @@
+"""
+Raw Tables Storage Migration
+
+This Python script rebuilds raw tables of an existing raw tables database as `WITHOUT ROWID` tables
+(see src_raw_storage), optionally `STRICT`, or back as ordinary rowid tables. By default it rebuilds the
+tables with a composite primary key: OfficerRadioLogTable, TableOfInvolvements and
+LawIncidentOffensesDetail.
+
+With --benchmark the database is not changed. Instead the extracted CSV file of each table is loaded into
+scratch databases holding the table in each layout, and the load time, reload time and database size of
+each layout are reported.
+
+Usage:
+    python3 schema_migrate_raw_storage.py [--tables T1 T2 ...] [--strict] [--rowid] [--vacuum]
+    python3 schema_migrate_raw_storage.py --benchmark [--tables T1 T2 ...] [--strict]
+
+A rebuild copies the whole table under a write lock, so run it outside of the nightly DAG run and after a
+backup. The space freed by a rebuild is only returned to the file system with --vacuum.
+"""
+import argparse
+import logging
+import os
+import sys
+import yaml
+from datetime import datetime
+
+home = os.environ.get('HOME')
+script_name = "schema_migrate_raw_storage"
+
+# Load the YAML configuration file for paths
+with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
+    config = yaml.safe_load(file)
+
+# Set directory paths
+db_path = os.path.join(home, config['databases']['raw_tables'])
+extracted_csv_dir = os.path.join(home, config['paths']['extracted_csv_dir'])
+src_path = os.path.join(home, config['paths']['src_dir'])
+log_dir = os.path.join(home, config['paths']['logs_dir'], "scripts=schema", script_name)
+
+# Include the src directory in the system path for importing modules
+sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
+
+# Import custom modules from the src directory
+from src_sqlite_connection import connect
+from src_raw_storage import COMPOSITE_KEY_TABLES, benchmark_load, get_table_sql, rebuild_table
+from src_load_raw_data_sqlite_db import get_primary_key, get_table_name
+
+# Parse the command line arguments
+parser = argparse.ArgumentParser(description="Rebuild raw tables as WITHOUT ROWID tables, or benchmark the layouts.")
+parser.add_argument("--tables", nargs="+", default=COMPOSITE_KEY_TABLES, help="Tables to rebuild or benchmark.")
+parser.add_argument("--strict", action="store_true", help="Make the tables STRICT as well.")
+parser.add_argument("--rowid", action="store_true", help="Rebuild the tables as ordinary rowid tables instead.")
+parser.add_argument("--vacuum", action="store_true", help="VACUUM the database after the rebuild.")
+parser.add_argument("--benchmark", action="store_true",
+                    help="Compare the load time and size of the layouts instead of rebuilding.")
+args = parser.parse_args()
+
+# Check if the directory exists, if not, create it
+if not os.path.exists(log_dir):
+    os.makedirs(log_dir)
+
+# Set-up Logging
+log_file_name = datetime.now().strftime("%Y%m%dT%H%M%S") + f"__{script_name}.log"
+log_file_path = os.path.join(log_dir, log_file_name)
+logging.basicConfig(filename=log_file_path,
+                    level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    filemode='w'
+                    )
+
+if not os.path.exists(db_path):
+    logging.error(f"Raw tables database not found at {db_path}")
+    sys.exit(1)
+
+conn = connect(db_path, isolation_level=None)
+try:
+    if args.benchmark:
+        layouts = {"rowid": (False, False), "without_rowid": (True, False)}
+        if args.strict:
+            layouts["without_rowid_strict"] = (True, True)
+
+        for table_name in args.tables:
+            files = [file_name for file_name in sorted(os.listdir(extracted_csv_dir))
+                     if get_table_name(file_name) == table_name]
+            sql = get_table_sql(conn, table_name)
+            if not files or sql is None:
+                print(f"{table_name}: no extracted file or table found, skipped")
+                continue
+
+            results = benchmark_load(os.path.join(extracted_csv_dir, files[0]), table_name,
+                                     get_primary_key(files[0]), sql, layouts)
+            for layout, result in results.items():
+                print(f"{table_name} as {layout}: load {result['load_seconds']:.2f} s, "
+                      f"reload {result['reload_seconds']:.2f} s, {result['bytes'] / 1024 / 1024:.1f} MB")
+    else:
+        for table_name in args.tables:
+            rebuilt = rebuild_table(conn, table_name, without_rowid=not args.rowid, strict=args.strict)
+            print(f"{table_name}: {'rebuilt' if rebuilt else 'unchanged'}")
+        if args.vacuum:
+            conn.execute("VACUUM")
+            logging.info("Vacuumed the raw tables database")
+finally:
+    conn.close()
@@ -0,0 +1,83 @@
+"""
+Database Backup Restore
+
+This Python script lists and restores the snapshots of the raw and derived tables databases kept in the
+backup store (see src_backup_store) under `backup_store_dir`.
+
+Usage:
+    python3 schema_restore_database_backup.py {raw,derived} --list
+    python3 schema_restore_database_backup.py {raw,derived} [--snapshot YYYYmmddTHHMMSS] [--target PATH] [--overwrite]
+
+By default the latest snapshot is restored next to the database, as `<database>.restored.db`, so it can be
+inspected before it replaces the database. Restoring over the database itself (--target with the database
+path and --overwrite) must not run while the DAG is running.
+"""
+import argparse
+import logging
+import os
+import sys
+import yaml
+from datetime import datetime
+
+home = os.environ.get('HOME')
+script_name = "schema_restore_database_backup"
+
+# Load the YAML configuration file for paths
+with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
+    config = yaml.safe_load(file)
+
+# Set directory paths
+databases = {
+    "raw": ("HazelCrestRawTables", os.path.join(home, config['databases']['raw_tables'])),
+    "derived": ("HazelCrestDerivedTables", os.path.join(home, config['databases']['derived_tables'])),
+}
+backup_store_dir = os.path.join(home, config['paths']['backup_store_dir'])
+src_path = os.path.join(home, config['paths']['src_dir'])
+log_dir = os.path.join(home, config['paths']['logs_dir'], "scripts=schema", script_name)
+
+# Include the src directory in the system path for importing modules
+sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
+
+# Import custom modules from the src directory
+from src_backup_store import BackupStore
+
+# Parse the command line arguments
+parser = argparse.ArgumentParser(description="List or restore the snapshots of a database in the backup store.")
+parser.add_argument("database", choices=databases, help="The database to list or restore.")
+parser.add_argument("--list", action="store_true", help="List the snapshots instead of restoring one.")
+parser.add_argument("--snapshot", help="The snapshot to restore. Defaults to the latest snapshot.")
+parser.add_argument("--target", help="The file to restore to. Defaults to <database>.restored.db.")
+parser.add_argument("--overwrite", action="store_true", help="Replace an existing file at the target.")
+args = parser.parse_args()
+
+# Check if the directory exists, if not, create it
+if not os.path.exists(log_dir):
+    os.makedirs(log_dir)
+
+# Set-up Logging
+log_file_name = datetime.now().strftime("%Y%m%dT%H%M%S") + f"__{script_name}.log"
+log_file_path = os.path.join(log_dir, log_file_name)
+logging.basicConfig(filename=log_file_path,
+                    level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    filemode='w'
+                    )
+
+db_name, db_path = databases[args.database]
+store = BackupStore(os.path.join(backup_store_dir, args.database))
+
+if args.list:
+    for snapshot in store.snapshots(db_name):
+        manifest = store.manifest(db_name, snapshot)
+        print(f"{snapshot}: {manifest['bytes'] / 1024 / 1024:.1f} MB, "
+              f"{manifest['new_bytes'] / 1024 / 1024:.1f} MB of new chunks stored")
+    sys.exit(0)
+
+target_path = args.target or os.path.splitext(db_path)[0] + ".restored.db"
+try:
+    manifest = store.restore(db_name, target_path, args.snapshot, args.overwrite)
+except Exception as e:
+    logging.error(f"Failed to restore {db_name}: {e}")
+    print(f"Failed to restore {db_name}: {e}")
+    sys.exit(1)
+print(f"Restored snapshot {manifest['snapshot']} of {db_name} to {target_path}")
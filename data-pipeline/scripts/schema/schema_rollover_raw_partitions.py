@@ -0,0 +1,78 @@
+"""
+Raw Tables Partition Rollover
+
+This Python script moves the rows of the raw tables dated in closed years from the hot raw tables database
+into the read-only yearly archive databases under `raw_partitions_dir` (see src_raw_partitions), and
+rewrites `attach_partitions.sql`, through which the transforms read all years.
+
+Usage:
+    python3 schema_rollover_raw_partitions.py [--before-year YEAR] [--vacuum]
+
+By default the rows dated before the current year are moved, so run it once a year, early in January and
+outside of the nightly DAG run, after a backup. The space freed in the hot database is only returned to the
+file system with --vacuum.
+"""
+import argparse
+import logging
+import os
+import sys
+import yaml
+from datetime import datetime
+
+home = os.environ.get('HOME')
+script_name = "schema_rollover_raw_partitions"
+
+# Load the YAML configuration file for paths
+with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
+    config = yaml.safe_load(file)
+
+# Set directory paths
+db_path = os.path.join(home, config['databases']['raw_tables'])
+partitions_dir = os.path.join(home, config['paths']['raw_partitions_dir'])
+src_path = os.path.join(home, config['paths']['src_dir'])
+log_dir = os.path.join(home, config['paths']['logs_dir'], "scripts=schema", script_name)
+
+# Include the src directory in the system path for importing modules
+sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
+
+# Import custom modules from the src directory
+from src_sqlite_connection import connect
+from src_raw_partitions import rollover
+
+# Parse the command line arguments
+parser = argparse.ArgumentParser(description="Move the raw table rows of closed years into the yearly archive databases.")
+parser.add_argument("--before-year", type=int, default=datetime.now().year,
+                    help="Move the rows dated before this year. Defaults to the current year.")
+parser.add_argument("--vacuum", action="store_true", help="VACUUM the hot database after the rollover.")
+args = parser.parse_args()
+
+# Check if the directory exists, if not, create it
+if not os.path.exists(log_dir):
+    os.makedirs(log_dir)
+
+# Set-up Logging
+log_file_name = datetime.now().strftime("%Y%m%dT%H%M%S") + f"__{script_name}.log"
+log_file_path = os.path.join(log_dir, log_file_name)
+logging.basicConfig(filename=log_file_path,
+                    level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    filemode='w'
+                    )
+
+if not os.path.exists(db_path):
+    logging.error(f"Raw tables database not found at {db_path}")
+    sys.exit(1)
+
+moved = rollover(db_path, partitions_dir, args.before_year)
+for partition, tables in moved.items():
+    print(f"{partition}: moved {sum(tables.values())} rows of {len(tables)} tables")
+if not moved:
+    print(f"No rows dated before {args.before_year} to move")
+
+if args.vacuum:
+    conn = connect(db_path, isolation_level=None)
+    try:
+        conn.execute("VACUUM")
+        logging.info("Vacuumed the raw tables database")
+    finally:
+        conn.close()
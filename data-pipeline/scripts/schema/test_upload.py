@@ -1,5 +1,5 @@
-import sqlite3
 import os
+import sys
 import yaml
 
 home = os.environ.get('HOME')
@@ -8,10 +8,16 @@ home = os.environ.get('HOME')
 with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
     config = yaml.safe_load(file)
 
+# Include the src directory in the system path for importing modules
+src_path = os.path.join(home, config['paths']['src_dir'])
+sys.path.append(os.path.join(os.path.dirname(__file__), src_path))
+
+from src_sqlite_connection import connect
+
 DB_PATH = os.path.join(home, config['databases']['raw_tables'])
 
 # Connect to your SQLite database
-conn = sqlite3.connect(DB_PATH)
+conn = connect(DB_PATH)
 cursor = conn.cursor()
 
 # Add a new column named "MainNamesTable" of type TEXT to the "Victim" table
@@ -0,0 +1,182 @@
+"""
+Address Dimension Cache Module
+
+This module removes repeated addresses from the `GeobaseAddressIDMaintenance` rows before they are
+saved. The address table is pulled as a joined child table by the CAD master call, CAD traffic stop
+and law incident extracts, so the same addresses used to be written to three CSV files every night
+and upserted into the raw tables three times, although addresses rarely change.
+
+Every address row is identified by its `IDNumberOfAddress` and a content hash of the row as it is
+written to the CSV file. An address row is only saved if its hash differs from:
+
+- the hash of the same address already saved by another extract of the same run, and
+- the hash of the same address last loaded into the raw tables.
+
+The hashes of loaded addresses are kept in the `AddressDimensionCache` table of the raw tables
+database. They are recorded by the load script after an address file has been loaded, so an address
+is never skipped before it has actually reached the raw tables.
+"""
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+from src_sqlite_connection import connect
+
+ADDRESS_TABLE = "GeobaseAddressIDMaintenance"
+ADDRESS_KEY = "IDNumberOfAddress"
+
+
+def _connect(db_path):
+    """
+    Connects to the raw tables database and creates the address cache table if needed.
+
+    Parameters:
+    db_path (str): Path to the raw tables SQLite database.
+
+    Returns:
+    Connection: The database connection.
+    """
+    connection = connect(db_path, timeout=60)
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS AddressDimensionCache (
+            "IDNumberOfAddress" TEXT PRIMARY KEY,
+            "RowHash" TEXT,
+            "WhenModified" TEXT)""")
+    return connection
+
+
+def _row_hash(header, row):
+    """
+    Computes the content hash of one row. The hash does not depend on the order of the columns.
+    """
+    content = json.dumps(dict(zip(header, row)), sort_keys=True)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def row_hashes(header, rows):
+    """
+    Computes the content hash of address rows read from a CSV file.
+
+    Parameters:
+    header (list): The column names of the CSV file.
+    rows (iterable): The rows of the CSV file, as lists of strings.
+
+    Returns:
+    dict: A dictionary mapping the IDNumberOfAddress of each row to its hash.
+    """
+    key_index = header.index(ADDRESS_KEY)
+    return {row[key_index]: _row_hash(header, row) for row in rows}
+
+
+class AddressCache:
+    """
+    Filters out address rows that were already saved in this run or already loaded in a previous one.
+
+    One cache is shared by all extracts running in the same process.
+
+    Parameters:
+    db_path (str): Path to the raw tables SQLite database.
+    """
+
+    def __init__(self, db_path):
+        connection = _connect(db_path)
+        try:
+            self.loaded = dict(connection.execute(
+                'SELECT "IDNumberOfAddress", "RowHash" FROM AddressDimensionCache').fetchall())
+            connection.commit()
+        finally:
+            connection.close()
+        self.saved = {}
+        self.lock = threading.Lock()
+        logging.info(f"Opened address cache with {len(self.loaded)} loaded addresses")
+
+    def filter_new(self, data_frame):
+        """
+        Returns the address rows that are new or changed, and marks them as saved for this run.
+
+        Parameters:
+        data_frame (DataFrame): The GeobaseAddressIDMaintenance rows of an extract.
+
+        Returns:
+        DataFrame: The rows that still need to be saved.
+        """
+        if ADDRESS_KEY not in data_frame.columns:
+            logging.warning(f"Column {ADDRESS_KEY} not found, address rows are not deduplicated.")
+            return data_frame
+
+        # Hash the rows exactly as they will be written to, and read back from, the CSV file
+        reader = csv.reader(io.StringIO(data_frame.to_csv(index=False)))
+        header = next(reader)
+        key_index = header.index(ADDRESS_KEY)
+        rows = list(reader)
+
+        keep = []
+        with self.lock:
+            for position, row in enumerate(rows):
+                digest = _row_hash(header, row)
+                if digest in (self.saved.get(row[key_index]), self.loaded.get(row[key_index])):
+                    continue
+                self.saved[row[key_index]] = digest
+                keep.append(position)
+
+        logging.info(f"Address cache kept {len(keep)} of {len(rows)} address rows as new or changed")
+        return data_frame.iloc[keep]
+
+
+def get_address_cache(db_path):
+    """
+    Opens the address cache kept in the raw tables database.
+
+    Parameters:
+    db_path (str): Path to the raw tables SQLite database.
+
+    Returns:
+    AddressCache: The opened cache, or None if the database does not exist or the cache could not be opened.
+    """
+    if not os.path.exists(db_path):
+        logging.warning(f"Raw tables database not found at {db_path}, address rows are not deduplicated.")
+        return None
+
+    try:
+        return AddressCache(db_path)
+    except Exception as e:
+        logging.error(f"Error opening address cache, address rows are not deduplicated: {e}")
+        return None
+
+
+def record_loaded_addresses(db_path, file_name):
+    """
+    Records the hashes of the address rows of a CSV file once the file has been loaded.
+
+    Parameters:
+    db_path (str): Path to the raw tables SQLite database.
+    file_name (str): Path to the loaded GeobaseAddressIDMaintenance CSV file.
+
+    Returns:
+    int: The number of address hashes recorded.
+    """
+    with open(file_name, 'r', newline='') as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        hashes = row_hashes(header, reader)
+
+    connection = _connect(db_path)
+    try:
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        connection.executemany("""
+            INSERT INTO AddressDimensionCache ("IDNumberOfAddress", "RowHash", "WhenModified")
+            VALUES (?, ?, ?)
+            ON CONFLICT ("IDNumberOfAddress")
+            DO UPDATE SET "RowHash" = excluded."RowHash", "WhenModified" = excluded."WhenModified"
+            """, [(key, digest, now) for key, digest in hashes.items()])
+        connection.commit()
+    finally:
+        connection.close()
+
+    logging.info(f"Recorded {len(hashes)} loaded addresses from {file_name}")
+    return len(hashes)
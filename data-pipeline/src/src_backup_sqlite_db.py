@@ -9,14 +9,85 @@ The module contains a function `backup_sqlite_db` which takes a path to an SQLit
 database file, a backup directory, and a database name as inputs. It optionally
 accepts a timestamp format. This function creates a timestamped backup of the
 specified database in the given directory.
+
+Backups are taken with the SQLite online backup API rather than by copying the file. The
+copy is a consistent snapshot of the database, including the changes still in its
+write-ahead log, even while other connections write to it. Pages are copied in steps with
+a short sleep between them, so writers are not locked out for the whole copy and the raw
+and derived backups, which run in parallel, do not saturate the disk. Databases in WAL
+mode are copied from a pinned snapshot, so writers are never blocked at all.
 """
 import logging
 import os
-import shutil
+import time
 from datetime import datetime
 
+from src_sqlite_connection import connect
+
+# Pages copied per step of the online backup, and seconds slept between steps
+DEFAULT_PAGES_PER_STEP = 1024
+DEFAULT_SLEEP_SECONDS = 0.05
+
+
+def online_backup(db_path, backup_path, pages_per_step=DEFAULT_PAGES_PER_STEP,
+                  sleep_seconds=DEFAULT_SLEEP_SECONDS, integrity_check=False):
+    """
+    Copies an SQLite database to a new file with the online backup API.
+
+    The copy is written to a temporary file next to the backup and renamed once complete, so an interrupted
+    backup never leaves a truncated file behind. The backup is switched out of WAL mode so it is a single
+    self-contained file.
+
+    Parameters:
+    db_path (str): The path to the SQLite database file.
+    backup_path (str): The path of the backup file to create.
+    pages_per_step (int, optional): Pages copied per step. Defaults to DEFAULT_PAGES_PER_STEP.
+    sleep_seconds (float, optional): Seconds slept between steps. Defaults to DEFAULT_SLEEP_SECONDS.
+    integrity_check (bool, optional): Run `PRAGMA integrity_check` on the backup. Default is False.
+
+    Returns:
+    dict: The 'pages', 'bytes' and 'seconds' of the backup, and the 'integrity_check' result if run ("ok" or
+          the first 10 problems found).
+    """
+    partial_path = backup_path + ".partial"
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+
+    started = time.perf_counter()
+    source = connect(db_path)
+    target = connect(partial_path)
+    try:
+        # A write by another connection restarts the backup from the first page. In WAL mode, a read
+        # transaction held on the source pins a snapshot, so writers proceed and the backup completes.
+        if source.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal":
+            source.execute("BEGIN")
+            source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=pages_per_step, sleep=sleep_seconds)
+        target.execute("PRAGMA journal_mode=DELETE")
+        stats = {'pages': target.execute("PRAGMA page_count").fetchone()[0]}
 
-def backup_sqlite_db(db_path, backup_dir, db_name, timestamp_format="%Y%m%d%H%M%S"):
+        # Not quick_check: older SQLite versions (3.40 among them) report NULL values in the primary keys of
+        # WITHOUT ROWID tables with generated columns, as the raw tables have, that integrity_check finds fine
+        if integrity_check:
+            problems = [row[0] for row in target.execute("PRAGMA integrity_check(10)")]
+            stats['integrity_check'] = "; ".join(problems)
+    except Exception:
+        target.close()
+        os.remove(partial_path)
+        raise
+    finally:
+        source.close()
+    target.close()
+
+    os.replace(partial_path, backup_path)
+    stats['bytes'] = os.path.getsize(backup_path)
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def backup_sqlite_db(db_path, backup_dir, db_name, timestamp_format="%Y%m%d%H%M%S",
+                     pages_per_step=DEFAULT_PAGES_PER_STEP, sleep_seconds=DEFAULT_SLEEP_SECONDS,
+                     integrity_check=False):
     """
     Backs up an SQLite database to a specified directory with a timestamp and keeps only the latest 2 backups.
 
@@ -29,6 +100,9 @@ def backup_sqlite_db(db_path, backup_dir, db_name, timestamp_format="%Y%m%d%H%M%
     backup_dir (str): The directory where the backup should be stored.
     db_name (str): Name of the database.
     timestamp_format (str, optional): The format for the timestamp. Defaults to '%Y%m%d%H%M%S'.
+    pages_per_step (int, optional): Pages copied per step of the online backup. Defaults to 1024.
+    sleep_seconds (float, optional): Seconds slept between steps of the online backup. Defaults to 0.05.
+    integrity_check (bool, optional): Run `PRAGMA integrity_check` on the backup. Default is False.
 
     Returns:
     str: The path to the backed up database file, or None if an error occurred.
@@ -49,11 +123,18 @@ def backup_sqlite_db(db_path, backup_dir, db_name, timestamp_format="%Y%m%d%H%M%
         backup_path = os.path.join(backup_dir, f"backup_{db_name}_{timestamp}.db")
 
         # Perform the backup
-        shutil.copyfile(db_path, backup_path)
-        logging.info(f"Database backed up to {backup_path}")
+        stats = online_backup(db_path, backup_path, pages_per_step, sleep_seconds, integrity_check)
+        logging.info(f"Database backed up to {backup_path}: {stats['pages']} pages, {stats['bytes']} bytes "
+                     f"in {stats['seconds']} seconds")
+
+        # A backup failing the check is kept, as it is an exact copy of the database: the problems are in the
+        # database itself
+        if stats.get('integrity_check', "ok") != "ok":
+            logging.error(f"Integrity check of the backup {backup_path} found problems: "
+                          f"{stats['integrity_check']}")
 
         # Cleanup: Keep only the latest 2 backup files
-        backups = sorted([f for f in os.listdir(backup_dir) if f.startswith(f"backup_{db_name}")],
+        backups = sorted([f for f in os.listdir(backup_dir) if f.startswith(f"backup_{db_name}_") and f.endswith(".db")],
                          key=lambda x: os.path.getmtime(os.path.join(backup_dir, x)))
 
         # Delete all but the latest 2 backups
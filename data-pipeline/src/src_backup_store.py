@@ -0,0 +1,357 @@
+"""
+Backup Store Module
+
+This module keeps deduplicated, compressed backups of the pipeline databases, so months of nightly
+snapshots can be restored for about the space of the two full copies `backup_sqlite_db` keeps.
+
+A snapshot is taken with the online backup API (see src_backup_sqlite_db) and split into chunks of
+consecutive database pages. Each chunk is stored gzip-compressed and content-addressed under the SHA-256
+digest of its bytes, so the pages that did not change since the last snapshot take no space and no
+write. A snapshot itself is a small JSON manifest listing the digests of its chunks in order:
+
+    store_dir/
+        chunks/<first two hex digits>/<sha256>.gz
+        manifests/<db_name>/<YYYYmmddTHHMMSS>.json
+
+Snapshots are pruned with a daily/weekly/monthly retention policy: the newest snapshot of each of the
+last `keep_daily` days, `keep_weekly` ISO weeks and `keep_monthly` months is kept. Chunks no longer
+listed by any manifest are then deleted.
+
+Every database should have its own store directory: pruning deletes the chunks not listed by the
+manifests of the store, and must not run while a snapshot of another database is being written.
+
+Note:
+    The snapshots hold the same data as the databases and are created readable by their owner only.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+from src_backup_sqlite_db import DEFAULT_PAGES_PER_STEP, DEFAULT_SLEEP_SECONDS, online_backup
+
+# Format of the snapshot timestamps, used as manifest file names
+SNAPSHOT_FORMAT = "%Y%m%dT%H%M%S"
+
+# Database pages per chunk
+DEFAULT_CHUNK_PAGES = 16
+
+
+def get_page_size(db_path):
+    """
+    Reads the page size of an SQLite database from its header.
+
+    Parameters:
+    db_path (str): The path to the SQLite database file.
+
+    Returns:
+    int: The page size in bytes.
+    """
+    with open(db_path, 'rb') as file:
+        header = file.read(18)
+    page_size = int.from_bytes(header[16:18], "big")
+    # A page size of 65536 is stored as 1
+    return 65536 if page_size == 1 else page_size
+
+
+class BackupStore:
+    """
+    A content-addressed store of compressed database chunks, with a manifest per snapshot.
+
+    Parameters:
+    store_dir (str): Directory holding the store.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.chunks_dir = os.path.join(store_dir, "chunks")
+        self.manifests_dir = os.path.join(store_dir, "manifests")
+
+        if not os.path.exists(self.chunks_dir):
+            # Readable by the owner only, as the chunks hold the data of the databases
+            os.makedirs(self.chunks_dir, mode=0o700)
+            logging.info(f"Created backup store directory: {store_dir}")
+        os.makedirs(self.manifests_dir, mode=0o700, exist_ok=True)
+
+    def _chunk_path(self, digest):
+        """
+        Returns the path of the compressed chunk with the given digest.
+        """
+        return os.path.join(self.chunks_dir, digest[:2], f"{digest}.gz")
+
+    def _manifest_path(self, db_name, snapshot):
+        """
+        Returns the path of the manifest of a snapshot.
+        """
+        return os.path.join(self.manifests_dir, db_name, f"{snapshot}.json")
+
+    def _write_chunk(self, data):
+        """
+        Stores a chunk unless a chunk with the same digest is stored already.
+
+        Returns:
+        tuple: The digest of the chunk and the number of compressed bytes written, 0 if it was stored already.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        chunk_path = self._chunk_path(digest)
+        if os.path.exists(chunk_path):
+            return digest, 0
+
+        os.makedirs(os.path.dirname(chunk_path), mode=0o700, exist_ok=True)
+        compressed = gzip.compress(data, compresslevel=6, mtime=0)
+        # Write to a temporary file first so a crash never leaves a truncated chunk behind
+        temporary_path = f"{chunk_path}.{os.getpid()}.tmp"
+        with open(os.open(temporary_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600), 'wb') as file:
+            file.write(compressed)
+        os.replace(temporary_path, chunk_path)
+        return digest, len(compressed)
+
+    def backup(self, db_path, db_name, chunk_pages=DEFAULT_CHUNK_PAGES, pages_per_step=DEFAULT_PAGES_PER_STEP,
+               sleep_seconds=DEFAULT_SLEEP_SECONDS, integrity_check=False):
+        """
+        Takes a snapshot of a database and stores its new chunks.
+
+        Parameters:
+        db_path (str): The path to the SQLite database file.
+        db_name (str): Name of the database.
+        chunk_pages (int, optional): Database pages per chunk. Defaults to DEFAULT_CHUNK_PAGES.
+        pages_per_step (int, optional): Pages copied per step of the online backup. Defaults to 1024.
+        sleep_seconds (float, optional): Seconds slept between steps of the online backup. Defaults to 0.05.
+        integrity_check (bool, optional): Run `PRAGMA integrity_check` on the snapshot. Default is False.
+
+        Returns:
+        dict: The manifest of the snapshot.
+        """
+        started = time.perf_counter()
+        snapshot = datetime.now().strftime(SNAPSHOT_FORMAT)
+        manifest_path = self._manifest_path(db_name, snapshot)
+        os.makedirs(os.path.dirname(manifest_path), mode=0o700, exist_ok=True)
+
+        # Chunk a consistent copy of the database, not the live file
+        copy_path = os.path.join(self.store_dir, f"{db_name}.{os.getpid()}.snapshot")
+        try:
+            stats = online_backup(db_path, copy_path, pages_per_step, sleep_seconds, integrity_check)
+            page_size = get_page_size(copy_path)
+            chunk_size = page_size * chunk_pages
+
+            digest = hashlib.sha256()
+            chunks = []
+            new_chunks = 0
+            new_bytes = 0
+            with open(copy_path, 'rb') as file:
+                while True:
+                    data = file.read(chunk_size)
+                    if not data:
+                        break
+                    digest.update(data)
+                    chunk_digest, written = self._write_chunk(data)
+                    chunks.append(chunk_digest)
+                    new_chunks += written > 0
+                    new_bytes += written
+        finally:
+            if os.path.exists(copy_path):
+                os.remove(copy_path)
+
+        manifest = {
+            'db_name': db_name,
+            'snapshot': snapshot,
+            'source': db_path,
+            'page_size': page_size,
+            'chunk_size': chunk_size,
+            'bytes': stats['bytes'],
+            'sha256': digest.hexdigest(),
+            'new_chunks': new_chunks,
+            'new_bytes': new_bytes,
+            'seconds': round(time.perf_counter() - started, 3),
+            'chunks': chunks,
+        }
+        if 'integrity_check' in stats:
+            manifest['integrity_check'] = stats['integrity_check']
+
+        temporary_path = f"{manifest_path}.tmp"
+        with open(os.open(temporary_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600), 'w') as file:
+            json.dump(manifest, file)
+        os.replace(temporary_path, manifest_path)
+
+        logging.info(f"Stored snapshot {snapshot} of {db_name}: {stats['bytes']} bytes in {len(chunks)} chunks, "
+                     f"{new_chunks} new chunks taking {new_bytes} bytes, in {manifest['seconds']} seconds")
+        return manifest
+
+    def snapshots(self, db_name):
+        """
+        Lists the snapshots of a database, oldest first.
+
+        Parameters:
+        db_name (str): Name of the database.
+
+        Returns:
+        list: The snapshot timestamps, formatted as SNAPSHOT_FORMAT.
+        """
+        manifests_dir = os.path.join(self.manifests_dir, db_name)
+        if not os.path.isdir(manifests_dir):
+            return []
+        return sorted(file_name[:-len(".json")] for file_name in os.listdir(manifests_dir)
+                      if file_name.endswith(".json"))
+
+    def manifest(self, db_name, snapshot):
+        """
+        Reads the manifest of a snapshot.
+
+        Parameters:
+        db_name (str): Name of the database.
+        snapshot (str): The snapshot timestamp.
+
+        Returns:
+        dict: The manifest.
+        """
+        with open(self._manifest_path(db_name, snapshot), 'r') as file:
+            return json.load(file)
+
+    def restore(self, db_name, target_path, snapshot=None, overwrite=False):
+        """
+        Restores a snapshot of a database to a file. Every chunk and the whole file are verified against
+        their digests.
+
+        Parameters:
+        db_name (str): Name of the database.
+        target_path (str): The path of the database file to write.
+        snapshot (str, optional): The snapshot timestamp. Defaults to the latest snapshot.
+        overwrite (bool, optional): Replace an existing file at target_path. Default is False.
+
+        Returns:
+        dict: The manifest of the restored snapshot.
+        """
+        if snapshot is None:
+            snapshots = self.snapshots(db_name)
+            if not snapshots:
+                raise FileNotFoundError(f"No snapshot of {db_name} in {self.store_dir}")
+            snapshot = snapshots[-1]
+        if os.path.exists(target_path) and not overwrite:
+            raise FileExistsError(f"{target_path} exists, not overwritten")
+
+        manifest = self.manifest(db_name, snapshot)
+        partial_path = f"{target_path}.partial"
+        digest = hashlib.sha256()
+        try:
+            with open(partial_path, 'wb') as file:
+                for chunk_digest in manifest['chunks']:
+                    with open(self._chunk_path(chunk_digest), 'rb') as chunk_file:
+                        data = gzip.decompress(chunk_file.read())
+                    if hashlib.sha256(data).hexdigest() != chunk_digest:
+                        raise ValueError(f"Chunk {chunk_digest} of snapshot {snapshot} is corrupt")
+                    digest.update(data)
+                    file.write(data)
+            if digest.hexdigest() != manifest['sha256']:
+                raise ValueError(f"Restored snapshot {snapshot} does not match its digest")
+        except Exception:
+            os.remove(partial_path)
+            raise
+
+        # Remove the journal files of the database being replaced, they do not belong to the snapshot
+        for suffix in ("-wal", "-shm", "-journal"):
+            if os.path.exists(target_path + suffix):
+                os.remove(target_path + suffix)
+        os.replace(partial_path, target_path)
+        logging.info(f"Restored snapshot {snapshot} of {db_name} to {target_path}")
+        return manifest
+
+    def prune(self, db_name, keep_daily=7, keep_weekly=4, keep_monthly=12):
+        """
+        Deletes the snapshots of a database outside of the retention policy, then the chunks no snapshot
+        lists anymore. The newest snapshot is always kept.
+
+        Parameters:
+        db_name (str): Name of the database.
+        keep_daily (int, optional): Number of days to keep the newest snapshot of. Default is 7.
+        keep_weekly (int, optional): Number of ISO weeks to keep the newest snapshot of. Default is 4.
+        keep_monthly (int, optional): Number of months to keep the newest snapshot of. Default is 12.
+
+        Returns:
+        list: The snapshots deleted.
+        """
+        snapshots = self.snapshots(db_name)
+        periods = [(keep_daily, "%Y-%m-%d"), (keep_weekly, "%G-W%V"), (keep_monthly, "%Y-%m")]
+
+        keep = set(snapshots[-1:])
+        for count, period_format in periods:
+            seen = []
+            for snapshot in reversed(snapshots):
+                period = datetime.strptime(snapshot, SNAPSHOT_FORMAT).strftime(period_format)
+                if period in seen:
+                    continue
+                if len(seen) == count:
+                    break
+                seen.append(period)
+                keep.add(snapshot)
+
+        deleted = [snapshot for snapshot in snapshots if snapshot not in keep]
+        for snapshot in deleted:
+            os.remove(self._manifest_path(db_name, snapshot))
+            logging.info(f"Deleted snapshot {snapshot} of {db_name}")
+
+        if deleted:
+            self.collect_garbage()
+        return deleted
+
+    def collect_garbage(self):
+        """
+        Deletes the chunks not listed by the manifest of any snapshot in the store.
+
+        Returns:
+        int: The number of chunks deleted.
+        """
+        referenced = set()
+        for db_name in os.listdir(self.manifests_dir):
+            for snapshot in self.snapshots(db_name):
+                referenced.update(self.manifest(db_name, snapshot)['chunks'])
+
+        deleted = 0
+        for prefix in os.listdir(self.chunks_dir):
+            for file_name in os.listdir(os.path.join(self.chunks_dir, prefix)):
+                if file_name.endswith(".gz") and file_name[:-len(".gz")] not in referenced:
+                    os.remove(os.path.join(self.chunks_dir, prefix, file_name))
+                    deleted += 1
+        logging.info(f"Deleted {deleted} chunks no longer listed by a snapshot")
+        return deleted
+
+
+def backup_sqlite_db_to_store(db_path, store_dir, db_name, chunk_pages=DEFAULT_CHUNK_PAGES,
+                              pages_per_step=DEFAULT_PAGES_PER_STEP, sleep_seconds=DEFAULT_SLEEP_SECONDS,
+                              integrity_check=False, keep_daily=7, keep_weekly=4, keep_monthly=12):
+    """
+    Backs up an SQLite database into a backup store and prunes its snapshots with the retention policy.
+
+    Parameters:
+    db_path (str): The path to the SQLite database file.
+    store_dir (str): Directory holding the backup store of the database.
+    db_name (str): Name of the database.
+    chunk_pages (int, optional): Database pages per chunk. Defaults to DEFAULT_CHUNK_PAGES.
+    pages_per_step (int, optional): Pages copied per step of the online backup. Defaults to 1024.
+    sleep_seconds (float, optional): Seconds slept between steps of the online backup. Defaults to 0.05.
+    integrity_check (bool, optional): Run `PRAGMA integrity_check` on the snapshot. Default is False.
+    keep_daily (int, optional): Number of days to keep the newest snapshot of. Default is 7.
+    keep_weekly (int, optional): Number of ISO weeks to keep the newest snapshot of. Default is 4.
+    keep_monthly (int, optional): Number of months to keep the newest snapshot of. Default is 12.
+
+    Returns:
+    str: The timestamp of the snapshot, or None if an error occurred.
+    """
+    try:
+        if not os.path.isfile(db_path):
+            logging.error(f"The specified database at {db_path} does not exist.")
+            return None
+
+        store = BackupStore(store_dir)
+        manifest = store.backup(db_path, db_name, chunk_pages, pages_per_step, sleep_seconds, integrity_check)
+        if manifest.get('integrity_check', "ok") != "ok":
+            logging.error(f"Integrity check of snapshot {manifest['snapshot']} found problems: "
+                          f"{manifest['integrity_check']}")
+
+        store.prune(db_name, keep_daily, keep_weekly, keep_monthly)
+        return manifest['snapshot']
+    except Exception as e:
+        logging.error(f"Failed to backup database: {e}")
+        return None
@@ -21,6 +21,10 @@ def create_config_yaml(base_directory):
           report_scripts_dir: "/scripts/report"
           transform_scripts_dir: "/scripts/transform"
           backup_db_dir: "/home/ripl/backup_SQLiteDatabaseFiles"
+          backup_store_dir: "/home/ripl/backup_SQLiteDatabaseFiles/store"
+          backfill_state_dir: "/data/backfill"
+          loaded_csv_archive_dir: "/data/raw/loaded"
+          raw_partitions_dir: "/data/raw/database/partitions"
         
         databases:
           raw_tables: "/data/raw/database/HazelCrestRawTables.db"
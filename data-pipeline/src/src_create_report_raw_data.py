@@ -10,13 +10,58 @@ The module is structured to first read configuration paths for logs and reports
 directories from a YAML file. It then configures a logger to write logs to a
 specified directory with a timestamped file name. Two primary functions are
 defined: `save_report_to_file` and `validate_table`.
+
+The statistics of every extracted file (its row count and the missing values of each
+column) are profiles, computed without holding the file in memory:
+
+- Inline during the extraction: `save_file_profile` (see src_file_profiles) profiles each
+  hashed DataFrame as it is written and saves the profile next to the reports, keyed by
+  the CSV file name and stamped with the size and modification time of the file.
+- Streaming: `profile_csv` reads a file in chunks of `chunk_size` rows, all as text, so
+  no types are inferred.
+
+`create_run_report` uses the inline profile of a file if it still matches the file, and
+streams the file otherwise, then saves a single report for the whole run.
+
+Given the raw tables database, the run report also appends its metrics (the rows per day
+of the extract window of every file, and the null rate of every column) to the
+`ValidationHistory` table, and compares each metric with its rolling baseline: the mean and
+standard deviation of the metric over the last `baseline_runs` runs that were not flagged.
+A metric further than `threshold` standard deviations from its baseline is flagged as an
+anomaly, so a truncated extract is caught before it is loaded. The row count is divided by
+the length of the extract window saved with the profile of the file, so an extract catching
+up on missed nights is not flagged for its volume; files without a saved window count as one
+day, the nightly window. Files of backfills (prefixed with the start of their window) are not
+recorded, as their volumes are not comparable with the nightly files.
+
+A metric flagged on the last `accept_after` runs in a row has changed level rather than
+had a bad run: those runs are accepted (their Anomaly is set to 2) and enter the baseline,
+so the baseline catches up with the new level instead of flagging every run after it.
+
+A file of the history that had rows in the last `baseline_runs` runs but is missing from this
+run, e.g. because its extract failed to write it, is recorded with 0 rows and checked like the
+others. The address files are the exception: an extract removes its address file when every
+address is already known (see src_address_cache).
+
+Profiles also hold the sketches of every column (see src_profile_sketches): an estimate of
+its distinct values, its most frequent values and the range of its timestamps. They are
+serialized with the run report, and `merge_run_reports` merges the reports of several runs
+into a weekly or monthly profile of each file without reading the files again.
 """
 import logging
 import json
+import re
+import statistics
 import yaml
 import os
+import pandas as pd
 from datetime import datetime
 
+from src_address_cache import ADDRESS_TABLE
+from src_file_profiles import load_file_profile, merge_profiles, profile_dataframe
+from src_profile_sketches import ColumnSketch, merge_sketches, sketch_dataframe
+from src_sqlite_connection import connect
+
 home = os.environ.get('HOME')
 
 # Load the YAML configuration file for paths
@@ -26,6 +71,20 @@ with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
 # Extracting specific paths from the configuration file for logs and reports directories
 reports_dir = os.path.join(home, config['paths']['reports_dir'])
 
+# Rows read at a time when profiling a file
+DEFAULT_CHUNK_SIZE = 100000
+
+# Most frequent values of each column listed in the reports
+DEFAULT_TOP_VALUES = 10
+
+# Smallest spread of a baseline, as an absolute value per metric and relative to the mean, so metrics that
+# barely vary (like a null rate of 0) are not flagged for any small change
+MIN_BASELINE_SPREAD = {'rows_per_day': 1.0, 'null_rate': 0.01}
+MIN_RELATIVE_SPREAD = 0.05
+
+# Prefix of the files of backfills and replays, see src_extract_backfill
+WINDOW_PREFIX = re.compile(r"^\d{8}T\d{6}_")
+
 def save_report_to_file(report, directory=os.path.join(reports_dir, "script=validate_tables"), filename="raw_data_validation.json"):
     """
     Saves a given report as a JSON file in a specified directory with a timestamped filename.
@@ -85,4 +144,277 @@ def validate_table(dataframe, csv):
     validation_report['missing_values'] = missing_values_dict
 
     logging.info("Utalizing save_report_to_file function")
-    save_report_to_file(report=validation_report)
\ No newline at end of file
+    save_report_to_file(report=validation_report)
+
+
+def summarize_sketches(sketches, top_values=DEFAULT_TOP_VALUES):
+    """
+    Summarizes the serialized sketches of a profile, see `ColumnSketch.summary`.
+
+    Args:
+    sketches (dict): The serialized sketch of each column.
+    top_values (int, optional): Most frequent values listed per column. Defaults to DEFAULT_TOP_VALUES.
+
+    Returns:
+    dict: The 'distinct' estimate, 'top_values', 'min_timestamp' and 'max_timestamp' of each column.
+    """
+    return {column: ColumnSketch.from_dict(data).summary(top_values) for column, data in sketches.items()}
+
+
+def profile_csv(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Computes the profile of a CSV file, reading it in chunks so memory use does not grow with the file.
+
+    Args:
+    file_path (str): The path of the CSV file.
+    chunk_size (int, optional): Rows read at a time. Defaults to DEFAULT_CHUNK_SIZE.
+
+    Returns:
+    dict: The profile of the file.
+    """
+    # Read every value as text, as written by the extraction, so values hash the same in both profiles
+    header = pd.read_csv(file_path, nrows=0).columns
+    profile = {'total_rows': 0, 'missing_values': {column: 0 for column in header}}
+    sketches = {}
+    for chunk in pd.read_csv(file_path, dtype=str, chunksize=chunk_size):
+        # The sketches are kept deserialized between chunks
+        profile = merge_profiles(profile, profile_dataframe(chunk, sketches=False))
+        merge_sketches(sketches, sketch_dataframe(chunk))
+    profile['sketches'] = {column: sketch.to_dict() for column, sketch in sketches.items()}
+    return profile
+
+
+def create_validation_tables(cursor):
+    """
+    Creates the table of the validation history, if it does not exist yet.
+
+    Args:
+    cursor (Cursor): Cursor of a connection to the raw tables database.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ValidationHistory (
+            "FileName" TEXT,
+            "ColumnName" TEXT,
+            "Metric" TEXT,
+            "RunID" TEXT,
+            "Value" REAL,
+            "Baseline" REAL,
+            "Deviation" REAL,
+            "Anomaly" INTEGER,
+            "WhenRecorded" TEXT,
+            PRIMARY KEY ("FileName", "ColumnName", "Metric", "RunID"))""")
+
+
+def report_metrics(table_report):
+    """
+    Lists the metrics of a file in the run report: its rows per day of the extract window and the null rate of
+    every column.
+
+    Args:
+    table_report (dict): The entry of the file in the run report.
+
+    Returns:
+    list: The (column name, metric, value) of each metric, with an empty column name for the rows per day.
+    """
+    total_rows = table_report['total_rows']
+    # Files profiled from disk have no saved window, they count as the nightly window of one day
+    window_days = table_report.get('window_days') or 1.0
+    metrics = [("", 'rows_per_day', total_rows / window_days)]
+    if total_rows:
+        metrics.extend((column, 'null_rate', count / total_rows)
+                       for column, count in table_report['missing_values'].items())
+    return metrics
+
+
+def check_history(connection, run_report, run_id, baseline_runs=14, min_history=5, threshold=3.0, accept_after=3):
+    """
+    Records the metrics of a run in the validation history and flags the ones that deviate from their baseline.
+
+    Files of the history that had rows in the last `baseline_runs` runs but are missing from the run are
+    recorded with 0 rows, except the address files.
+
+    Args:
+    connection (Connection): A connection to the raw tables database.
+    run_report (dict): The run report, see `create_run_report`.
+    run_id (str): The identifier of the run, sortable by time.
+    baseline_runs (int, optional): Number of earlier runs the baseline is computed over. Default is 14.
+    min_history (int, optional): Number of earlier runs needed before a metric is checked. Default is 5.
+    threshold (float, optional): Deviation from the baseline, in standard deviations, flagged as an anomaly.
+                                 Default is 3.0.
+    accept_after (int, optional): Number of runs in a row a metric is flagged on before its new level is
+                                  accepted into the baseline, or 0 to never accept it. Default is 3.
+
+    Returns:
+    list: The anomalies, with the 'table_name', 'column', 'metric', 'value', 'baseline' and 'deviation'.
+    """
+    cursor = connection.cursor()
+    create_validation_tables(cursor)
+    when_recorded = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+
+    file_metrics = {table_report['table_name']: report_metrics(table_report) for table_report in run_report['tables']
+                    if not WINDOW_PREFIX.match(table_report['table_name'])}
+
+    # A file missing from the run has no rows, so a truncated run is caught even if a file was not written
+    for (file_name,) in cursor.execute("""
+            SELECT DISTINCT "FileName" FROM ValidationHistory
+            WHERE "ColumnName" = '' AND "Metric" = 'rows_per_day' AND "Value" > 0 AND "RunID" >= (
+                SELECT MIN("RunID") FROM (
+                    SELECT DISTINCT "RunID" FROM ValidationHistory
+                    WHERE "RunID" < ? ORDER BY "RunID" DESC LIMIT ?))""", (run_id, baseline_runs)).fetchall():
+        if file_name not in file_metrics and ADDRESS_TABLE not in file_name:
+            logging.warning(f"{file_name} is missing from run {run_id}, recording 0 rows")
+            file_metrics[file_name] = [("", 'rows_per_day', 0)]
+
+    anomalies = []
+    rows = []
+    for file_name, metrics in file_metrics.items():
+        for column, metric, value in metrics:
+            key = (file_name, column, metric)
+            if accept_after:
+                # Flagged on the last runs in a row: the metric changed level, accept the flagged runs
+                recent = cursor.execute("""
+                    SELECT "RunID", "Anomaly" FROM ValidationHistory
+                    WHERE "FileName" = ? AND "ColumnName" = ? AND "Metric" = ? AND "RunID" < ?
+                    ORDER BY "RunID" DESC LIMIT ?""", (*key, run_id, accept_after)).fetchall()
+                if len(recent) == accept_after and all(anomaly == 1 for _, anomaly in recent):
+                    logging.warning(f"{file_name}{'.' + column if column else ''}: {metric} was flagged on the last "
+                                    f"{accept_after} runs, accepting it as its new level")
+                    cursor.executemany("""
+                        UPDATE ValidationHistory SET "Anomaly" = 2
+                        WHERE "FileName" = ? AND "ColumnName" = ? AND "Metric" = ? AND "RunID" = ?""",
+                                       [(*key, recent_run_id) for recent_run_id, _ in recent])
+
+            # Flagged runs are left out of the baseline, so one bad run does not hide the next
+            history = [row[0] for row in cursor.execute("""
+                SELECT "Value" FROM ValidationHistory
+                WHERE "FileName" = ? AND "ColumnName" = ? AND "Metric" = ? AND "RunID" < ? AND "Anomaly" != 1
+                ORDER BY "RunID" DESC LIMIT ?""", (*key, run_id, baseline_runs))]
+
+            baseline = deviation = None
+            anomaly = 0
+            if len(history) >= min_history:
+                baseline = statistics.fmean(history)
+                spread = max(statistics.pstdev(history), MIN_BASELINE_SPREAD[metric],
+                             MIN_RELATIVE_SPREAD * abs(baseline))
+                deviation = (value - baseline) / spread
+                if abs(deviation) > threshold:
+                    anomaly = 1
+                    anomalies.append({'table_name': file_name, 'column': column, 'metric': metric, 'value': value,
+                                      'baseline': round(baseline, 4), 'deviation': round(deviation, 2)})
+                    logging.warning(f"Anomaly in {file_name}{'.' + column if column else ''}: {metric} {value:.4g} "
+                                    f"against a baseline of {baseline:.4g} ({deviation:+.1f} standard deviations)")
+            rows.append((file_name, column, metric, run_id, value, baseline, deviation, anomaly, when_recorded))
+
+    cursor.executemany("""
+        INSERT OR REPLACE INTO ValidationHistory
+            ("FileName", "ColumnName", "Metric", "RunID", "Value", "Baseline", "Deviation", "Anomaly", "WhenRecorded")
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+    connection.commit()
+    logging.info(f"Recorded {len(rows)} metrics of run {run_id}, {len(anomalies)} anomalies")
+    return anomalies
+
+
+def create_run_report(directory_path, chunk_size=DEFAULT_CHUNK_SIZE, history_db=None, baseline_runs=14,
+                      min_history=5, threshold=3.0, top_values=DEFAULT_TOP_VALUES, accept_after=3):
+    """
+    Profiles every CSV file of a directory and saves a single report of the run.
+
+    Args:
+    directory_path (str): The directory of the extracted CSV files.
+    chunk_size (int, optional): Rows read at a time from files without a saved profile. Defaults to
+                                DEFAULT_CHUNK_SIZE.
+    history_db (str, optional): Path to the raw tables database, to record the metrics of the run in the
+                                validation history and flag anomalies (see `check_history`). Default is None.
+    baseline_runs (int, optional): Number of earlier runs the baseline is computed over. Default is 14.
+    min_history (int, optional): Number of earlier runs needed before a metric is checked. Default is 5.
+    threshold (float, optional): Deviation from the baseline, in standard deviations, flagged as an anomaly.
+                                 Default is 3.0.
+    top_values (int, optional): Most frequent values listed per column. Defaults to DEFAULT_TOP_VALUES.
+    accept_after (int, optional): Number of runs in a row a metric is flagged on before its new level is
+                                  accepted into the baseline, or 0 to never accept it. Default is 3.
+
+    Returns:
+    dict: The report, with a 'tables' entry per file and the 'anomalies' found. The entry of a file has its
+          profile, with the summary of each column in 'columns'.
+    """
+    now = datetime.now()
+    run_report = {'run_id': now.strftime("%Y%m%dT%H%M%S"), 'datetime': now.strftime("%Y/%m/%d %H:%M:%S"),
+                  'tables': [], 'anomalies': []}
+    streamed = 0
+    for file_name in sorted(os.listdir(directory_path)):
+        file_path = os.path.join(directory_path, file_name)
+        if not file_name.endswith(".csv") or not os.path.isfile(file_path):
+            continue
+        try:
+            profile = load_file_profile(file_path)
+            source = "extract"
+            if profile is None:
+                logging.info(f"No profile saved for {file_name}, reading the file")
+                profile = profile_csv(file_path, chunk_size)
+                source = "file"
+                streamed += 1
+            run_report['tables'].append({'table_name': file_name, 'profiled_from': source,
+                                         'columns': summarize_sketches(profile['sketches'], top_values), **profile})
+        except Exception as e:
+            logging.error(f"Error profiling {file_name}: {e}")
+
+    logging.info(f"Profiled {len(run_report['tables'])} files, {streamed} of them read from disk")
+
+    if history_db is not None:
+        connection = connect(history_db, timeout=60)
+        try:
+            run_report['anomalies'] = check_history(connection, run_report, run_report['run_id'], baseline_runs,
+                                                    min_history, threshold, accept_after)
+        except Exception as e:
+            logging.error(f"Error checking the validation history: {e}")
+        finally:
+            connection.close()
+
+    save_report_to_file(report=run_report, filename="raw_data_validation_run.json")
+    return run_report
+
+
+def merge_run_reports(report_paths, top_values=DEFAULT_TOP_VALUES):
+    """
+    Merges the run reports of a period into a profile of each file over the period, from their sketches.
+
+    The files of backfills are merged with the nightly files of the same table, by their name without the
+    window prefix. Merged reports can be merged again, so weekly profiles roll up into monthly ones.
+
+    Args:
+    report_paths (list): The paths of the run reports, see `create_run_report`, or of merged reports.
+    top_values (int, optional): Most frequent values listed per column. Defaults to DEFAULT_TOP_VALUES.
+
+    Returns:
+    dict: The merged report, with the 'runs' merged, the first and last 'run_ids', and a 'tables' entry per file
+          with its profile over the period, the 'runs' it appeared in and the summary of each column.
+    """
+    runs = 0
+    run_ids = []
+    tables = {}
+    for report_path in sorted(report_paths):
+        try:
+            with open(report_path, 'r') as file:
+                run_report = json.load(file)
+        except (OSError, ValueError) as e:
+            logging.error(f"Error reading the run report {report_path}: {e}")
+            continue
+
+        runs += run_report.get('runs', 1)
+        run_ids.extend(run_report.get('run_ids') or [run_report['run_id']])
+        for table_report in run_report['tables']:
+            table_name = WINDOW_PREFIX.sub("", table_report['table_name'])
+            profile = {key: table_report[key] for key in ('total_rows', 'missing_values', 'sketches')
+                       if key in table_report}
+            table_runs = table_report.get('runs', 1)
+            if table_name in tables:
+                table_runs += tables[table_name]['runs']
+                profile = merge_profiles(tables[table_name], profile)
+            tables[table_name] = {**profile, 'runs': table_runs}
+
+    logging.info(f"Merged {len(report_paths)} reports of {runs} runs, {len(tables)} files")
+    merged_report = {'runs': runs, 'run_ids': [min(run_ids), max(run_ids)] if run_ids else [], 'tables': []}
+    for table_name, profile in sorted(tables.items()):
+        columns = summarize_sketches(profile['sketches'], top_values) if 'sketches' in profile else {}
+        merged_report['tables'].append({'table_name': table_name, 'columns': columns, **profile})
+    return merged_report
@@ -0,0 +1,164 @@
+"""
+Resumable Backfill Module
+
+This module reloads historical data for an extract spec over an arbitrary date range. The range
+is split into consecutive windows which are extracted one after the other, each window writing
+its own date-partitioned CSV files (the window start is prefixed to the output file names, e.g.
+`20240201T000000_hashed_Victim.csv`).
+
+Window sizes adapt to the data: after each window the next window is grown or shrunk so that a
+response holds roughly `target_records` records and `target_bytes` bytes, keeping responses small
+enough to parse comfortably while not sending more queries than needed for quiet periods.
+
+Progress is checkpointed to a JSON state file after every completed window. If a backfill is
+interrupted it can be started again with the same arguments and state file, and it resumes with
+the first window that was not completed.
+"""
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from src_extract_runner import EXTRACT_FAILED, QUERY_DATE_FORMAT, extract_spec
+
+# Bounds on how much a window may grow or shrink from one window to the next
+MIN_WINDOW_SCALE = 0.25
+MAX_WINDOW_SCALE = 2.0
+
+
+def load_backfill_state(state_file, spec_name, start_date, end_date, initial_window):
+    """
+    Loads the checkpointed state of a backfill, or creates a new state if there is none.
+
+    Parameters:
+    state_file (str): Path to the JSON state file.
+    spec_name (str): The name of the extract spec being backfilled.
+    start_date (datetime): Start datetime of the backfill.
+    end_date (datetime): End datetime of the backfill.
+    initial_window (timedelta): Size of the first window of a new backfill.
+
+    Returns:
+    dict: The backfill state.
+    """
+    if os.path.exists(state_file):
+        with open(state_file, 'r') as file:
+            state = json.load(file)
+
+        if (state['spec_name'], state['start_date'], state['end_date']) != (
+                spec_name, start_date.strftime(QUERY_DATE_FORMAT), end_date.strftime(QUERY_DATE_FORMAT)):
+            raise ValueError(f"State file {state_file} belongs to a different backfill: "
+                             f"{state['spec_name']} from {state['start_date']} to {state['end_date']}")
+
+        logging.info(f"Resuming backfill of {spec_name} from {state['next_start_date']} "
+                     f"({len(state['completed_windows'])} windows already completed)")
+        return state
+
+    logging.info(f"Starting new backfill of {spec_name} from {start_date} to {end_date}")
+    return {'spec_name': spec_name,
+            'start_date': start_date.strftime(QUERY_DATE_FORMAT),
+            'end_date': end_date.strftime(QUERY_DATE_FORMAT),
+            'next_start_date': start_date.strftime(QUERY_DATE_FORMAT),
+            'window_seconds': initial_window.total_seconds(),
+            'completed_windows': []}
+
+
+def save_backfill_state(state, state_file):
+    """
+    Writes the backfill state to its state file, replacing the previous checkpoint atomically.
+
+    Parameters:
+    state (dict): The backfill state.
+    state_file (str): Path to the JSON state file.
+    """
+    state_dir = os.path.dirname(state_file)
+    if state_dir and not os.path.exists(state_dir):
+        os.makedirs(state_dir)
+
+    temporary_file = state_file + ".tmp"
+    with open(temporary_file, 'w') as file:
+        json.dump(state, file, indent=4)
+    os.replace(temporary_file, state_file)
+
+
+def next_window_size(window, records, response_bytes, target_records, target_bytes, min_window, max_window):
+    """
+    Sizes the next window from the number of records and bytes returned for the previous one.
+
+    Parameters:
+    window (timedelta): Size of the previous window.
+    records (int): Number of records returned for the previous window.
+    response_bytes (int): Size in bytes of the response for the previous window.
+    target_records (int): Number of records a window should return.
+    target_bytes (int): Size in bytes a window's response should have.
+    min_window (timedelta): Smallest allowed window.
+    max_window (timedelta): Largest allowed window.
+
+    Returns:
+    timedelta: The size of the next window.
+    """
+    if records == 0:
+        scale = MAX_WINDOW_SCALE
+    else:
+        scale = min(target_records / records, target_bytes / max(response_bytes, 1))
+        scale = min(max(scale, MIN_WINDOW_SCALE), MAX_WINDOW_SCALE)
+    return min(max(window * scale, min_window), max_window)
+
+
+def backfill(spec_name, start_date, end_date, state_file, session, base_url, output_directory, salt=None,
+             initial_window=timedelta(days=10), min_window=timedelta(hours=1), max_window=timedelta(days=90),
+             target_records=20000, target_bytes=50 * 1024 * 1024):
+    """
+    Extracts an extract spec over a date range in adaptively sized, checkpointed windows.
+
+    Parameters:
+    spec_name (str): The name of the extract spec.
+    start_date (datetime): Start datetime of the backfill.
+    end_date (datetime): End datetime of the backfill.
+    state_file (str): Path to the JSON state file used to checkpoint and resume the backfill.
+    session (Session): HTTP session for the API requests.
+    base_url (str): Base URL for the API.
+    output_directory (str): Directory for saving the hashed CSV files.
+    salt (str, optional): Salt for hashing. Default is None.
+    initial_window (timedelta, optional): Size of the first window. Defaults to 10 days.
+    min_window (timedelta, optional): Smallest allowed window. Defaults to 1 hour.
+    max_window (timedelta, optional): Largest allowed window. Defaults to 90 days.
+    target_records (int, optional): Number of records a window should return. Defaults to 20,000.
+    target_bytes (int, optional): Size in bytes a window's response should have. Defaults to 50 MB.
+
+    Returns:
+    bool: True if every window of the range was extracted, False if the backfill stopped on a failed window.
+    """
+    state = load_backfill_state(state_file, spec_name, start_date, end_date, initial_window)
+    window_start = datetime.strptime(state['next_start_date'], QUERY_DATE_FORMAT)
+    window = timedelta(seconds=state['window_seconds'])
+
+    while window_start < end_date:
+        window_end = min(window_start + window, end_date)
+        logging.info(f"Backfilling {spec_name} window {window_start} to {window_end}")
+
+        result = extract_spec(spec_name, start_date=window_start, end_date=window_end, session=session,
+                              base_url=base_url, output_directory=output_directory, salt=salt,
+                              output_prefix=window_start.strftime("%Y%m%dT%H%M%S_"))
+        if result['status'] == EXTRACT_FAILED:
+            logging.error(f"Backfill of {spec_name} stopped at window {window_start} to {window_end}. "
+                          f"Run it again with the same state file to resume.")
+            return False
+
+        records = sum(result['records'].values())
+        state['completed_windows'].append({'start_date': window_start.strftime(QUERY_DATE_FORMAT),
+                                           'end_date': window_end.strftime(QUERY_DATE_FORMAT),
+                                           'records': result['records'],
+                                           'bytes': result['bytes']})
+
+        # Size the next window from what this one returned, scaled to the full window length
+        window = next_window_size(window_end - window_start, records, result['bytes'],
+                                  target_records, target_bytes, min_window, max_window)
+        window_start = window_end
+        state['next_start_date'] = window_start.strftime(QUERY_DATE_FORMAT)
+        state['window_seconds'] = window.total_seconds()
+        save_backfill_state(state, state_file)
+        logging.info(f"Completed window with {records} records and {result['bytes']} bytes. "
+                     f"Next window size: {window}")
+
+    logging.info(f"Backfill of {spec_name} from {start_date} to {end_date} completed")
+    return True
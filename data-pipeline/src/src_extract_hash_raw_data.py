@@ -8,7 +8,12 @@ hashing to specific columns of the DataFrame.
 
 The module starts by reading configuration paths from a YAML file. It then defines
 functions to parse XML files into DataFrames, generate salted hashes, and hash specified
-columns in a DataFrame before saving the result as a CSV file.
+columns in a DataFrame before saving the result as a CSV file. `parse_xml_tables` parses
+a single API response into every table it contains, so an extract script only needs to
+query the API once for a parent table and its joined child tables. The XML is read
+incrementally with lxml's iterparse, and `iterparse_xml_tables` yields fixed-size
+DataFrame chunks so that large backfill responses can be processed with flat memory.
+`hash_series` hashes each unique value of a column once instead of hashing every cell.
 
 Note:
     This module assumes the presence of a valid YAML configuration file and a writable
@@ -16,11 +21,18 @@ Note:
     formats or data structures.
 """
 import hashlib
+import io
 import logging
+import numpy as np
 import pandas as pd
 import yaml
 import logging
 import os
+from lxml import etree
+from pandas.api.extensions import ExtensionDtype
+from pandas.io.parsers import TextParser
+
+from src_file_profiles import save_file_profile
 
 home = os.environ.get('HOME')
 
@@ -34,24 +46,176 @@ def parse_xml(text_file, table_name):
     Parses an XML file and returns a DataFrame of a specified table.
 
     Parameters:
-    text_file (str): The path to the XML file.
+    text_file (str): The XML response text, or a path or file object of an XML file.
     table_name (str): The name of the table to parse from the XML.
 
     Returns:
     DataFrame: A pandas DataFrame containing the parsed table data.
     """
+    return parse_xml_tables(text_file=text_file, table_names=[table_name])[table_name]
+
+def _rows_to_frame(rows, columns=None, dtype=None):
+    """
+    Converts parsed XML rows into a DataFrame using the same dtype inference as pd.read_xml.
+
+    Rows that are missing a column found in other rows are filled with None, matching the
+    behaviour of pd.read_xml so that downstream CSV output and hashes are unchanged.
+
+    Parameters:
+    rows (list): A list of dictionaries mapping column names to text values.
+    columns (list, optional): Column order to use. Defaults to the order columns first appear in rows.
+    dtype (type or dict, optional): Data type(s) passed to the parser instead of inferring them.
+
+    Returns:
+    DataFrame: A pandas DataFrame containing the rows.
+    """
+    if columns is None:
+        columns = list(dict.fromkeys(column for row in rows for column in row))
+    nodes = [[row.get(column) for column in columns] for row in rows]
+    with TextParser(nodes, names=columns, dtype=dtype) as parser:
+        return parser.read()
+
+
+def _element_to_row(element):
+    """
+    Converts an XML element into a row dictionary the same way pd.read_xml does.
+
+    Parameters:
+    element (Element): The lxml element of a table record.
+
+    Returns:
+    dict: A dictionary of the element's attributes, text and child element values.
+    """
+    row = dict(element.attrib)
+    if element.text and not element.text.isspace():
+        row[element.tag] = element.text
+    for child in element.iterchildren(tag=etree.Element):
+        row[child.tag] = child.text if child.text else None
+    return row
+
+
+def _open_xml_source(source):
+    """
+    Returns an object that lxml's iterparse can read from.
+
+    Parameters:
+    source (str, bytes, path or file object): XML text, a path to an XML file, or an open file object.
+
+    Returns:
+    bytes stream, str or file object: The XML source to iterate over.
+    """
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    if isinstance(source, str) and source.lstrip().startswith("<"):
+        return io.BytesIO(source.encode("utf-8"))
+    return source
+
+
+def _iter_table_rows(source, table_names):
+    """
+    Streams the records of the requested tables out of an XML document.
+
+    The document is read incrementally with lxml's iterparse. Each record is converted to a
+    row when its closing tag is read, and is then cleared together with the siblings that
+    precede it so that memory use does not grow with the size of the response. Records that
+    are nested inside another requested table (a joined child table) are kept until the
+    enclosing record is finished, so the enclosing record still sees all of its fields.
+
+    Parameters:
+    source (str, bytes, path or file object): The XML document to parse.
+    table_names (list): The names of the tables to emit rows for.
+
+    Yields:
+    tuple: The table name and a dictionary for each record found.
+    """
+    targets = set(table_names)
+    depth = 0
+    for event, element in etree.iterparse(_open_xml_source(source), events=("start", "end"),
+                                          tag=list(targets), huge_tree=True):
+        if event == "start":
+            depth += 1
+            continue
+
+        depth -= 1
+        yield element.tag, _element_to_row(element)
+
+        # Only free memory once no enclosing record still needs this element
+        if depth == 0:
+            element.clear()
+            for node in (element, *element.iterancestors()):
+                while node.getprevious() is not None:
+                    del node.getparent()[0]
+
+
+def iterparse_xml_tables(source, table_names, chunk_size=50000, dtype=None):
+    """
+    Streams an XML response into fixed-size DataFrame chunks for each requested table.
+
+    Unlike parse_xml_tables, at most `chunk_size` rows per table are held in memory at a time,
+    so peak memory stays flat regardless of the date window a response covers. Columns keep
+    the order they were first seen in, and columns first seen in a later chunk are included
+    from that chunk on. As dtypes are inferred per chunk, pass `dtype=str` when values must be
+    typed the same way in every chunk.
+
+    Parameters:
+    source (str, bytes, path or file object): The XML response text, or a path or file object of an XML file.
+    table_names (list): The names of the tables to parse from the XML.
+    chunk_size (int, optional): Maximum number of rows per chunk. Defaults to 50000.
+    dtype (type or dict, optional): Data type(s) for the columns instead of inferring them per chunk.
+
+    Yields:
+    tuple: The table name and a pandas DataFrame chunk of that table.
+    """
+    rows = {table_name: [] for table_name in table_names}
+    columns = {table_name: {} for table_name in table_names}
+
+    for table_name, row in _iter_table_rows(source, table_names):
+        rows[table_name].append(row)
+        columns[table_name].update(dict.fromkeys(row))
+        if len(rows[table_name]) >= chunk_size:
+            yield table_name, _rows_to_frame(rows[table_name], list(columns[table_name]), dtype)
+            rows[table_name] = []
+
+    for table_name, table_rows in rows.items():
+        if table_rows:
+            yield table_name, _rows_to_frame(table_rows, list(columns[table_name]), dtype)
+
+
+def parse_xml_tables(text_file, table_names):
+    """
+    Parses an XML response once and returns a DataFrame for each requested table.
+
+    The extract queries return a parent table together with its joined child tables
+    (e.g. GeobaseAddressIDMaintenance or MainNamesTable) in a single response. Rather than
+    querying and parsing the response once per table, the document is streamed a single
+    time and the records of every requested table are collected in the same pass.
+
+    Parameters:
+    text_file (str): The XML response text, or a path or file object of an XML file.
+    table_names (list): The names of the tables to parse from the XML.
+
+    Returns:
+    dict: A dictionary mapping each table name to a pandas DataFrame, or to None if the
+          table is not present in the response or could not be parsed.
+    """
+    data_frames = {table_name: None for table_name in table_names}
     try:
-        logging.info(f"Parsing XML file: {table_name}")
-        data_frame0 = pd.read_xml(text_file, xpath=f".//{table_name}")
+        logging.info(f"Parsing XML file for tables: {', '.join(table_names)}")
+        rows = {table_name: [] for table_name in table_names}
+        for table_name, row in _iter_table_rows(text_file, table_names):
+            rows[table_name].append(row)
 
-        logging.info(f"Successfully parsed table {table_name} with shape {data_frame0.shape}")
-        return data_frame0
+        for table_name, table_rows in rows.items():
+            if not table_rows:
+                logging.warning(f"No records found for table {table_name}")
+                continue
+            data_frames[table_name] = _rows_to_frame(table_rows)
+            logging.info(f"Successfully parsed table {table_name} with shape {data_frames[table_name].shape}")
 
     except Exception as e:
-        logging.exception(f"Error occurred while parsing {table_name}: {e}")
+        logging.exception(f"Error occurred while parsing tables {', '.join(table_names)}: {e}")
 
-        # Exit the script if an exception occurs
-        return None
+    return data_frames
 
 def salted_hash(value, salt=None):
     """
@@ -88,17 +252,80 @@ def salted_hash(value, salt=None):
         logging.error(f"Error in salted_hash function: {e}")
         return None
 
+def hash_series(series, salt=None):
+    """
+    Hashes every value of a pandas Series, producing the same digests as salted_hash(str(x), salt).
+
+    Rather than hashing each cell, the column is factorized and only its unique values are
+    hashed, after which the digests are mapped back to the rows by their factorized codes.
+    Null cells are not converted to strings; their digest is worked out once per kind of
+    null (e.g. None or NaN) so the output matches the per-cell path exactly. Columns whose
+    values cannot be factorized without merging values with different string forms (mixed
+    types, a float column containing -0.0, or non-string extension dtypes) are hashed cell by cell.
+
+    Parameters:
+    series (Series): The column to hash.
+    salt (str, optional): Salt for hashing. Default is None.
+
+    Returns:
+    Series: The hashed column, with the same index as `series`.
+    """
+    mask = series.isna().to_numpy()
+    non_null = series[~mask]
+
+    if isinstance(series.dtype, ExtensionDtype) and not pd.api.types.is_string_dtype(series.dtype):
+        factorizable = False
+    elif pd.api.types.is_float_dtype(series.dtype):
+        factorizable = not ((non_null == 0) & np.signbit(non_null.to_numpy(dtype=float))).any()
+    elif pd.api.types.is_object_dtype(series.dtype):
+        # Check the type of every cell: pd.unique already merges values like 1, 1.0 and True
+        types = non_null.map(type)
+        factorizable = types.nunique() <= 1
+        if factorizable and not types.empty and issubclass(types.iloc[0], float):
+            factorizable = not ((non_null == 0) & np.signbit(non_null.to_numpy(dtype=float))).any()
+    else:
+        factorizable = True
+    if not factorizable:
+        logging.info(f"Column {series.name} cannot be factorized safely, hashing each value.")
+        return series.apply(lambda x: salted_hash(str(x), salt))
+
+    # Hash each unique value once and map the digests back by code
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    digests = np.array([salted_hash(str(value), salt) for value in uniques] + [None], dtype=object)
+    hashed = digests[codes]
+
+    # Codes of -1 index the trailing None; replace it with the digest of each kind of null
+    if mask.any():
+        positions = np.flatnonzero(mask)
+        null_values = series.to_numpy(dtype=object)[mask]
+        kinds = [type(value) for value in null_values]
+        for kind in set(kinds):
+            is_kind = np.fromiter((k is kind for k in kinds), dtype=bool, count=len(kinds))
+            value = null_values[is_kind][0]
+            hashed[positions[is_kind]] = salted_hash(str(value), salt)
+
+    return pd.Series(hashed, index=series.index, name=series.name, dtype=object)
+
 # Function to hash columns in a CSV file
-def hash_columns(data_frame, output_file, output_directory, columns_to_hash, salt=None):
+def hash_columns(data_frame, output_file, output_directory, columns_to_hash, salt=None, append=False,
+                 profile=False, window=None):
     """
     Hashes specified columns in a DataFrame and saves it as a CSV file.
 
+    When `append` is True the rows are appended to an existing output file without repeating
+    the header, which lets DataFrame chunks from iterparse_xml_tables be written one at a time.
+
     Parameters:
     data_frame (DataFrame): DataFrame to be processed.
     output_file (str): Name of the output CSV file.
     output_directory (str): Directory for saving the output file.
     columns_to_hash (list): List of column names to hash.
     salt (str, optional): Salt for hashing. Default is None.
+    append (bool, optional): Append to the output file instead of overwriting it. Default is False.
+    profile (bool, optional): Save the validation profile of the rows written, so the validation report does
+                              not read the file again (see src_file_profiles). Default is False.
+    window (tuple, optional): The start and end datetime of the extract window of the rows, saved with the
+                              profile. Default is None.
     """
     try:
         # Read the CSV file into a DataFrame
@@ -108,17 +335,34 @@ def hash_columns(data_frame, output_file, output_directory, columns_to_hash, sal
         for column in columns_to_hash:
             # Check if the column exists in the DataFrame
             if column in df.columns:
-                # Apply the hash function to the column
-                df[column] = df[column].apply(lambda x: salted_hash(str(x), salt))
+                # Hash the unique values of the column and map them back to each row
+                df[column] = hash_series(df[column], salt)
                 logging.info(f"Hashed {column} successfully")
             else:
                 #Log that the column is not in the DataFrame
                 logging.warning(f"Column '{column}' not found in dataframe.")
 
-        # Save the modified DataFrame to a new CSV file
-        df.to_csv(output_directory + output_file, index=False)
+        # Save the modified DataFrame to a new CSV file, or append it to an existing one
+        output_path = output_directory + output_file
+        previous_size = None
+        if append and os.path.exists(output_path):
+            # Keep appended rows aligned with the header that is already in the file
+            header = pd.read_csv(output_path, nrows=0).columns
+            dropped = [column for column in df.columns if column not in header]
+            if dropped:
+                logging.warning(f"Columns {dropped} are not in the header of {output_file} and were dropped.")
+            df = df.reindex(columns=header)
+            previous_size = os.path.getsize(output_path)
+            df.to_csv(output_path, mode='a', header=False, index=False)
+        else:
+            df.to_csv(output_path, index=False)
+        if profile:
+            save_file_profile(df, output_path, previous_size, window)
         logging.info(f"Hashed data saved to {output_directory}")
     except FileNotFoundError:
         logging.error(f"File not found: {data_frame}")
+        raise
     except Exception as e:
         logging.error(f"Error occurred while hashing data: {e}")
+        # A chunk that was not saved must fail the extract, so its watermark does not move past it
+        raise
@@ -0,0 +1,524 @@
+"""
+Extract Runner Module
+
+This module runs the extracts defined in `src_extract_specs` against the Motorola Spillman Flex
+DataExchange REST API. Each extract posts its XML query once, parses every table out of the
+response in a single pass, hashes the configured columns and writes one CSV file per table.
+
+The response is streamed: it is parsed as it is read from the connection (see
+`iterparse_xml_tables`), and every chunk of `PARSE_CHUNK_SIZE` rows is hashed and appended to its
+CSV file before the next one is parsed, so memory use does not grow with the window of the extract.
+
+Extracts can be run one at a time (as the individual extract scripts do) or several at once with
+`run_extracts`, which runs any subset of the extract specs concurrently in one process. Concurrent
+extracts share a single `requests.Session`, so connections to the DataExchange server are kept
+alive and reused, and a bounded thread pool caps the number of queries sent to the server at once.
+
+Extracts are incremental when they are given the raw tables database: each spec is queried from its
+watermark up to now, and the newest date it returns becomes its pending watermark, which the load
+script promotes once the data is committed (see `src_extract_watermarks`).
+
+Every response is also saved to the response archive (see `src_response_archive`), and extracts can
+be replayed from the archive instead of the network with `replay_extract`.
+
+Address rows (`GeobaseAddressIDMaintenance`) that were already saved by another extract of the run, or
+loaded unchanged in an earlier run, are left out when an address cache is given (see `src_address_cache`).
+
+The validation profile of every CSV file is saved as the file is written, so the validation report does
+not read the files again (see `src_create_report_raw_data`).
+"""
+import logging
+import os
+import pandas as pd
+import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+
+from src_address_cache import ADDRESS_TABLE
+from src_extract_specs import EXTRACT_SPECS, build_query
+from src_extract_hash_raw_data import iterparse_xml_tables, hash_columns
+from src_extract_watermarks import get_watermark, set_pending_watermark
+from src_response_archive import get_response_archive
+
+# Outcomes of an extract. Extract scripts exit with code 99 when a table is empty.
+EXTRACT_SUCCESS = "success"
+EXTRACT_EMPTY = "empty"
+EXTRACT_FAILED = "failed"
+
+# Format of the dates in the XML query
+QUERY_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Format of the dates in the API response
+RESPONSE_DATE_FORMAT = "%H:%M:%S %m/%d/%Y"
+
+# Rows of a table parsed, hashed and written at a time. Types are inferred per chunk, so this is kept above
+# the number of rows of a nightly extract or a backfill window, which are then typed as a whole as before.
+PARSE_CHUNK_SIZE = 50000
+
+# Bytes read from the connection at a time
+RESPONSE_READ_SIZE = 1024 * 1024
+
+
+class ResponseReader:
+    """
+    Reads a streamed response for the XML parser, counting its bytes and writing it to the archive as it goes.
+
+    Archiving is best effort: if writing to the archive fails, the response is still read and parsed.
+
+    Parameters:
+    source (file object): The response, in binary mode.
+    archive_writer (ResponseWriter, optional): Writer archiving the response. Default is None.
+    """
+
+    def __init__(self, source, archive_writer=None):
+        self.source = source
+        self.archive_writer = archive_writer
+        self.bytes = 0
+
+    def read(self, size=RESPONSE_READ_SIZE):
+        data = self.source.read(size)
+        self.bytes += len(data)
+        if self.archive_writer is not None and data:
+            try:
+                self.archive_writer.write(data)
+            except Exception as e:
+                logging.error(f"Error archiving response, it will not be archived: {e}")
+                self.archive_writer.abort()
+                self.archive_writer = None
+        return data
+
+
+def create_session(auth, headers, max_connections=1):
+    """
+    Creates an HTTP session for the DataExchange API that keeps connections alive between queries.
+
+    Parameters:
+    auth (tuple): Authentication credentials for the API.
+    headers (dict): Headers for the API requests.
+    max_connections (int, optional): Number of connections kept in the pool. Defaults to 1.
+
+    Returns:
+    Session: A requests session with the credentials, headers and connection pool set.
+    """
+    session = requests.Session()
+    session.auth = auth
+    session.headers.update(headers)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def default_date_range():
+    """
+    Returns the date range extracted by the nightly run: the whole of yesterday.
+
+    Returns:
+    tuple: The start datetime (yesterday at midnight) and end datetime (today at midnight).
+    """
+    yesterday = datetime.now() - timedelta(days=1)
+    start_date = yesterday.replace(hour=0,
+                                   minute=0,
+                                   second=0,
+                                   microsecond=0)
+    end_date = start_date + timedelta(days=1)
+    return start_date, end_date
+
+
+def incremental_date_range(spec_name, watermark_db):
+    """
+    Returns the date range of an incremental extract: from the watermark of the spec, less the `lookback` of
+    the spec if it has one, up to now.
+
+    Specs without a watermark yet (the first run, or a new spec) start from yesterday at midnight.
+
+    Parameters:
+    spec_name (str): The name of the extract spec.
+    watermark_db (str): Path to the raw tables SQLite database holding the watermarks.
+
+    Returns:
+    tuple: The start datetime and end datetime of the extract.
+    """
+    start_date = get_watermark(watermark_db, spec_name)
+    if start_date is None:
+        start_date, _ = default_date_range()
+        logging.info(f"No watermark found for {spec_name}, extracting from {start_date}")
+    elif 'lookback' in EXTRACT_SPECS[spec_name]:
+        # The spec does not filter on a modification date, so records edited within the lookback are queried again
+        start_date -= EXTRACT_SPECS[spec_name]['lookback']
+        logging.info(f"Extracting {spec_name} from {start_date}, {EXTRACT_SPECS[spec_name]['lookback']} "
+                     f"before its watermark")
+    return start_date, datetime.now().replace(microsecond=0)
+
+
+def chunk_newest_date(spec_name, table_name, data_frame):
+    """
+    Finds the newest date in the watermark column of a chunk of a table.
+
+    Parameters:
+    spec_name (str): The name of the extract spec.
+    table_name (str): The table of the chunk.
+    data_frame (DataFrame): The chunk.
+
+    Returns:
+    datetime: The newest date, or None if the chunk is not of the watermark table or has no readable dates.
+    """
+    watermark_table, column = EXTRACT_SPECS[spec_name].get('watermark_column', (None, None))
+    if table_name != watermark_table or column not in data_frame:
+        return None
+    newest = pd.to_datetime(data_frame[column].astype(str), format=RESPONSE_DATE_FORMAT, errors='coerce').max()
+    return None if pd.isna(newest) else newest.to_pydatetime()
+
+
+def newest_date(spec_name, parsed_rows, newest, end_date):
+    """
+    Works out the next watermark of a spec from what its extract returned.
+
+    Parameters:
+    spec_name (str): The name of the extract spec.
+    parsed_rows (int): The number of rows parsed from the response, over all tables.
+    newest (datetime): The newest date found in the watermark column (see `chunk_newest_date`), or None.
+    end_date (datetime): End datetime of the query.
+
+    Returns:
+    datetime: The newest date in the watermark column of the spec, the end of the query if the spec
+              has no watermark column or its dates cannot be read, or None if no rows were returned.
+    """
+    if not parsed_rows:
+        return None
+    if newest is not None:
+        return min(newest, end_date)
+    if 'watermark_column' in EXTRACT_SPECS[spec_name]:
+        table_name, column = EXTRACT_SPECS[spec_name]['watermark_column']
+        logging.warning(f"No readable dates in {table_name}.{column}, using the end of the query as watermark")
+    return end_date
+
+
+def query_api(spec_name, start_date, end_date, session, base_url):
+    """
+    Queries API using the XML query of an extract spec and returns the response, to be read as a stream.
+
+    Parameters:
+    spec_name (str): The name of the extract spec.
+    start_date (datetime): Start datetime for the query.
+    end_date (datetime): End datetime for the query.
+    session (Session): HTTP session for the API requests.
+    base_url (str): Base URL for the API.
+
+    Returns:
+    Response: The streamed response from the API if successful, otherwise None.
+    """
+    logging.info(f"Preparing to query API for {spec_name} between {start_date} and {end_date}.")
+    xml_query = build_query(spec_name,
+                            start_date=start_date.strftime(QUERY_DATE_FORMAT),
+                            end_date=end_date.strftime(QUERY_DATE_FORMAT))
+
+    try:
+        response = session.post(base_url, data=xml_query, stream=True)
+        # Undo any content encoding while the raw stream is read
+        response.raw.decode_content = True
+        return response
+    except requests.exceptions.HTTPError as http_err:
+        logging.error(f"HTTP error occurred during API request: {http_err}")
+    except Exception as err:
+        logging.critical(f"Critical error during API request: {err}")
+    return None
+
+
+def extract_spec(spec_name, start_date, end_date, session, base_url, output_directory, salt=None, output_prefix="",
+                 replay=False, address_cache=None):
+    """
+    Runs one extract and reports how much data it returned.
+
+    The API is queried once, and the response is parsed as it is streamed: every chunk of a table is
+    hashed and appended to the CSV file of the table. The response is archived as it is read, or with
+    `replay` read back from the archive instead of querying the API.
+
+    Parameters:
+    spec_name (str): The name of the extract spec.
+    start_date (datetime): Start datetime for the query.
+    end_date (datetime): End datetime for the query.
+    session (Session): HTTP session for the API requests.
+    base_url (str): Base URL for the API.
+    output_directory (str): Directory for saving the hashed CSV files.
+    salt (str, optional): Salt for hashing. Default is None.
+    output_prefix (str, optional): Prefix added to the name of every output file. Default is "".
+    replay (bool, optional): Read the response from the archive instead of the API. Default is False.
+    address_cache (AddressCache, optional): Cache used to leave out known address rows. Default is None.
+
+    Returns:
+    dict: The outcome ('status'), the number of rows saved per table ('records'), the size of the
+          API response in bytes ('bytes') and the newest date returned ('watermark', see `newest_date`).
+    """
+    files_to_hash = EXTRACT_SPECS[spec_name]['files_to_hash']
+    result = {'status': EXTRACT_SUCCESS, 'records': {table_name: 0 for table_name in files_to_hash}, 'bytes': 0,
+              'watermark': None}
+
+    # Query the API once; the response holds every table in files_to_hash
+    logging.info(f"Starting file processing for {spec_name}")
+    archive = get_response_archive()
+    response = None
+    source = None
+    try:
+        if replay:
+            try:
+                source = archive.open(spec_name, start_date, end_date) if archive is not None else None
+                if source is None:
+                    logging.error(f"No archived response for {spec_name} from {start_date} to {end_date}")
+            except Exception as e:
+                # The response is indexed but its object cannot be read, e.g. it was deleted
+                logging.error(f"Error opening the archived response of {spec_name} from {start_date} "
+                              f"to {end_date}: {e}")
+            reader = ResponseReader(source)
+        else:
+            response = query_api(spec_name, start_date=start_date, end_date=end_date,
+                                 session=session, base_url=base_url)
+            source = response.raw if response is not None else None
+            archive_writer = None
+            if source is not None and archive is not None:
+                try:
+                    archive_writer = archive.writer(spec_name, start_date, end_date)
+                except Exception as e:
+                    logging.error(f"Error archiving response of {spec_name}: {e}")
+            reader = ResponseReader(source, archive_writer)
+        if source is None:
+            logging.error(f"Failed to get a valid response for tables {', '.join(files_to_hash)}")
+            result['status'] = EXTRACT_FAILED
+            return result
+
+        # Parse the response into all tables in a single pass, writing each chunk as it is parsed
+        parsed_rows = {table_name: 0 for table_name in files_to_hash}
+        newest = None
+        try:
+            for table_name, data_frame in iterparse_xml_tables(reader, list(files_to_hash),
+                                                               chunk_size=PARSE_CHUNK_SIZE):
+                parsed_rows[table_name] += len(data_frame)
+                chunk_newest = chunk_newest_date(spec_name, table_name, data_frame)
+                if chunk_newest is not None and (newest is None or chunk_newest > newest):
+                    newest = chunk_newest
+                try:
+                    _write_chunk(table_name, data_frame, files_to_hash[table_name], output_directory, output_prefix,
+                                 salt, append=result['records'][table_name] > 0, address_cache=address_cache,
+                                 result=result, window=(start_date, end_date))
+                except Exception as e:
+                    logging.critical(f"Critical error while processing table {table_name}: {e}")
+                    # The chunk was not saved, so the watermark must not move past it
+                    result['status'] = EXTRACT_FAILED
+        except Exception as e:
+            logging.exception(f"Error occurred while parsing tables {', '.join(files_to_hash)}: {e}")
+            result['status'] = EXTRACT_FAILED
+        result['bytes'] = reader.bytes
+
+        if reader.archive_writer is not None:
+            if result['status'] == EXTRACT_FAILED:
+                reader.archive_writer.abort()
+            else:
+                try:
+                    reader.archive_writer.commit()
+                except Exception as e:
+                    logging.error(f"Error archiving response of {spec_name}: {e}")
+    finally:
+        if response is not None:
+            response.close()
+        elif replay and source is not None:
+            source.close()
+        if archive is not None:
+            archive.close()
+
+    if result['status'] == EXTRACT_FAILED:
+        return result
+
+    for table_name, info in files_to_hash.items():
+        if result['records'][table_name]:
+            logging.info(f"Successfully processed and hashed {result['records'][table_name]} rows "
+                         f"of table {table_name}")
+        elif parsed_rows[table_name] and table_name == ADDRESS_TABLE and address_cache is not None:
+            # Every address is known, so remove the file of an earlier run rather than reload it
+            output_path = output_directory + output_prefix + info['output_file']
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            logging.info(f"No new or changed addresses for table {table_name}")
+        else:
+            logging.warning(f"No data found or empty DataFrame for table {table_name}. Skipping Task.")
+            result['status'] = EXTRACT_EMPTY
+
+    result['watermark'] = newest_date(spec_name, sum(parsed_rows.values()), newest, end_date)
+    return result
+
+
+def _write_chunk(table_name, data_frame, info, output_directory, output_prefix, salt, append, address_cache, result,
+                 window):
+    """
+    Hashes a chunk of a table and writes it to the CSV file of the table, counting its rows in `result`.
+
+    Parameters:
+    table_name (str): The table of the chunk.
+    data_frame (DataFrame): The chunk.
+    info (dict): The output file and columns to hash of the table, from `files_to_hash`.
+    output_directory (str): Directory for saving the hashed CSV files.
+    output_prefix (str): Prefix added to the name of the output file.
+    salt (str): Salt for hashing.
+    append (bool): Append to the output file, for the chunks after the first one written.
+    address_cache (AddressCache): Cache used to leave out known address rows, or None.
+    result (dict): The result of the extract, see `extract_spec`.
+    window (tuple): The start and end datetime of the extract, saved with the profile of the file.
+    """
+    if table_name == ADDRESS_TABLE and address_cache is not None:
+        data_frame = address_cache.filter_new(data_frame)
+        if data_frame.empty:
+            return
+    hash_columns(data_frame=data_frame,
+                 output_file=output_prefix + info['output_file'],
+                 output_directory=output_directory,
+                 columns_to_hash=info['columns_to_hash'],
+                 salt=salt,
+                 append=append,
+                 profile=True,
+                 window=window)
+    result['records'][table_name] += len(data_frame)
+
+
+def run_extract(spec_name, start_date, end_date, session, base_url, output_directory, salt=None, watermark_db=None,
+                address_cache=None):
+    """
+    Runs one extract: queries the API once, then hashes and saves every table of the response.
+
+    When `watermark_db` is given, the newest date returned is saved as the pending watermark of the
+    spec, to be promoted by the load script.
+
+    Parameters:
+    spec_name (str): The name of the extract spec.
+    start_date (datetime): Start datetime for the query.
+    end_date (datetime): End datetime for the query.
+    session (Session): HTTP session for the API requests.
+    base_url (str): Base URL for the API.
+    output_directory (str): Directory for saving the hashed CSV files.
+    salt (str, optional): Salt for hashing. Default is None.
+    watermark_db (str, optional): Path to the raw tables SQLite database holding the watermarks. Default is None.
+    address_cache (AddressCache, optional): Cache used to leave out known address rows. Default is None.
+
+    Returns:
+    str: EXTRACT_SUCCESS, EXTRACT_EMPTY if a table had no data, or EXTRACT_FAILED if the API query failed.
+    """
+    result = extract_spec(spec_name, start_date=start_date, end_date=end_date, session=session,
+                          base_url=base_url, output_directory=output_directory, salt=salt,
+                          address_cache=address_cache)
+    if watermark_db and result['watermark'] is not None:
+        set_pending_watermark(watermark_db, spec_name, result['watermark'])
+    return result['status']
+
+
+def replay_extract(spec_name, start_date, end_date, output_directory, salt=None):
+    """
+    Reprocesses archived responses of an extract without querying the API.
+
+    Without a date range the most recent archived window is replayed and saved to the regular output
+    files. With a date range every archived window inside it is replayed, and each window is saved to
+    its own files, prefixed with the start of the window like the files of a backfill.
+
+    Parameters:
+    spec_name (str): The name of the extract spec.
+    start_date (datetime): Start datetime of the windows to replay, or None for the most recent window.
+    end_date (datetime): End datetime of the windows to replay, or None for the most recent window.
+    output_directory (str): Directory for saving the hashed CSV files.
+    salt (str, optional): Salt for hashing. Default is None.
+
+    Returns:
+    str: EXTRACT_SUCCESS, EXTRACT_EMPTY if a table had no data in any window, or EXTRACT_FAILED if
+         no response was archived or a window could not be processed.
+    """
+    archive = get_response_archive()
+    if archive is None:
+        logging.error(f"Cannot replay {spec_name} without a response archive")
+        return EXTRACT_FAILED
+    try:
+        windows = archive.windows(spec_name, start_date=start_date, end_date=end_date)
+    finally:
+        archive.close()
+
+    latest_only = start_date is None and end_date is None
+    if latest_only:
+        windows = windows[-1:]
+    if not windows:
+        logging.error(f"No archived responses found for {spec_name}")
+        return EXTRACT_FAILED
+
+    records = {table_name: 0 for table_name in EXTRACT_SPECS[spec_name]['files_to_hash']}
+    for window_start, window_end in windows:
+        logging.info(f"Replaying {spec_name} from {window_start} to {window_end}")
+        result = extract_spec(spec_name, start_date=window_start, end_date=window_end, session=None, base_url=None,
+                              output_directory=output_directory, salt=salt, replay=True,
+                              output_prefix="" if latest_only else window_start.strftime("%Y%m%dT%H%M%S_"))
+        if result['status'] == EXTRACT_FAILED:
+            return EXTRACT_FAILED
+        for table_name, count in result['records'].items():
+            records[table_name] += count
+
+    return EXTRACT_SUCCESS if all(records.values()) else EXTRACT_EMPTY
+
+
+def run_extracts(spec_names, start_date, end_date, auth, base_url, headers, output_directory, salt=None,
+                 max_workers=3, watermark_db=None, replay=False, address_cache=None):
+    """
+    Runs several extracts concurrently in one process over a shared, pooled HTTP session.
+
+    At most `max_workers` extracts run (and so query the DataExchange server) at the same time.
+    An extract that fails does not stop the others. Without a start and end date the extracts are
+    incremental: each spec is queried from its own watermark in `watermark_db` up to now. With `replay`
+    the archived responses are reprocessed instead (see `replay_extract`) and the API is not queried.
+
+    Parameters:
+    spec_names (list): The names of the extract specs to run.
+    start_date (datetime): Start datetime for the queries, or None for incremental extracts.
+    end_date (datetime): End datetime for the queries, or None for incremental extracts.
+    auth (tuple): Authentication credentials for the API.
+    base_url (str): Base URL for the API.
+    headers (dict): Headers for the API requests.
+    output_directory (str): Directory for saving the hashed CSV files.
+    salt (str, optional): Salt for hashing. Default is None.
+    max_workers (int, optional): Maximum number of extracts running at once. Defaults to 3.
+    watermark_db (str, optional): Path to the raw tables SQLite database holding the watermarks. Default is None.
+    replay (bool, optional): Replay the archived responses instead of querying the API. Default is False.
+    address_cache (AddressCache, optional): Cache shared by the extracts to leave out known address rows.
+                                            Not used for replays. Default is None.
+
+    Returns:
+    dict: A dictionary mapping each extract spec name to its outcome.
+    """
+    unknown = [spec_name for spec_name in spec_names if spec_name not in EXTRACT_SPECS]
+    if unknown:
+        raise ValueError(f"Unknown extract specs: {', '.join(unknown)}")
+    if (start_date is None or end_date is None) and not watermark_db and not replay:
+        raise ValueError("Incremental extracts need the watermark database")
+
+    def run(spec_name):
+        # Name the worker thread after the extract so log lines can be told apart
+        threading.current_thread().name = spec_name
+        try:
+            if replay:
+                return replay_extract(spec_name, start_date=start_date, end_date=end_date,
+                                      output_directory=output_directory, salt=salt)
+            if start_date is None or end_date is None:
+                spec_start_date, spec_end_date = incremental_date_range(spec_name, watermark_db)
+            else:
+                spec_start_date, spec_end_date = start_date, end_date
+            return run_extract(spec_name, start_date=spec_start_date, end_date=spec_end_date, session=session,
+                               base_url=base_url, output_directory=output_directory, salt=salt,
+                               watermark_db=watermark_db, address_cache=address_cache)
+        except Exception as e:
+            logging.critical(f"Critical error while running extract {spec_name}: {e}")
+            return EXTRACT_FAILED
+
+    logging.info(f"Running {len(spec_names)} extracts with at most {max_workers} at a time")
+    session = create_session(auth=auth, headers=headers, max_connections=max_workers)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = dict(zip(spec_names, executor.map(run, spec_names)))
+    finally:
+        session.close()
+
+    for spec_name, status in results.items():
+        logging.info(f"Extract {spec_name} finished with status: {status}")
+    return results
@@ -0,0 +1,289 @@
+"""
+Extract Specification Module
+
+This module holds the definition of every extract run against the Motorola Spillman Flex
+DataExchange API. Each extract spec is keyed by the name of its extract script and describes
+the XML query that is sent to the API and the tables that are parsed from the response,
+together with the output CSV file and the columns to hash for each table.
+
+The query of a spec is the part of the `PublicSafetyEnvelope` inside the `Query` element. It
+contains `{start_date}` and `{end_date}` placeholders for the date range of the extract, and is
+wrapped in the envelope by `build_query`.
+
+The `watermark_column` of a spec names the table and date column its query filters on. The newest
+date found in that column is the spec's next watermark (see `src_extract_watermarks`). Specs that
+filter on a table which is not saved, like the traffic stops, have no watermark column and use the
+end of the queried window instead.
+
+Queries filter on the date a record was last modified wherever the queried table has one, so a
+record edited after it occurred is extracted again. Tables without a modification date filter on
+the date the record occurred, and their spec has a `lookback`: incremental extracts start that long
+before the watermark, so records edited within the lookback are picked up. Reloading the overlap is
+safe as the load is an upsert.
+"""
+import os
+from datetime import timedelta
+
+QUERY_ENVELOPE = '''<?xml version="1.0" encoding="UTF-8"?>
+<PublicSafetyEnvelope version="1.0">
+    <MessageIdentification/>
+    <From>Ecom 911</From>
+    <To/>
+    <Creation/>
+    <PublicSafety id="">
+        <Query modby="true" modwhen="true" addby="true" addwhen="true">
+{query}
+        </Query>
+    </PublicSafety>
+</PublicSafetyEnvelope>'''
+
+EXTRACT_SPECS = {
+    "extract_cad_master_call_table": {
+        'watermark_column': ('CADMasterCallTable', 'TimeDateRecordLastModified'),
+        'query': '''
+            <CADMasterCallTable>
+                <CityCode search_type="equal_to">HAZ</CityCode>
+                <TimeDateRecordLastModified search_type="between">
+                    <SearchValue>{start_date}</SearchValue>
+                    <SearchValue>{end_date}</SearchValue>
+                </TimeDateRecordLastModified>
+                <GeobaseAddressIDMaintenance parentField="GeobaseAddressID" childField="IDNumberOfAddress"></GeobaseAddressIDMaintenance>
+            </CADMasterCallTable>''',
+        'files_to_hash': {
+            "CADMasterCallTable": {'output_file': 'hashed_CADMasterCallTable_main.csv',
+                                   'columns_to_hash': ["RecordNumber", "CallTaker", "ComplainantNameNumber",
+                                                       "PersonToContact", "PersonToContactPhone",
+                                                       "PlateNumberOfStoppedVeh", "UserWhoLastModifiedRecord"
+                                                       ]},
+            "GeobaseAddressIDMaintenance": {'output_file': 'hashed_GeobaseAddressIDMaintenance_cdcall.csv',
+                                            'columns_to_hash': []
+                                            },
+        }
+    },
+    "extract_cad_traffic_stops": {
+        # The traffic stops are joined to the incidents they belong to, so edits of a stop are only picked up
+        # with an edit of its incident, or within the lookback
+        'lookback': timedelta(days=7),
+        'query': '''
+            <LawIncidentTable>
+                <AgencyCode search_type="equal_to">HCPD</AgencyCode>
+                <IncidentNature search_type="equal_to">Traffic Stop</IncidentNature>
+                <TimeDateLastModified search_type="between">
+                    <SearchValue>{start_date}</SearchValue>
+                    <SearchValue>{end_date}</SearchValue>
+                </TimeDateLastModified>
+                <CADTrafficStopTable parentField="LongTermCallID" childField="LongTermCallID"></CADTrafficStopTable>
+                <GeobaseAddressIDMaintenance parentField="GeobaseAddressID" childField="IDNumberOfAddress"></GeobaseAddressIDMaintenance>
+            </LawIncidentTable>''',
+        'files_to_hash': {
+            "CADTrafficStopTable": {'output_file': 'hashed_CADTrafficStopTable_main.csv',
+                                    'columns_to_hash': ["CallTaker", "PlateNumberOfStoppedVeh",
+                                                        "UnitNumber", "UserWhoLastModifiedRecord",
+                                                        "LongTermCallID"
+                                                        ]
+                                    },
+            "GeobaseAddressIDMaintenance": {'output_file': 'hashed_GeobaseAddressIDMaintenance_cdtrstop.csv',
+                                            'columns_to_hash': []
+                                            },
+        }
+    },
+    "extract_master_citation_table": {
+        'watermark_column': ('MasterCitationTable', 'TimeDateLastModified'),
+        'query': '''
+            <MasterCitationTable>
+                <AgencyCode search_type="equal_to">HCPD</AgencyCode>
+                <TimeDateLastModified search_type="between">
+                    <SearchValue>{start_date}</SearchValue>
+                    <SearchValue>{end_date}</SearchValue>
+                </TimeDateLastModified>
+                <MainNamesTable parentField="NameNumber" childField="NameNumber"></MainNamesTable>
+            </MasterCitationTable>''',
+        'files_to_hash': {
+            "MasterCitationTable": {'output_file': 'hashed_MasterCitationTable_main.csv',
+                                    'columns_to_hash': ["CitationNumber", "IssuingOfficer", "NameNumber",
+                                                        "UserWhoLastModified", "VehicleNumber",
+                                                        "WhoAdded"
+                                                        ]},
+            "MainNamesTable": {'output_file': 'hashed_MainNamesTable_ctmain.csv',
+                               'columns_to_hash': ["NameNumber", "AliasNameNumber",
+                                                   "DriverLicenseNumber", "FBINumber",
+                                                   "FirstName", "LastName", "MiddleName",
+                                                   "RealName", "UserWhoAddedRecord",
+                                                   "UserWhoLastModifiedRecord", "WorkTelephoneNumber"
+                                                   ]}
+        }
+    },
+    "extract_jail_offense_table": {
+        'watermark_column': ('JailOffenseTable', 'TimeDateRecordLastModified'),
+        'query': '''
+            <JailOffenseTable>
+                <Agency search_type="equal_to">HCPD</Agency>
+                <TimeDateRecordLastModified search_type="between">
+                    <SearchValue>{start_date}</SearchValue>
+                    <SearchValue>{end_date}</SearchValue>
+                </TimeDateRecordLastModified>
+                <JailInmateTable parentField="InmateNumber" childField="Number"></JailInmateTable>
+            </JailOffenseTable>''',
+        'files_to_hash': {
+            "JailOffenseTable": {'output_file': 'hashed_JailOffenseTable.csv',
+                                 'columns_to_hash': ["OffenseNumber", "CourtDocketNumber",
+                                                     "InmateNumber", "UserWhoAddedRecord",
+                                                     "UserWhoLastModifiedRecord", "WarrantNumber"
+                                                     ]},
+            "JailInmateTable": {'output_file': 'hashed_JailInmateTable.csv',
+                                'columns_to_hash': ["Number", "NameNumber"
+                                                    ]}
+        }
+    },
+    "extract_law_incident_table_law_offense_detail_table": {
+        'watermark_column': ('LawIncidentTable', 'TimeDateLastModified'),
+        'query': '''
+            <LawIncidentTable>
+                <AgencyCode search_type="equal_to">HCPD</AgencyCode>
+                <TimeDateLastModified search_type="between">
+                    <SearchValue>{start_date}</SearchValue>
+                    <SearchValue>{end_date}</SearchValue>
+                </TimeDateLastModified>
+                <GeobaseAddressIDMaintenance parentField="GeobaseAddressID" childField="IDNumberOfAddress"></GeobaseAddressIDMaintenance>
+                <LawIncidentOffensesDetail parentField="IncidentNumber" childField="IncidentNumber"></LawIncidentOffensesDetail>
+            </LawIncidentTable>''',
+        'files_to_hash': {
+            "LawIncidentTable": {'output_file': 'hashed_LawIncidentTable_main.csv',
+                                 'columns_to_hash': ["ComplainantNameNumber", "ContactOrCaller",
+                                                     "LongTermCallID", "ResponsibleOfficer",
+                                                     "UserWhoLastModified", "ReceivedBy"
+                                                     ]
+                                 },
+            "GeobaseAddressIDMaintenance": {'output_file': 'hashed_GeobaseAddressIDMaintenance_lwmain_lwoffs.csv',
+                                            'columns_to_hash': []
+                                            },
+            "LawIncidentOffensesDetail": {'output_file': 'hashed_LawIncidentOffensesDetail_main.csv',
+                                          'columns_to_hash': ["UserWhoLastModified"]
+                                          }
+        }
+    },
+    "extract_officer_radio_log_table": {
+        # The radio log has no modification date, so entries are queried by the time of the status change
+        'watermark_column': ('OfficerRadioLogTable', 'TimeOfStatusChange'),
+        'lookback': timedelta(days=7),
+        'query': '''
+            <OfficerRadioLogTable>
+                <AgencyCode search_type="equal_to">HCPD</AgencyCode>
+                <TimeOfStatusChange search_type="between">
+                    <SearchValue>{start_date}</SearchValue>
+                    <SearchValue>{end_date}</SearchValue>
+                </TimeOfStatusChange>
+            </OfficerRadioLogTable>''',
+        'files_to_hash': {
+            "OfficerRadioLogTable": {'output_file': 'hashed_OfficerRadioLogTable_main.csv',
+                                     'columns_to_hash': ["LongTermCallID", "OfficerName",
+                                                         "UnitNumber", "UserWhoLoggedCall"
+                                                         ]}
+        }
+    },
+    "extract_table_of_involvements": {
+        # The involvements have no modification date, so they are queried by the date the involvement occurred
+        'watermark_column': ('TableOfInvolvements', 'DateInvolvementOccurred'),
+        'lookback': timedelta(days=7),
+        'query': '''
+            <TableOfInvolvements>
+                <TypeOfThisRecord search_type="equal_to">1200</TypeOfThisRecord>
+                <RtypeRelatedRecordsType search_type="equal_to">800</RtypeRelatedRecordsType>
+                <DateInvolvementOccurred search_type="between">
+                    <SearchValue>{start_date}</SearchValue>
+                    <SearchValue>{end_date}</SearchValue>
+                </DateInvolvementOccurred>
+            </TableOfInvolvements>''',
+        'files_to_hash': {
+            "TableOfInvolvements": {'output_file': 'hashed_TableOfInvolvements_ctmain.csv',
+                                    'columns_to_hash': ["RelIDRelatedRecordsID"]}
+        }
+    },
+    "extract_offender": {
+        'watermark_column': ('Offender', 'TimeDateRecordLastModified'),
+        'query': '''
+            <Offender>
+                <TimeDateRecordLastModified search_type="between">
+                    <SearchValue>{start_date}</SearchValue>
+                    <SearchValue>{end_date}</SearchValue>
+                </TimeDateRecordLastModified>
+                <MainNamesTable parentField="NameReference" childField="NameNumber"></MainNamesTable>
+            </Offender>''',
+        'files_to_hash': {
+            "Offender": {'output_file': 'hashed_Offender_main.csv',
+                         'columns_to_hash': ["DetailRecordReferenceNumber", "CleryParentContact",
+                                             "FirstNameOfOffender", "GuardianNameReference",
+                                             "LastNameOfOffender", "MiddleNameOfOffender",
+                                             "NameReference", "UserWhoAddedRecord",
+                                             "UserWhoLastModifiedRecord", "VehicleLicenseNumber",
+                                             "VehicleReference", "WantNumber"
+                                             ]
+                         },
+            "MainNamesTable": {'output_file': 'hashed_MainNamesTable_Offender.csv',
+                               'columns_to_hash': ['NameNumber', 'AliasNameNumber', 'DriverLicenseNumber',
+                                                   'FBINumber', 'FirstName', 'LastName', 'MiddleName',
+                                                   'RealName', 'UserWhoAddedRecord', 'UserWhoLastModifiedRecord',
+                                                   'WorkTelephoneNumber'
+                                                   ]}
+        }
+    },
+    "extract_victim": {
+        'watermark_column': ('Victim', 'TimeDateRecordLastModified'),
+        'query': '''
+            <Victim>
+                <TimeDateRecordLastModified search_type="between">
+                    <SearchValue>{start_date}</SearchValue>
+                    <SearchValue>{end_date}</SearchValue>
+                </TimeDateRecordLastModified>
+                <MainNamesTable parentField="NameReference" childField="NameNumber"></MainNamesTable>
+            </Victim>''',
+        'files_to_hash': {
+            "Victim": {'output_file': 'hashed_Victim.csv',
+                       'columns_to_hash': ['DetailRecordReferenceNumber', 'FirstNameOfVictim',
+                                           'GuardianNameReference', 'LastNameOfVictim',
+                                           'MiddleNameOfVictim', 'NameReference',
+                                           'ReportedBy', 'UserWhoAddedRecord',
+                                           'UserWhoLastModifiedRecord'
+                                           ]},
+            "MainNamesTable": {'output_file': 'hashed_MainNamesTable.csv',
+                               'columns_to_hash': ['NameNumber', 'AliasNameNumber', 'DriverLicenseNumber',
+                                                   'FBINumber', 'FirstName', 'LastName', 'MiddleName',
+                                                   'RealName', 'UserWhoAddedRecord', 'UserWhoLastModifiedRecord',
+                                                   'WorkTelephoneNumber'
+                                                   ]}
+        }
+    },
+}
+
+
+def build_query(spec_name, start_date, end_date):
+    """
+    Builds the XML query of an extract spec for a date range.
+
+    Parameters:
+    spec_name (str): The name of the extract spec.
+    start_date (str): Start datetime of the query, formatted as "%Y-%m-%d %H:%M:%S".
+    end_date (str): End datetime of the query, formatted as "%Y-%m-%d %H:%M:%S".
+
+    Returns:
+    str: The XML query to post to the API.
+    """
+    query = EXTRACT_SPECS[spec_name]['query'].format(start_date=start_date, end_date=end_date)
+    return QUERY_ENVELOPE.format(query=query)
+
+
+def get_spec_name(file_name):
+    """
+    Finds the extract spec that writes a file.
+
+    Parameters:
+    file_name (str): The name or path of the extracted CSV file.
+
+    Returns:
+    str: The name of the extract spec, or None if no spec writes the file, e.g. the prefixed files of a backfill.
+    """
+    file_name = os.path.basename(file_name)
+    for spec_name, spec in EXTRACT_SPECS.items():
+        if any(info['output_file'] == file_name for info in spec['files_to_hash'].values()):
+            return spec_name
+    return None
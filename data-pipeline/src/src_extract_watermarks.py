@@ -0,0 +1,145 @@
+"""
+Extract Watermark Module
+
+This module keeps the high-water mark of every extract spec in the raw tables SQLite database, so
+extracts only query the records added or modified since the last successful run instead of a fixed
+"yesterday" window. After a failed or skipped night the next run automatically catches up on the
+whole gap, and late edits are picked up as long as the spec filters on a last-modified date (or,
+for specs without one, within the `lookback` of the spec, see `src_extract_specs`).
+
+A watermark is moved in two steps so that it never gets ahead of the data:
+
+1. When an extract succeeds, the newest date it saw is stored as the *pending* watermark of its spec.
+2. When the load script has committed the extracted files to the raw tables, the pending watermark of
+   every spec whose files all loaded is promoted to the watermark.
+
+If a file of a spec fails to load, the watermark of that spec is left where it was and its next extract
+queries the same records again, while the other specs move on. Reloading them is safe because the load
+is an upsert.
+
+Table Schema (ExtractWatermarks):
+- SpecName: Name of the extract spec (primary key).
+- Watermark: Newest date of the last loaded extract, formatted as "%Y-%m-%d %H:%M:%S".
+- PendingWatermark: Newest date of the last extract that was not loaded yet.
+- WhenModified: When the row was last changed.
+"""
+import logging
+import os
+from datetime import datetime
+
+from src_sqlite_connection import connect
+
+# Format of the watermarks, the same as the dates in the XML query
+WATERMARK_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _connect(db_path):
+    """
+    Connects to the raw tables database and creates the watermark table if needed.
+
+    Parameters:
+    db_path (str): Path to the raw tables SQLite database.
+
+    Returns:
+    Connection: The database connection.
+    """
+    # Concurrent extracts may write their pending watermarks at the same time
+    connection = connect(db_path, timeout=60)
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS ExtractWatermarks (
+            "SpecName" TEXT PRIMARY KEY,
+            "Watermark" TEXT,
+            "PendingWatermark" TEXT,
+            "WhenModified" TEXT)""")
+    return connection
+
+
+def get_watermark(db_path, spec_name):
+    """
+    Returns the watermark of an extract spec.
+
+    Parameters:
+    db_path (str): Path to the raw tables SQLite database.
+    spec_name (str): The name of the extract spec.
+
+    Returns:
+    datetime: The watermark, or None if the spec has not been loaded yet or the database does not exist.
+    """
+    if not os.path.exists(db_path):
+        logging.warning(f"Raw tables database not found at {db_path}, no watermark for {spec_name}")
+        return None
+
+    connection = _connect(db_path)
+    try:
+        row = connection.execute('SELECT "Watermark" FROM ExtractWatermarks WHERE "SpecName" = ?',
+                                 (spec_name,)).fetchone()
+    finally:
+        connection.close()
+
+    if row is None or row[0] is None:
+        return None
+    return datetime.strptime(row[0], WATERMARK_DATE_FORMAT)
+
+
+def set_pending_watermark(db_path, spec_name, watermark):
+    """
+    Stores the newest date seen by an extract as the pending watermark of its spec.
+
+    Parameters:
+    db_path (str): Path to the raw tables SQLite database.
+    spec_name (str): The name of the extract spec.
+    watermark (datetime): The newest date seen by the extract.
+    """
+    if not os.path.exists(db_path):
+        logging.warning(f"Raw tables database not found at {db_path}, pending watermark of {spec_name} not saved")
+        return
+
+    connection = _connect(db_path)
+    try:
+        connection.execute("""
+            INSERT INTO ExtractWatermarks ("SpecName", "PendingWatermark", "WhenModified")
+            VALUES (?, ?, ?)
+            ON CONFLICT ("SpecName")
+            DO UPDATE SET "PendingWatermark" = excluded."PendingWatermark",
+                          "WhenModified" = excluded."WhenModified"
+            """, (spec_name, watermark.strftime(WATERMARK_DATE_FORMAT), datetime.now().strftime(WATERMARK_DATE_FORMAT)))
+        connection.commit()
+        logging.info(f"Pending watermark of {spec_name} set to {watermark}")
+    finally:
+        connection.close()
+
+
+def commit_pending_watermarks(db_path, held_specs=()):
+    """
+    Promotes the pending watermarks to the watermark of their spec. Call this only once the extracted
+    files have been committed to the raw tables.
+
+    Parameters:
+    db_path (str): Path to the raw tables SQLite database.
+    held_specs (iterable, optional): The specs whose files did not all load, whose watermarks are left
+                                     unchanged. Default is none.
+
+    Returns:
+    int: The number of watermarks advanced.
+    """
+    held_specs = set(held_specs)
+    when_modified = datetime.now().strftime(WATERMARK_DATE_FORMAT)
+    connection = _connect(db_path)
+    try:
+        advanced = 0
+        for spec_name, pending in connection.execute("""
+                SELECT "SpecName", "PendingWatermark" FROM ExtractWatermarks
+                WHERE "PendingWatermark" IS NOT NULL""").fetchall():
+            if spec_name in held_specs:
+                logging.warning(f"Not all files of {spec_name} were loaded, its watermark is not advanced")
+                continue
+            logging.info(f"Advancing watermark of {spec_name} to {pending}")
+            connection.execute("""
+                UPDATE ExtractWatermarks
+                SET "Watermark" = "PendingWatermark", "PendingWatermark" = NULL, "WhenModified" = ?
+                WHERE "SpecName" = ?""", (when_modified, spec_name))
+            advanced += 1
+        connection.commit()
+        return advanced
+    finally:
+        connection.close()
@@ -0,0 +1,149 @@
+"""
+File Profile Module
+
+This module keeps the profiles of the extracted CSV files: the row count of a file, the missing values of
+each column and the sketches of its columns (see src_profile_sketches). The extraction saves the profile of
+every hashed DataFrame as it writes it (`save_file_profile`), stamped with the size and modification time
+of the file, and the raw data validation report reads it back (`load_file_profile`) instead of reading the
+file again, as long as the file has not changed since (see src_create_report_raw_data). The profile also
+holds the length of the extract window the rows were returned for, in days, so the report can compare the
+row counts of extracts covering different windows.
+
+The profiles are saved as JSON files, one per CSV file, under the `script=validate_tables/profiles`
+directory of the reports.
+"""
+import json
+import logging
+import os
+
+import yaml
+
+from src_profile_sketches import ColumnSketch, merge_sketches, sketch_dataframe
+
+home = os.environ.get('HOME')
+
+# Load the YAML configuration file for paths
+with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
+    config = yaml.safe_load(file)
+
+# Directory of the profiles saved during the extraction
+profiles_dir = os.path.join(home, config['paths']['reports_dir'], "script=validate_tables", "profiles")
+
+
+def profile_dataframe(dataframe, sketches=True):
+    """
+    Computes the profile of a DataFrame: its row count, the missing values of each column and their sketches.
+
+    Args:
+    dataframe (DataFrame): The DataFrame to profile.
+    sketches (bool, optional): Compute the sketches of the columns. Default is True.
+
+    Returns:
+    dict: The profile, with 'total_rows', and 'missing_values' and serialized 'sketches' per column.
+    """
+    profile = {'total_rows': len(dataframe),
+               'missing_values': {column: int(count) for column, count in dataframe.isnull().sum().items()}}
+    if sketches:
+        profile['sketches'] = {column: sketch.to_dict() for column, sketch in sketch_dataframe(dataframe).items()}
+    return profile
+
+
+def merge_profiles(profile, other):
+    """
+    Merges the profiles of two parts of the same table.
+
+    Args:
+    profile (dict): The profile of the first part.
+    other (dict): The profile of the second part.
+
+    Returns:
+    dict: The profile of both parts, with sketches only if both parts have them.
+    """
+    missing_values = dict(profile['missing_values'])
+    for column, count in other['missing_values'].items():
+        missing_values[column] = missing_values.get(column, 0) + count
+    merged = {'total_rows': profile['total_rows'] + other['total_rows'], 'missing_values': missing_values}
+
+    if 'sketches' in profile and 'sketches' in other:
+        sketches = {column: ColumnSketch.from_dict(data) for column, data in profile['sketches'].items()}
+        merge_sketches(sketches, {column: ColumnSketch.from_dict(data) for column, data in other['sketches'].items()})
+        merged['sketches'] = {column: sketch.to_dict() for column, sketch in sketches.items()}
+    return merged
+
+
+def _profile_path(file_path):
+    """
+    Returns the path of the saved profile of a CSV file.
+    """
+    return os.path.join(profiles_dir, os.path.basename(file_path) + ".json")
+
+
+def save_file_profile(dataframe, file_path, previous_size=None, window=None):
+    """
+    Saves the profile of a DataFrame just written to a CSV file, so the report does not read the file again.
+
+    Args:
+    dataframe (DataFrame): The DataFrame written to the file.
+    file_path (str): The path of the CSV file.
+    previous_size (int, optional): The size of the file before the DataFrame was appended to it, or None if
+                                   the DataFrame was written to a new file. Default is None.
+    window (tuple, optional): The start and end datetime of the extract window the rows were returned for.
+                              Default is None.
+    """
+    try:
+        profile = profile_dataframe(dataframe)
+        if previous_size is not None:
+            # Rows appended to a file: add them to the profile of the file as it was before
+            previous = load_file_profile(file_path, size=previous_size)
+            if previous is None:
+                # The earlier rows were not profiled, so the report has to read the whole file
+                if os.path.exists(_profile_path(file_path)):
+                    os.remove(_profile_path(file_path))
+                return
+            profile = merge_profiles(previous, profile)
+
+        if window is not None:
+            start_date, end_date = window
+            profile['window_days'] = (end_date - start_date).total_seconds() / 86400
+        stat = os.stat(file_path)
+        profile.update({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+        os.makedirs(profiles_dir, exist_ok=True)
+        temporary_path = _profile_path(file_path) + f".{os.getpid()}.tmp"
+        with open(temporary_path, 'w') as file:
+            json.dump(profile, file)
+        os.replace(temporary_path, _profile_path(file_path))
+    except Exception as e:
+        logging.error(f"Error saving the profile of {file_path}, the report will read the file: {e}")
+
+
+def load_file_profile(file_path, size=None):
+    """
+    Reads the saved profile of a CSV file, if it still matches the file.
+
+    Args:
+    file_path (str): The path of the CSV file.
+    size (int, optional): Only match a profile of this file size, ignoring the modification time. Defaults to
+                          matching the size and modification time of the file.
+
+    Returns:
+    dict: The profile, with the 'window_days' of the extract if it is known, or None if there is none, the file
+          changed since it was saved or the profile has no sketches.
+    """
+    try:
+        with open(_profile_path(file_path), 'r') as file:
+            profile = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if size is not None:
+        matches = profile.get('size') == size
+    else:
+        stat = os.stat(file_path)
+        matches = (profile.get('size'), profile.get('mtime_ns')) == (stat.st_size, stat.st_mtime_ns)
+    if not matches or 'sketches' not in profile:
+        return None
+    loaded = {'total_rows': profile['total_rows'], 'missing_values': profile['missing_values'],
+              'sketches': profile['sketches']}
+    if 'window_days' in profile:
+        loaded['window_days'] = profile['window_days']
+    return loaded
@@ -0,0 +1,178 @@
+"""
+Load Manifest Module
+
+This module keeps a manifest of the extracted CSV files that have been loaded into the raw tables, so
+the load script only loads new files. Without it every file left in `extracted_csv_dir` is loaded
+again every night, including the stale files of earlier nights that stay in place when an extract
+has nothing new to save.
+
+A file is skipped if:
+
+- its path, size and modification time match a manifest entry, which is checked without reading the
+  file, or
+- its content hash matches the last file loaded from the same path, e.g. when an extract rewrote the
+  same data. The entry is then refreshed so the next check is again done without reading the file.
+
+Content is only compared with the last file loaded from the same path, never with any file ever loaded
+into the table: if a file changes from A to B and back to A, the second A must be loaded again to undo B.
+
+Only files loaded without failed rows are recorded, so files with rows in the LoadQuarantine table
+are loaded again on the next run.
+
+Table Schema (LoadManifest):
+- FilePath: Path of the loaded file (primary key).
+- FileSize: Size of the file in bytes.
+- FileModified: Modification time of the file, in nanoseconds since the epoch.
+- ContentHash: SHA-256 digest of the content of the file.
+- TableName: Name of the table the file was loaded into.
+- RowsLoaded: Number of rows loaded from the file.
+- WhenLoaded: When the file was loaded.
+"""
+import hashlib
+import logging
+import os
+import shutil
+from datetime import datetime
+
+from src_sqlite_connection import connect
+
+# Number of bytes read at a time when hashing a file
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def _connect(db_path):
+    """
+    Connects to the raw tables database and creates the manifest table if needed.
+
+    Parameters:
+    db_path (str): Path to the raw tables SQLite database.
+
+    Returns:
+    Connection: The database connection.
+    """
+    connection = connect(db_path, timeout=60)
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS LoadManifest (
+            "FilePath" TEXT PRIMARY KEY,
+            "FileSize" INTEGER,
+            "FileModified" INTEGER,
+            "ContentHash" TEXT,
+            "TableName" TEXT,
+            "RowsLoaded" INTEGER,
+            "WhenLoaded" TEXT)""")
+    return connection
+
+
+def file_hash(file_path):
+    """
+    Computes the SHA-256 digest of the content of a file.
+
+    Parameters:
+    file_path (str): Path to the file.
+
+    Returns:
+    str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class LoadManifest:
+    """
+    The files already loaded into the raw tables, read once so each file is checked in constant time.
+
+    Parameters:
+    db_path (str): Path to the raw tables SQLite database.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        connection = _connect(db_path)
+        try:
+            rows = connection.execute("""
+                SELECT "FilePath", "FileSize", "FileModified", "ContentHash", "TableName"
+                FROM LoadManifest""").fetchall()
+            connection.commit()
+        finally:
+            connection.close()
+        self.files = {path: (size, modified, content_hash) for path, size, modified, content_hash, _ in rows}
+        logging.info(f"Opened load manifest with {len(self.files)} loaded files")
+
+    def is_loaded(self, file_path, table_name):
+        """
+        Checks whether a file has already been loaded into a table.
+
+        Parameters:
+        file_path (str): Path to the CSV file.
+        table_name (str): Name of the table the file is loaded into.
+
+        Returns:
+        tuple: Whether the file is already loaded, and the content hash of the file, or None if the file
+               was recognized without reading it.
+        """
+        status = os.stat(file_path)
+        loaded = self.files.get(file_path)
+        if loaded is not None and loaded[:2] == (status.st_size, status.st_mtime_ns):
+            return True, None
+
+        content_hash = file_hash(file_path)
+        if loaded is not None and loaded[2] == content_hash:
+            # Same data written again, remember the new file so it is recognized without reading it next time
+            self.record(file_path, table_name, None, content_hash)
+            return True, content_hash
+        return False, content_hash
+
+    def record(self, file_path, table_name, rows_loaded, content_hash=None):
+        """
+        Records a file as loaded.
+
+        Parameters:
+        file_path (str): Path to the loaded CSV file.
+        table_name (str): Name of the table the file was loaded into.
+        rows_loaded (int): Number of rows loaded from the file, or None to keep the recorded number.
+        content_hash (str, optional): The content hash of the file, computed if not given.
+        """
+        status = os.stat(file_path)
+        if content_hash is None:
+            content_hash = file_hash(file_path)
+
+        connection = _connect(self.db_path)
+        try:
+            connection.execute("""
+                INSERT INTO LoadManifest ("FilePath", "FileSize", "FileModified", "ContentHash", "TableName",
+                                          "RowsLoaded", "WhenLoaded")
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT ("FilePath")
+                DO UPDATE SET "FileSize" = excluded."FileSize", "FileModified" = excluded."FileModified",
+                              "ContentHash" = excluded."ContentHash", "TableName" = excluded."TableName",
+                              "RowsLoaded" = COALESCE(excluded."RowsLoaded", "RowsLoaded"),
+                              "WhenLoaded" = excluded."WhenLoaded"
+                """, (file_path, status.st_size, status.st_mtime_ns, content_hash, table_name, rows_loaded,
+                      datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            connection.commit()
+        finally:
+            connection.close()
+
+        self.files[file_path] = (status.st_size, status.st_mtime_ns, content_hash)
+
+
+def archive_loaded_file(file_path, archive_dir):
+    """
+    Moves a loaded file to a dated subdirectory of the archive directory.
+
+    Parameters:
+    file_path (str): Path to the loaded CSV file.
+    archive_dir (str): Directory the loaded files are archived to.
+
+    Returns:
+    str: The path of the archived file.
+    """
+    dated_dir = os.path.join(archive_dir, datetime.now().strftime("%Y%m%d"))
+    os.makedirs(dated_dir, exist_ok=True)
+    archived_path = os.path.join(dated_dir, os.path.basename(file_path))
+    shutil.move(file_path, archived_path)
+    logging.info(f"Archived loaded file {file_path} to {archived_path}")
+    return archived_path
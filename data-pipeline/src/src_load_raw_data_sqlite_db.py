@@ -7,7 +7,14 @@ equipped to handle various tables and CSV file formats, making it versatile for
 
 Functions:
 - create_upsert_query(table_name, columns, primary_key): Creates a SQL UPSERT (insert or update) query for a given table, columns, and primary key.
-- process_csv(file_name, table_name, primary_key, db_path): Processes a CSV file and inserts its data into an SQLite database.
+- process_csv(file_name, table_name, primary_key, db_path, batch_size, commit_per_file): Processes a CSV file and inserts its data into an SQLite database in batches.
+- create_load_tables(cursor): Creates the LoadQuarantine, LoadStatistics, RowFingerprints and ChangedKeys tables if needed.
+- upsert_rows(cursor, upsert_query, rows): Upserts rows at once, splitting the rows to isolate the ones that fail.
+- quarantine_rows(cursor, file_name, table_name, headers, failed_rows): Saves rows that could not be loaded to the LoadQuarantine table, counting those quarantined before.
+- create_merge_query(table_name, columns, primary_key, staging_table): Creates a set-based merge of a staging table into a table.
+- row_fingerprint(headers, row): Computes the content fingerprint of a row.
+- key_expression(key_columns, alias): Creates the SQL expression of the primary key stored with fingerprints and changed keys.
+- merge_csv(file_name, table_name, primary_key, db_path, batch_size, run_id): Loads a CSV file through a staging table and a set-based merge.
 - get_primary_key(file_name): Determines the primary key(s) for a table based on the CSV file name.
 - get_table_name(file_name): Retrieves the table name based on a given file name.
 
@@ -17,18 +24,26 @@ Note:
     to the database schema. Modifications may be required to match different naming conventions or database structures.
 """
 import csv
+import hashlib
+import json
 import sqlite3
 import logging
 import yaml
 import os
+from collections import Counter
 from datetime import datetime
 
+from src_sqlite_connection import connect
+
 home = os.environ.get('HOME')
 
 # Load the YAML configuration file for paths
 with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
     config = yaml.safe_load(file)
 
+# Number of rows upserted at a time by process_csv
+DEFAULT_BATCH_SIZE = 10000
+
 # Function to create dynamic insert query based on CSV headers
 def create_upsert_query(table_name, columns, primary_key):
     """
@@ -70,16 +85,173 @@ def create_upsert_query(table_name, columns, primary_key):
         raise
 
 
+def create_load_tables(cursor):
+    """
+    Creates the tables the loads report to, if they do not exist yet.
+
+    Parameters:
+    cursor (Cursor): Cursor of a connection to the raw tables database.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS LoadQuarantine (
+            "FileName" TEXT,
+            "LineNumber" INTEGER,
+            "TableName" TEXT,
+            "RowData" TEXT,
+            "Error" TEXT,
+            "WhenQuarantined" TEXT)""")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS LoadStatistics (
+            "FileName" TEXT,
+            "TableName" TEXT,
+            "Inserted" INTEGER,
+            "Updated" INTEGER,
+            "Unchanged" INTEGER,
+            "Failed" INTEGER,
+            "WhenLoaded" TEXT)""")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS RowFingerprints (
+            "TableName" TEXT,
+            "PrimaryKey" TEXT,
+            "Fingerprint" TEXT,
+            PRIMARY KEY ("TableName", "PrimaryKey"))""")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ChangedKeys (
+            "RunID" TEXT,
+            "TableName" TEXT,
+            "PrimaryKey" TEXT,
+            "ChangeType" TEXT,
+            "WhenChanged" TEXT)""")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS ChangedKeys_RunID ON ChangedKeys ("RunID", "TableName")""")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS LoadQuarantine_Row ON LoadQuarantine ("TableName", "RowData")""")
+
+
+def row_fingerprint(headers, row):
+    """
+    Computes the content fingerprint of a row. The fingerprint does not depend on the order of the columns.
+
+    Parameters:
+    headers (list): The column names of the CSV file.
+    row (list): The values of the row.
+
+    Returns:
+    str: The SHA-1 hex digest of the row.
+    """
+    content = json.dumps(dict(zip(headers, row)), sort_keys=True)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def key_expression(key_columns, alias):
+    """
+    Creates the SQL expression of the primary key of a row as stored in the RowFingerprints and ChangedKeys
+    tables: the key value itself for single-column keys, or a JSON array of the values for composite keys.
+
+    Parameters:
+    key_columns (list): The primary key columns.
+    alias (str): The alias of the table the columns are read from.
+
+    Returns:
+    str: The SQL expression.
+    """
+    if len(key_columns) == 1:
+        return f'{alias}."{key_columns[0]}"'
+    values = ', '.join([f'{alias}."{pk}"' for pk in key_columns])
+    return f"json_array({values})"
+
+
+def upsert_rows(cursor, upsert_query, rows):
+    """
+    Upserts rows in one statement, isolating the rows that fail by splitting them in halves.
+
+    The rows are upserted with `executemany` inside a savepoint. If that fails, the savepoint is rolled
+    back and both halves of the rows are upserted the same way, recursively, until the failing rows are
+    left on their own. A clean batch therefore costs one statement, and a batch with a few bad rows only
+    a few more, while every good row is still loaded.
+
+    Parameters:
+    cursor (Cursor): Cursor of a connection that is in a transaction.
+    upsert_query (str): The UPSERT query, as created by create_upsert_query.
+    rows (list): The rows to upsert, as (line number, row) tuples.
+
+    Returns:
+    tuple: The number of rows upserted, and a list of (line number, row, error message) tuples for the
+           rows that failed.
+    """
+    cursor.execute("SAVEPOINT upsert_rows")
+    try:
+        cursor.executemany(upsert_query, [row for _, row in rows])
+        cursor.execute("RELEASE upsert_rows")
+        return len(rows), []
+    except sqlite3.Error as e:
+        cursor.execute("ROLLBACK TO upsert_rows")
+        cursor.execute("RELEASE upsert_rows")
+        if len(rows) == 1:
+            line_number, row = rows[0]
+            return 0, [(line_number, row, str(e))]
+
+    middle = len(rows) // 2
+    first_upserted, first_failed = upsert_rows(cursor, upsert_query, rows[:middle])
+    second_upserted, second_failed = upsert_rows(cursor, upsert_query, rows[middle:])
+    return first_upserted + second_upserted, first_failed + second_failed
+
+
+def quarantine_rows(cursor, file_name, table_name, headers, failed_rows):
+    """
+    Saves rows that could not be loaded to the LoadQuarantine table of the raw tables database.
+
+    A row that was already quarantined by an earlier load is settled: it failed again when it was loaded
+    again, so loading it once more will not help, and it is left in LoadQuarantine to be fixed by hand.
+
+    Parameters:
+    cursor (Cursor): Cursor of a connection to the raw tables database.
+    file_name (str): Path to the CSV file the rows come from.
+    table_name (str): Name of the table the rows were loaded into.
+    headers (list): The column names of the CSV file.
+    failed_rows (list): The (line number, row, error message) tuples of the failed rows.
+
+    Returns:
+    int: The number of settled rows, those already quarantined by an earlier load.
+    """
+    when_quarantined = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    quarantined = [(os.path.basename(file_name), line_number, table_name,
+                    json.dumps(dict(zip(headers, row)) if len(row) == len(headers) else row),
+                    error, when_quarantined)
+                   for line_number, row, error in failed_rows]
+    settled = sum(cursor.execute("""
+        SELECT EXISTS (SELECT 1 FROM LoadQuarantine WHERE "TableName" = ? AND "RowData" = ?)""",
+                                 (table_name, row_data)).fetchone()[0]
+                  for _, _, table_name, row_data, _, _ in quarantined)
+    cursor.executemany("""
+        INSERT INTO LoadQuarantine ("FileName", "LineNumber", "TableName", "RowData", "Error", "WhenQuarantined")
+        VALUES (?, ?, ?, ?, ?, ?)""", quarantined)
+    return settled
+
+
 # Function to process the CSV file and insert data into the database
-def process_csv(file_name, table_name, primary_key, db_path):
+def process_csv(file_name, table_name, primary_key, db_path, batch_size=DEFAULT_BATCH_SIZE, commit_per_file=False):
     """
     Processes a CSV file and inserts its data into an SQLite database.
 
+    Rows are read in batches of `batch_size` and upserted with `executemany`. Each batch is committed as
+    one transaction, or with `commit_per_file` the whole file is committed as one transaction. If a batch
+    fails, it is split until the failing rows are isolated (see upsert_rows), so a bad row only loses
+    itself. Failed rows are saved, with their file, line number and SQLite error, to the LoadQuarantine
+    table in the same transaction. A summary of the inserted and failed rows is logged instead of a
+    line per row.
+
     Parameters:
     file_name (str): Path to the CSV file.
     table_name (str): Name of the SQLite table to insert data into.
     primary_key (str or list): Primary key of the table.
     db_path (str): Path to the SQLite database file.
+    batch_size (int, optional): Number of rows upserted at a time. Defaults to DEFAULT_BATCH_SIZE.
+    commit_per_file (bool, optional): Commit the whole file at once instead of each batch. Default is False.
+
+    Returns:
+    tuple: The number of rows successfully inserted, the number of rows that failed, and the number of failed
+           rows that were settled (see quarantine_rows).
     """
     try:
         logging.info(f"Processing CSV file: {file_name}")
@@ -89,37 +261,269 @@ def process_csv(file_name, table_name, primary_key, db_path):
             headers = next(reader)  # Get the first row which is the header
             logging.info("CSV file opened and headers read.")
 
-            # Connect to the SQLite database
-            connection = sqlite3.connect(db_path)
+            # Connect to the SQLite database, managing the transactions explicitly
+            connection = connect(db_path, profile="bulk-load", isolation_level=None)
             cursor = connection.cursor()
             logging.info("Database connection established.")
 
             # Create dynamic insert query
             upsert_query = create_upsert_query(table_name, headers, primary_key)
 
-            # Initialize a counter for successful inserts
+            # Initialize counters for successful and failed inserts, and the errors by message
             successful_inserts = 0
-
-            # Insert each row from the CSV into the database one by one
-            for row in reader:
-                try:
-                    cursor.execute(upsert_query, row)
-                    connection.commit()  # Commit after each successful insert
-                    successful_inserts += 1
-                    logging.info(f"Row inserted successfully: {row}")
-                except Exception as e:
-                    logging.error(f"Error inserting row {row}: {e}")
-
-            connection.close()
-            logging.info("Database connection closed.")
+            failed_inserts = 0
+            settled_inserts = 0
+            errors = Counter()
+
+            try:
+                create_load_tables(cursor)
+                cursor.execute("BEGIN")
+                # Rows upserted here bypass change detection, so their fingerprints can no longer be trusted
+                cursor.execute('DELETE FROM RowFingerprints WHERE "TableName" = ?', (table_name,))
+                while True:
+                    # Remember the line of each row so failures can be reported by line number
+                    batch = []
+                    for row in reader:
+                        batch.append((reader.line_num, row))
+                        if len(batch) == batch_size:
+                            break
+                    if not batch:
+                        break
+
+                    # Upsert the batch at once, isolating and quarantining the rows that fail
+                    upserted, failed_rows = upsert_rows(cursor, upsert_query, batch)
+                    successful_inserts += upserted
+                    if failed_rows:
+                        settled_inserts += quarantine_rows(cursor, file_name, table_name, headers, failed_rows)
+                        failed_inserts += len(failed_rows)
+                        for line_number, _, error in failed_rows:
+                            errors[error] += 1
+                            logging.error(f"Error inserting row at line {line_number} of {file_name}: {error}")
+
+                    if not commit_per_file:
+                        cursor.execute("COMMIT")
+                        cursor.execute("BEGIN")
+                cursor.execute("COMMIT")
+            except Exception:
+                if connection.in_transaction:
+                    cursor.execute("ROLLBACK")
+                raise
+            finally:
+                connection.close()
+                logging.info("Database connection closed.")
 
             logging.info(f"Total number of rows successfully inserted: {successful_inserts}")
+            if failed_inserts:
+                logging.warning(f"Total number of rows that failed and were quarantined: {failed_inserts}. "
+                                f"Errors: {dict(errors)}")
 
         logging.info(f"Successfully processed and inserted data from {file_name} into {table_name}")
+        return successful_inserts, failed_inserts, settled_inserts
     except Exception as e:
         logging.error(f"Error processing CSV file {file_name}: {e}")
         raise
 
+
+def create_merge_query(table_name, columns, primary_key, staging_table):
+    """
+    Creates a set-based merge of a staging table into a table: every staged row that is not unchanged
+    is inserted, or updates the row with the same primary key.
+
+    Parameters:
+    table_name (str): The name of the SQLite table.
+    columns (list): A list of column names for the table.
+    primary_key (str or list): The primary key of the table, either a single column name or a list for composite keys.
+    staging_table (str): The name of the staging table, holding the columns and a "_load_status" column.
+
+    Returns:
+    str: A SQL INSERT ... SELECT ... ON CONFLICT query string.
+    """
+    key_columns = primary_key if isinstance(primary_key, list) else [primary_key]
+    column_names = ', '.join([f'"{column}"' for column in columns])
+    conflict_target = ', '.join([f'"{pk}"' for pk in key_columns])
+    update_columns = [f'"{column}" = excluded."{column}"' for column in columns if column not in key_columns]
+
+    # The WHERE clause is required by SQLite to tell the ON CONFLICT clause apart from a join constraint
+    return f"""
+        INSERT INTO {table_name} ({column_names})
+        SELECT {column_names} FROM {staging_table}
+        WHERE "_load_status" != 'unchanged'
+        ORDER BY "_load_line"
+        ON CONFLICT ({conflict_target})
+        DO {'UPDATE SET ' + ', '.join(update_columns) if update_columns else 'NOTHING'}"""
+
+
+def merge_csv(file_name, table_name, primary_key, db_path, batch_size=DEFAULT_BATCH_SIZE, run_id=None):
+    """
+    Loads a CSV file into an SQLite table through a staging table and a set-based merge.
+
+    The rows are bulk-inserted into a temporary staging table with their content fingerprint, the last row
+    of each primary key is kept, and every staged row is classified in SQL as inserted (new key), unchanged
+    or updated. A row is unchanged if its fingerprint matches the one stored in the RowFingerprints table
+    for its key, or, for rows loaded before they had a fingerprint, if it is identical to the row in the
+    table. A single INSERT ... SELECT ... ON CONFLICT statement then merges the inserted and updated
+    rows, so SQLite does the work in one pass and unchanged rows are not written at all. The whole file
+    is one transaction.
+
+    The keys of the inserted and updated rows are published to the ChangedKeys table under the run ID,
+    so later stages can process only the rows that changed.
+
+    Rows that cannot be staged, and rows that fail the merge, are isolated and saved to the
+    LoadQuarantine table like in process_csv. The counts of the load are saved to the LoadStatistics table.
+
+    Parameters:
+    file_name (str): Path to the CSV file.
+    table_name (str): Name of the SQLite table to merge the data into.
+    primary_key (str or list): Primary key of the table.
+    db_path (str): Path to the SQLite database file.
+    batch_size (int, optional): Number of rows staged at a time. Defaults to DEFAULT_BATCH_SIZE.
+    run_id (str, optional): The ID the changed keys are published under. Defaults to the current time.
+
+    Returns:
+    dict: The number of rows inserted, updated, unchanged and failed, and the number of failed rows that were
+          settled (see quarantine_rows).
+    """
+    try:
+        logging.info(f"Merging CSV file: {file_name}")
+        key_columns = primary_key if isinstance(primary_key, list) else [primary_key]
+        staging_table = f'temp."staging_{table_name}"'
+        if run_id is None:
+            run_id = datetime.now().strftime("%Y%m%dT%H%M%S")
+
+        with open(file_name, 'r') as file:
+            reader = csv.reader(file)
+            headers = next(reader)
+
+            connection = connect(db_path, profile="bulk-load", isolation_level=None)
+            cursor = connection.cursor()
+            failed_rows = []
+            try:
+                create_load_tables(cursor)
+                cursor.execute("BEGIN")
+
+                # Stage the rows in bulk, with their line number for reporting and ordering, and their fingerprint
+                column_names = ', '.join([f'"{column}"' for column in headers])
+                cursor.execute(f'DROP TABLE IF EXISTS {staging_table}')
+                cursor.execute(f"""
+                    CREATE TABLE {staging_table} (
+                        {column_names}, "_load_line" INTEGER, "_load_fingerprint" TEXT, "_load_status" TEXT)""")
+                staging_query = f"""
+                    INSERT INTO {staging_table} ({column_names}, "_load_line", "_load_fingerprint")
+                    VALUES ({', '.join(['?'] * (len(headers) + 2))})"""
+                while True:
+                    batch = []
+                    for row in reader:
+                        batch.append((reader.line_num, [*row, reader.line_num, row_fingerprint(headers, row)]))
+                        if len(batch) == batch_size:
+                            break
+                    if not batch:
+                        break
+                    _, failed = upsert_rows(cursor, staging_query, batch)
+                    failed_rows.extend((line_number, row[:-2], error) for line_number, row, error in failed)
+
+                # Keep the last row of each key, as a row-by-row upsert would
+                key_list = ', '.join([f'"{pk}"' for pk in key_columns])
+                cursor.execute(f"""
+                    DELETE FROM {staging_table} WHERE "_load_line" NOT IN (
+                        SELECT MAX("_load_line") FROM {staging_table} GROUP BY {key_list})""")
+
+                # Classify every staged row against the table, by fingerprint or else by comparing the row
+                staged_key = key_expression(key_columns, "staged")
+                key_match = ' AND '.join([f'target."{pk}" = staged."{pk}"' for pk in key_columns])
+                row_match = ' AND '.join([f'target."{column}" IS staged."{column}"' for column in headers])
+                cursor.execute(f"""
+                    UPDATE {staging_table} AS staged SET "_load_status" = CASE
+                        WHEN NOT EXISTS (SELECT 1 FROM {table_name} AS target WHERE {key_match}) THEN 'inserted'
+                        WHEN EXISTS (SELECT 1 FROM RowFingerprints AS fingerprint
+                                     WHERE fingerprint."TableName" = :table_name
+                                     AND fingerprint."PrimaryKey" = {staged_key}) THEN
+                            CASE WHEN EXISTS (SELECT 1 FROM RowFingerprints AS fingerprint
+                                              WHERE fingerprint."TableName" = :table_name
+                                              AND fingerprint."PrimaryKey" = {staged_key}
+                                              AND fingerprint."Fingerprint" = staged."_load_fingerprint")
+                                 THEN 'unchanged' ELSE 'updated' END
+                        WHEN EXISTS (SELECT 1 FROM {table_name} AS target WHERE {row_match}) THEN 'unchanged'
+                        ELSE 'updated' END""", {'table_name': table_name})
+
+                # Merge in one statement; if it fails, isolate the failing rows instead
+                merge_query = create_merge_query(table_name, headers, primary_key, staging_table)
+                cursor.execute("SAVEPOINT merge")
+                try:
+                    cursor.execute(merge_query)
+                    cursor.execute("RELEASE merge")
+                except sqlite3.Error as e:
+                    cursor.execute("ROLLBACK TO merge")
+                    cursor.execute("RELEASE merge")
+                    logging.warning(f"Set-based merge of {file_name} failed, isolating the failing rows: {e}")
+                    upsert_query = create_upsert_query(table_name, headers, primary_key)
+                    staged = cursor.execute(f"""
+                        SELECT "_load_line", {column_names} FROM {staging_table}
+                        WHERE "_load_status" != 'unchanged'
+                        ORDER BY "_load_line"
+                        """).fetchall()
+                    _, failed = upsert_rows(cursor, upsert_query, [(row[0], list(row[1:])) for row in staged])
+                    failed_lines = {line_number for line_number, _, _ in failed}
+                    cursor.execute('CREATE TEMP TABLE "failed_lines" ("_load_line" INTEGER PRIMARY KEY)')
+                    cursor.executemany('INSERT INTO temp."failed_lines" VALUES (?)', [(line,) for line in failed_lines])
+                    cursor.execute(f"""
+                        UPDATE {staging_table} SET "_load_status" = 'failed'
+                        WHERE "_load_line" IN (SELECT "_load_line" FROM temp."failed_lines")""")
+                    cursor.execute('DROP TABLE temp."failed_lines"')
+                    failed_rows.extend(failed)
+
+                # Count the changes in SQL
+                counts = dict(cursor.execute(f"""
+                    SELECT "_load_status", COUNT(*) FROM {staging_table}
+                    GROUP BY "_load_status"
+                    """).fetchall())
+                statistics = {'inserted': counts.get('inserted', 0),
+                              'updated': counts.get('updated', 0),
+                              'unchanged': counts.get('unchanged', 0),
+                              'failed': len(failed_rows),
+                              'settled': 0}
+
+                # Store the fingerprints of the merged rows, and publish the keys that changed
+                now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                cursor.execute(f"""
+                    INSERT INTO RowFingerprints ("TableName", "PrimaryKey", "Fingerprint")
+                    SELECT :table_name, {staged_key}, staged."_load_fingerprint" FROM {staging_table} AS staged
+                    WHERE staged."_load_status" != 'failed'
+                    ON CONFLICT ("TableName", "PrimaryKey")
+                    DO UPDATE SET "Fingerprint" = excluded."Fingerprint"
+                    WHERE "Fingerprint" IS NOT excluded."Fingerprint"
+                    """, {'table_name': table_name})
+                cursor.execute(f"""
+                    INSERT INTO ChangedKeys ("RunID", "TableName", "PrimaryKey", "ChangeType", "WhenChanged")
+                    SELECT :run_id, :table_name, {staged_key}, staged."_load_status", :now FROM {staging_table} AS staged
+                    WHERE staged."_load_status" IN ('inserted', 'updated')
+                    ORDER BY staged."_load_line"
+                    """, {'run_id': run_id, 'table_name': table_name, 'now': now})
+
+                if failed_rows:
+                    statistics['settled'] = quarantine_rows(cursor, file_name, table_name, headers, failed_rows)
+                cursor.execute("""
+                    INSERT INTO LoadStatistics ("FileName", "TableName", "Inserted", "Updated", "Unchanged", "Failed", "WhenLoaded")
+                    VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                               (os.path.basename(file_name), table_name, statistics['inserted'], statistics['updated'],
+                                statistics['unchanged'], statistics['failed'], now))
+                cursor.execute(f'DROP TABLE {staging_table}')
+                cursor.execute("COMMIT")
+            except Exception:
+                if connection.in_transaction:
+                    cursor.execute("ROLLBACK")
+                raise
+            finally:
+                connection.close()
+
+        for line_number, _, error in failed_rows:
+            logging.error(f"Error loading row at line {line_number} of {file_name}: {error}")
+        logging.info(f"Merged {file_name} into {table_name}: {statistics}")
+        return statistics
+    except Exception as e:
+        logging.error(f"Error merging CSV file {file_name}: {e}")
+        raise
+
+
 def get_primary_key(file_name):
     """
     Determines the primary key(s) for a table based on the CSV file name.
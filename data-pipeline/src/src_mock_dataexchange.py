@@ -0,0 +1,289 @@
+"""
+Mock DataExchange Server Module
+
+This module provides a local stand-in for the Motorola Spillman Flex DataExchange REST API, so the
+extract scripts can be run and benchmarked without access to the `ecom_vmware` host.
+
+The mock server accepts the `PublicSafetyEnvelope` queries sent by the extract scripts, reads the
+queried table, its `equal_to` and `between` predicates and its joined child tables, and answers with
+synthetic records. The columns of every table are read from the raw tables schema
+(`schema_database_setup_raw_tables.py`), so the responses have the same shape as the real ones:
+
+- Records are spread over the queried date range, `records_per_day` records per day, and every date
+  column holds a date inside the range formatted like the API does ("%H:%M:%S %m/%d/%Y").
+- Columns with an `equal_to` predicate hold the queried value.
+- The first column of the primary key of a table, as the load script finds it (`get_primary_key`),
+  that is not a date holds a unique key, so the keys of the records never collide. Dates of a key
+  stay dates inside the range.
+- Each record is followed by one record of each joined child table, linked through the join fields.
+  Child records are generated from their key, so the same address (or name) returned for several
+  records or queries always has the same values, like real reference data.
+- Records are generated from a seed and the query window, so the same query returns the same data.
+
+Responses are streamed with chunked transfer encoding, so large volumes can be served with flat
+memory use, and an optional latency is added before each response to mimic the real server.
+"""
+import logging
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+from lxml import etree
+
+from src_load_raw_data_sqlite_db import get_primary_key
+
+# Format of the dates in the XML query and in the API response
+QUERY_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+RESPONSE_DATE_FORMAT = "%H:%M:%S %m/%d/%Y"
+
+# Number of records written to the response at a time
+RESPONSE_BATCH_SIZE = 1000
+
+WORDS = ["ALPHA", "BRAVO", "CHARLIE", "DELTA", "ECHO", "FOXTROT", "GOLF", "HOTEL", "INDIA", "JULIET",
+         "KILO", "LIMA", "MIKE", "NOVEMBER", "OSCAR", "PAPA", "QUEBEC", "ROMEO", "SIERRA", "TANGO"]
+
+
+def load_schema_columns(schema_file):
+    """
+    Reads the columns of every table from the raw tables schema script.
+
+    Parameters:
+    schema_file (str): Path to `schema_database_setup_raw_tables.py`.
+
+    Returns:
+    dict: A dictionary mapping each table name to its list of column names.
+    """
+    with open(schema_file, 'r') as file:
+        schema = file.read()
+
+    tables = {}
+    # Table options such as WITHOUT ROWID may follow the column list
+    for table_name, definition in re.findall(r'CREATE Table (\w+) \((.*?)\)[\w\s,]*"""', schema, flags=re.S):
+        tables[table_name] = re.findall(r'"(\w+)"\s+\w+', definition)
+    logging.info(f"Read the columns of {len(tables)} tables from {schema_file}")
+    return tables
+
+
+def parse_query(body):
+    """
+    Reads the queried table, its predicates and its joined child tables from a query envelope.
+
+    Parameters:
+    body (bytes): The `PublicSafetyEnvelope` posted to the server.
+
+    Returns:
+    dict: The queried table ('table'), its `equal_to` predicates ('equal_to'), its `between` predicate as
+          a (column, start datetime, end datetime) tuple or None ('between'), and its joined child tables
+          as (table, parent field, child field) tuples ('children').
+    """
+    root = etree.fromstring(body)
+    query = root.find(".//Query")
+    if query is None or len(query) == 0:
+        raise ValueError("No table found in the query")
+    table = query[0]
+
+    parsed = {'table': table.tag, 'equal_to': {}, 'between': None, 'children': []}
+    for predicate in table:
+        if predicate.get("parentField") is not None:
+            parsed['children'].append((predicate.tag, predicate.get("parentField"), predicate.get("childField")))
+        elif predicate.get("search_type") == "between":
+            start_date, end_date = [datetime.strptime(value.text.strip(), QUERY_DATE_FORMAT)
+                                    for value in predicate.findall("SearchValue")]
+            parsed['between'] = (predicate.tag, start_date, end_date)
+        elif predicate.get("search_type") == "equal_to":
+            parsed['equal_to'][predicate.tag] = (predicate.text or "").strip()
+    return parsed
+
+
+class MockDataExchange:
+    """
+    Generates synthetic, schema-correct DataExchange responses.
+
+    Parameters:
+    schema_columns (dict): The columns of every table, as returned by `load_schema_columns`.
+    records_per_day (float, optional): Number of records returned per day of the queried range. Default is 100.
+    reference_records (int, optional): Number of distinct records of each joined child table, e.g. the
+                                       number of distinct addresses. Default is 5,000.
+    seed (int, optional): Seed of the generated data. Default is 0.
+    """
+
+    def __init__(self, schema_columns, records_per_day=100, reference_records=5000, seed=0):
+        self.schema_columns = schema_columns
+        self.records_per_day = records_per_day
+        self.reference_records = reference_records
+        self.seed = seed
+
+    def _columns(self, table_name, key_column):
+        """
+        Returns the columns of a table, or only its key column if the table is not in the schema.
+        """
+        columns = self.schema_columns.get(table_name)
+        if not columns:
+            logging.warning(f"Table {table_name} is not in the schema, returning its key column only")
+            return [key_column]
+        return columns
+
+    def _key_column(self, table_name, columns):
+        """
+        Returns the column of a table holding the generated keys: the first column of its primary key that
+        is not a date, or its first column if the primary key is not known.
+        """
+        # The load script finds the primary key from the name of the extracted file, e.g. hashed_Victim.csv
+        primary_key = get_primary_key(f"hashed_{table_name}_main.csv") or columns[0]
+        if isinstance(primary_key, str):
+            primary_key = [primary_key]
+        key_columns = [column for column in primary_key if column in columns and not self._is_date(column)]
+        return key_columns[0] if key_columns else columns[0]
+
+    def _is_date(self, column):
+        """
+        Returns True if a column holds dates, based on its name.
+        """
+        return "Date" in column or "Time" in column or "When" in column
+
+    def _value(self, column, rng, start_date, end_date):
+        """
+        Generates a value for a column, based on its name.
+        """
+        if self._is_date(column):
+            seconds = rng.uniform(0, (end_date - start_date).total_seconds())
+            return (start_date + timedelta(seconds=seconds)).strftime(RESPONSE_DATE_FORMAT)
+        if "Number" in column or column.endswith("ID"):
+            return str(rng.randrange(1, 10 ** 7))
+        return f"{rng.choice(WORDS)} {rng.randrange(1, 1000)}"
+
+    def _record(self, table_name, columns, values):
+        """
+        Renders a record as XML.
+        """
+        fields = ''.join(f"<{column}>{escape(values[column])}</{column}>" for column in columns)
+        return f"<{table_name}>{fields}</{table_name}>"
+
+    def records(self, query):
+        """
+        Generates the records answering a query.
+
+        Parameters:
+        query (dict): The query, as returned by `parse_query`.
+
+        Yields:
+        str: Each record as XML, followed by the records of its joined child tables.
+        """
+        table_name = query['table']
+        if query['between'] is not None:
+            _, start_date, end_date = query['between']
+        else:
+            end_date = datetime.now().replace(microsecond=0)
+            start_date = end_date - timedelta(days=1)
+
+        days = (end_date - start_date).total_seconds() / 86400
+        count = int(round(self.records_per_day * days))
+        rng = random.Random(f"{self.seed}|{table_name}|{start_date}|{end_date}")
+        columns = self._columns(table_name, "RecordNumber")
+        key_column = self._key_column(table_name, columns)
+        logging.info(f"Generating {count} {table_name} records from {start_date} to {end_date}")
+
+        for i in range(count):
+            values = {column: self._value(column, rng, start_date, end_date) for column in columns}
+            # Keys are unique within and across windows, and stable for the same window
+            values[key_column] = f"{start_date:%y%m%d%H%M}{i:07d}"
+            values.update({column: value for column, value in query['equal_to'].items() if column in values})
+            for _, parent_field, _ in query['children']:
+                if parent_field in values and parent_field != key_column:
+                    # Joined reference data comes from a bounded pool, so keys repeat across records
+                    values[parent_field] = str(rng.randrange(1, self.reference_records + 1))
+            yield self._record(table_name, columns, values)
+
+            for child_table, parent_field, child_field in query['children']:
+                yield self._child_record(child_table, child_field, values.get(parent_field, ""),
+                                         start_date, end_date)
+
+    def _child_record(self, table_name, key_column, key, start_date, end_date):
+        """
+        Generates the record of a joined child table, the same every time for the same key.
+        """
+        rng = random.Random(f"{self.seed}|{table_name}|{key}")
+        columns = self._columns(table_name, key_column)
+        # Reference data does not depend on the queried range, so its dates are fixed per key
+        reference_end = datetime(2024, 1, 1)
+        values = {column: self._value(column, rng, reference_end - timedelta(days=3650), reference_end)
+                  for column in columns}
+        values[key_column] = key
+        return self._record(table_name, columns, values)
+
+    def response(self, query):
+        """
+        Generates the response to a query in batches of records.
+
+        Parameters:
+        query (dict): The query, as returned by `parse_query`.
+
+        Yields:
+        bytes: Consecutive parts of the response envelope.
+        """
+        yield (f'<?xml version="1.0" encoding="UTF-8"?>\n'
+               f'<PublicSafetyEnvelope version="1.0"><From>Mock DataExchange</From>'
+               f'<PublicSafety id=""><Response>').encode("utf-8")
+
+        batch = []
+        for record in self.records(query):
+            batch.append(record)
+            if len(batch) == RESPONSE_BATCH_SIZE:
+                yield ''.join(batch).encode("utf-8")
+                batch = []
+        if batch:
+            yield ''.join(batch).encode("utf-8")
+
+        yield b'</Response></PublicSafety></PublicSafetyEnvelope>'
+
+
+def create_server(mock, host="127.0.0.1", port=8000, latency=0.0):
+    """
+    Creates an HTTP server answering DataExchange queries with synthetic data.
+
+    Parameters:
+    mock (MockDataExchange): The generator of the responses.
+    host (str, optional): Host name or address to listen on. Default is "127.0.0.1".
+    port (int, optional): Port to listen on. Default is 8000.
+    latency (float, optional): Seconds waited before answering each query. Default is 0.
+
+    Returns:
+    ThreadingHTTPServer: The server. Call `serve_forever` to start answering queries.
+    """
+
+    class DataExchangeHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                query = parse_query(body)
+            except Exception as e:
+                logging.error(f"Invalid query from {self.client_address[0]}: {e}")
+                self.send_error(400, "Invalid PublicSafetyEnvelope query")
+                return
+
+            started = time.perf_counter()
+            if latency:
+                time.sleep(latency)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            sent = 0
+            for part in mock.response(query):
+                self.wfile.write(f"{len(part):X}\r\n".encode("ascii") + part + b"\r\n")
+                sent += len(part)
+            self.wfile.write(b"0\r\n\r\n")
+            logging.info(f"Answered {query['table']} query with {sent} bytes "
+                         f"in {time.perf_counter() - started:.2f} seconds")
+
+        def log_message(self, format, *args):
+            logging.info(f"{self.client_address[0]} - {format % args}")
+
+    return ThreadingHTTPServer((host, port), DataExchangeHandler)
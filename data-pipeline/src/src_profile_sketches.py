@@ -0,0 +1,312 @@
+"""
+Profile Sketches Module
+
+This module holds the approximate, mergeable summaries of the columns of the extracted files used by the
+raw data validation report (see src_create_report_raw_data). They take a fixed amount of memory whatever
+the number of rows, and the sketches of two files, or of two days, merge into the sketch of both without
+reading the rows again, so daily profiles can be rolled up into weekly and monthly ones.
+
+- `HyperLogLog` estimates the number of distinct values, within about 1.04 / sqrt(2 ** precision)
+  (2.3% with the default precision of 11).
+- `SpaceSaving` keeps the `capacity` most frequent values with an upper bound of their count. Counts are
+  too high by at most the `floor` of the summary, the highest count a value left out of it can have.
+- `ColumnSketch` combines both with the exact minimum and maximum of the timestamps of the column, as
+  "YYYY-MM-DD HH:MM:SS", for columns holding timestamps in the API format ("%H:%M:%S %m/%d/%Y").
+
+Sketches are updated with the value counts of a chunk of rows rather than row by row: the distinct values
+of a chunk are hashed at once with pandas, and the most frequent values of the chunk are merged into the
+space-saving summary as a summary of the chunk. They serialize to JSON-compatible dicts, with the registers
+and counts compressed and base64-encoded, so the reports they are saved in stay small.
+"""
+import base64
+import json
+import math
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# Default sizes of the sketches
+DEFAULT_PRECISION = 11
+DEFAULT_CAPACITY = 64
+
+# Timestamp formats of the API, see src_raw_timestamps
+TIMESTAMP_FORMATS = {
+    r"^\d{2}:\d{2}:\d{2} \d{2}/\d{2}/\d{4}$": "%H:%M:%S %m/%d/%Y",
+    r"^\d{2}/\d{2}/\d{4}$": "%m/%d/%Y",
+}
+
+
+def hash_values(values):
+    """
+    Hashes values to 64-bit integers, the same for a value whether it was read from a file or a DataFrame.
+
+    Parameters:
+    values (Series): The values, hashed as text.
+
+    Returns:
+    ndarray: The 64-bit hash of each value.
+    """
+    return pd.util.hash_pandas_object(values.astype(str), index=False).to_numpy()
+
+
+def _encode(data):
+    """
+    Compresses and base64-encodes the registers or counts of a sketch.
+    """
+    return base64.b64encode(zlib.compress(bytes(data))).decode("ascii")
+
+
+def _decode(text):
+    """
+    Decodes the registers or counts of a sketch encoded by `_encode`.
+    """
+    return zlib.decompress(base64.b64decode(text))
+
+
+class HyperLogLog:
+    """
+    A HyperLogLog sketch estimating the number of distinct values.
+
+    Parameters:
+    precision (int, optional): Number of bits of the hash selecting a register, 2 ** precision registers.
+                               Defaults to DEFAULT_PRECISION.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(2 ** precision)
+
+    def add_hashes(self, hashes):
+        """
+        Adds the 64-bit hashes of values.
+        """
+        bits = 64 - self.precision
+        indexes = (hashes >> np.uint64(bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << bits) - 1)
+
+        # Position of the leftmost 1 bit of the remaining bits, from their bit length
+        lengths = np.zeros(len(rest), dtype=np.int64)
+        for shift in (32, 16, 8, 4, 2, 1):
+            longer = rest >= np.uint64(1 << shift)
+            lengths[longer] += shift
+            rest = np.where(longer, rest >> np.uint64(shift), rest)
+        lengths += rest > 0
+        ranks = (bits - lengths + 1).astype(np.uint8)
+
+        registers = np.frombuffer(self.registers, dtype=np.uint8).copy()
+        np.maximum.at(registers, indexes, ranks)
+        self.registers = bytearray(registers.tobytes())
+
+    def estimate(self):
+        """
+        Estimates the number of distinct values added.
+
+        Returns:
+        int: The estimate.
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.exp2(-np.frombuffer(self.registers, dtype=np.uint8).astype(float))))
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+    def merge(self, other):
+        """
+        Merges another sketch of the same precision into this one.
+        """
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precisions")
+        self.registers = bytearray(np.maximum(np.frombuffer(self.registers, dtype=np.uint8),
+                                              np.frombuffer(other.registers, dtype=np.uint8)).tobytes())
+
+    def to_dict(self):
+        return {'precision': self.precision, 'registers': _encode(self.registers)}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['precision'])
+        sketch.registers = bytearray(_decode(data['registers']))
+        return sketch
+
+
+class SpaceSaving:
+    """
+    A space-saving summary of the most frequent values: the `capacity` values with the highest counts, and
+    `floor`, the highest count any value left out of the summary can have. Counts are upper bounds.
+
+    Parameters:
+    capacity (int, optional): Number of values tracked. Defaults to DEFAULT_CAPACITY.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.floor = 0
+
+    @classmethod
+    def from_counts(cls, counts, capacity=DEFAULT_CAPACITY):
+        """
+        Summarizes exact value counts, such as those of a chunk.
+
+        Parameters:
+        counts (Series): The count of each value, sorted from the most frequent.
+        capacity (int, optional): Number of values tracked. Defaults to DEFAULT_CAPACITY.
+
+        Returns:
+        SpaceSaving: The summary.
+        """
+        sketch = cls(capacity)
+        sketch.counts = {value: int(count) for value, count in counts.iloc[:capacity].items()}
+        sketch.floor = int(counts.iloc[capacity]) if len(counts) > capacity else 0
+        return sketch
+
+    def merge(self, other):
+        """
+        Merges another summary into this one, keeping the `capacity` values with the highest counts.
+        """
+        # A value missing from a summary may have occurred up to its floor
+        merged = {value: self.counts.get(value, self.floor) + other.counts.get(value, other.floor)
+                  for value in set(self.counts) | set(other.counts)}
+        ranked = sorted(merged.items(), key=lambda item: item[1], reverse=True)
+        self.counts = dict(ranked[:self.capacity])
+        self.floor = max([self.floor + other.floor] + [count for _, count in ranked[self.capacity:]])
+
+    def top(self, k):
+        """
+        Returns the k most frequent values with the upper bound of their count.
+        """
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def to_dict(self):
+        return {'capacity': self.capacity, 'floor': self.floor,
+                'counts': _encode(json.dumps(list(self.counts.items())).encode("utf-8"))}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['capacity'])
+        sketch.floor = data['floor']
+        sketch.counts = {value: count for value, count in json.loads(_decode(data['counts']))}
+        return sketch
+
+
+class ColumnSketch:
+    """
+    The sketches of a column: distinct values, most frequent values and timestamp range.
+    """
+
+    def __init__(self, distinct=None, top_values=None, min_timestamp=None, max_timestamp=None):
+        self.distinct = distinct or HyperLogLog()
+        self.top_values = top_values or SpaceSaving()
+        self.min_timestamp = min_timestamp
+        self.max_timestamp = max_timestamp
+
+    def update(self, series):
+        """
+        Adds the non-missing values of a chunk of a column.
+
+        Parameters:
+        series (Series): The values of the column in the chunk.
+        """
+        values = series.dropna().astype(str)
+        if values.empty:
+            return
+
+        counts = values.value_counts()
+        self.distinct.add_hashes(hash_values(counts.index.to_series()))
+
+        # The counts of the chunk are exact, merge the most frequent ones as a summary of the chunk
+        self.top_values.merge(SpaceSaving.from_counts(counts, self.top_values.capacity))
+
+        # Only columns whose first value is a timestamp of the API are parsed
+        first = values.iloc[0]
+        for pattern, timestamp_format in TIMESTAMP_FORMATS.items():
+            if re.match(pattern, first):
+                timestamps = pd.to_datetime(values, format=timestamp_format, errors="coerce").dropna()
+                if not timestamps.empty:
+                    self._update_range(timestamps.min().strftime("%Y-%m-%d %H:%M:%S"),
+                                       timestamps.max().strftime("%Y-%m-%d %H:%M:%S"))
+                break
+
+    def _update_range(self, minimum, maximum):
+        """
+        Widens the timestamp range to include another range.
+        """
+        if minimum is not None and (self.min_timestamp is None or minimum < self.min_timestamp):
+            self.min_timestamp = minimum
+        if maximum is not None and (self.max_timestamp is None or maximum > self.max_timestamp):
+            self.max_timestamp = maximum
+
+    def merge(self, other):
+        """
+        Merges the sketches of another part of the same column into this one.
+        """
+        self.distinct.merge(other.distinct)
+        self.top_values.merge(other.top_values)
+        self._update_range(other.min_timestamp, other.max_timestamp)
+
+    def summary(self, k=10):
+        """
+        Summarizes the column: estimated distinct values, the k most frequent values with the upper bound of
+        their count, and the timestamp range.
+
+        Parameters:
+        k (int, optional): Number of most frequent values. Default is 10.
+
+        Returns:
+        dict: The 'distinct' estimate, 'top_values' as [value, count] pairs, 'top_values_error' (the most the
+              counts can be too high by), 'min_timestamp' and 'max_timestamp'.
+        """
+        return {'distinct': self.distinct.estimate(),
+                'top_values': [[value, count] for value, count in self.top_values.top(k)],
+                'top_values_error': self.top_values.floor,
+                'min_timestamp': self.min_timestamp, 'max_timestamp': self.max_timestamp}
+
+    def to_dict(self):
+        return {'distinct': self.distinct.to_dict(), 'top_values': self.top_values.to_dict(),
+                'min_timestamp': self.min_timestamp, 'max_timestamp': self.max_timestamp}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(HyperLogLog.from_dict(data['distinct']), SpaceSaving.from_dict(data['top_values']),
+                   data['min_timestamp'], data['max_timestamp'])
+
+
+def sketch_dataframe(dataframe):
+    """
+    Computes the sketches of every column of a DataFrame.
+
+    Parameters:
+    dataframe (DataFrame): The DataFrame, or a chunk of a file.
+
+    Returns:
+    dict: The ColumnSketch of each column.
+    """
+    sketches = {}
+    for column in dataframe.columns:
+        sketches[column] = ColumnSketch()
+        sketches[column].update(dataframe[column])
+    return sketches
+
+
+def merge_sketches(sketches, other):
+    """
+    Merges the column sketches of two parts of the same table. Columns found in only one part are kept.
+
+    Parameters:
+    sketches (dict): The ColumnSketch of each column of the first part, updated in place.
+    other (dict): The ColumnSketch of each column of the second part.
+
+    Returns:
+    dict: The merged sketches.
+    """
+    for column, sketch in other.items():
+        if column in sketches:
+            sketches[column].merge(sketch)
+        else:
+            sketches[column] = sketch
+    return sketches
@@ -0,0 +1,190 @@
+"""
+Raw Tables Index Module
+
+This module defines the secondary indexes of the raw tables and checks the query plans of the pipeline
+queries against them.
+
+Indexes only serve lookups that run in SQL. The transforms read whole tables with `dbReadTable` and join
+them in R, and the loads look rows up by primary key, so neither gains from a secondary index while every
+load pays to keep it up to date. The filters that do run in SQL on other columns are those of the rollover
+of the partitioned tables (see src_raw_partitions), which selects and moves the rows dated in closed years
+by their sortable timestamp column (see src_raw_timestamps) while it holds a write lock on the hot
+database.
+
+`SECONDARY_INDEXES` lists the indexes of every table: the partition column of each partitioned table.
+`RETIRED_INDEXES` lists the indexes earlier versions created on the join columns of the transforms, which
+`drop_retired_indexes` removes from existing databases.
+
+`PIPELINE_QUERIES` is a registry of the lookups the pipeline runs in SQL. `advise` runs
+`EXPLAIN QUERY PLAN` over them and reports the full table scans and automatic indexes, i.e. the lookups
+that no index serves. A full scan of the outermost table of a query without a WHERE clause is expected
+and not reported.
+"""
+import logging
+import re
+
+from src_raw_partitions import PARTITION_COLUMNS
+
+# Secondary indexes of the raw tables, as tuples of columns per table
+SECONDARY_INDEXES = {table_name: [(column,)] for table_name, column in PARTITION_COLUMNS.items()}
+
+# Indexes created by earlier versions for the joins of the transforms, which run in R
+RETIRED_INDEXES = {
+    "CADMasterCallTable": [("GeobaseAddressID",), ("CallNature",), ("TimeDateOccurredEarliestISO",)],
+    "CADTrafficStopTable": [("LongTermCallID",), ("GeobaseAddressID",)],
+    "LawIncidentTable": [("LongTermCallID",), ("GeobaseAddressID",), ("TimeDateLastModifiedISO",)],
+    "LawIncidentOffensesDetail": [("StatuteCode",), ("OffenseCode",)],
+    "Offender": [("IncidentReference",), ("NameReference",), ("TimeDateRecordLastModifiedISO",)],
+    "Victim": [("IncidentReference",), ("NameReference",), ("TimeDateRecordLastModifiedISO",)],
+    "JailOffenseTable": [("LawIncidentNumber",), ("InmateNumber",), ("Statute",), ("TimeDateRecordLastModifiedISO",)],
+    "JailInmateTable": [("NameNumber",)],
+    "MasterCitationTable": [("NameNumber",)],
+    "MainNamesTable": [("GeobaseAddressID",)],
+    "CallTypeAggregationFile": [("Nature",)],
+    "IncidentAggregationFile": [("IncidentNature",)],
+    "LocalOffenseDescriptionToNIBRSCodes": [("LocalOffenseDescription",)],
+}
+
+# Lookups the pipeline runs in SQL, by name. Parameters are bound to NULL when the plan is explained.
+PIPELINE_QUERIES = {
+    "changed_keys_of_run": 'SELECT "PrimaryKey" FROM ChangedKeys WHERE "RunID" = ? AND "TableName" = ?',
+    "quarantined_row": 'SELECT 1 FROM LoadQuarantine WHERE "TableName" = ? AND "RowData" = ?',
+    "fingerprint_of_key": 'SELECT "Fingerprint" FROM RowFingerprints WHERE "TableName" = ? AND "PrimaryKey" = ?',
+    **{f"rollover_years_of_{table_name}":
+       f'SELECT DISTINCT substr("{column}", 1, 4) FROM "{table_name}" WHERE "{column}" < ?'
+       for table_name, column in PARTITION_COLUMNS.items()},
+    **{f"rollover_rows_of_{table_name}": f'SELECT * FROM "{table_name}" WHERE "{column}" >= ? AND "{column}" < ?'
+       for table_name, column in PARTITION_COLUMNS.items()},
+}
+
+
+def index_name(table_name, columns):
+    """
+    Returns the name of the index of a table on the given columns.
+
+    Parameters:
+    table_name (str): The name of the table.
+    columns (tuple): The indexed columns.
+
+    Returns:
+    str: The index name.
+    """
+    return f"{table_name}_{'_'.join(columns)}"
+
+
+def create_secondary_indexes(connection, indexes=None):
+    """
+    Creates the secondary indexes that do not exist yet. Indexes of missing tables or columns are skipped.
+
+    Parameters:
+    connection (Connection): A connection to the raw tables database.
+    indexes (dict, optional): The indexes to create, as in SECONDARY_INDEXES. Defaults to SECONDARY_INDEXES.
+
+    Returns:
+    list: The names of the indexes created.
+    """
+    if indexes is None:
+        indexes = SECONDARY_INDEXES
+
+    existing = {name for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    created = []
+    for table_name, table_indexes in indexes.items():
+        # table_xinfo also lists the generated timestamp columns
+        table_columns = {row[1] for row in connection.execute(f'PRAGMA table_xinfo("{table_name}")')}
+        for columns in table_indexes:
+            name = index_name(table_name, columns)
+            if name in existing:
+                continue
+            missing = [column for column in columns if column not in table_columns]
+            if missing:
+                logging.warning(f"Skipping index {name}: {table_name} has no column(s) {', '.join(missing)}")
+                continue
+
+            column_list = ', '.join([f'"{column}"' for column in columns])
+            connection.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table_name}" ({column_list})')
+            created.append(name)
+            logging.info(f"Created index {name}")
+    connection.commit()
+    return created
+
+
+def drop_retired_indexes(connection, indexes=None):
+    """
+    Drops the retired indexes that still exist.
+
+    Parameters:
+    connection (Connection): A connection to the raw tables database.
+    indexes (dict, optional): The indexes to drop, as in RETIRED_INDEXES. Defaults to RETIRED_INDEXES.
+
+    Returns:
+    list: The names of the indexes dropped.
+    """
+    if indexes is None:
+        indexes = RETIRED_INDEXES
+
+    existing = {name for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    dropped = []
+    for table_name, table_indexes in indexes.items():
+        for columns in table_indexes:
+            name = index_name(table_name, columns)
+            if name in existing:
+                connection.execute(f'DROP INDEX "{name}"')
+                dropped.append(name)
+                logging.info(f"Dropped index {name}")
+    connection.commit()
+    return dropped
+
+
+def explain(connection, query):
+    """
+    Returns the query plan of a query.
+
+    Parameters:
+    connection (Connection): A connection to the raw tables database.
+    query (str): The query, with `?` parameters.
+
+    Returns:
+    list: The (id, parent, detail) rows of the plan.
+    """
+    parameters = [None] * query.count('?')
+    return [(row[0], row[1], row[3]) for row in connection.execute(f"EXPLAIN QUERY PLAN {query}", parameters)]
+
+
+def advise(connection, queries=None):
+    """
+    Reports the lookups of the pipeline queries that no index serves.
+
+    Parameters:
+    connection (Connection): A connection to the raw tables database.
+    queries (dict, optional): The queries to check, by name. Defaults to PIPELINE_QUERIES.
+
+    Returns:
+    list: A (query name, plan detail) tuple per full table scan or automatic index, or per query that could
+          not be explained.
+    """
+    if queries is None:
+        queries = PIPELINE_QUERIES
+
+    findings = []
+    for name, query in queries.items():
+        try:
+            plan = explain(connection, query)
+        except Exception as e:
+            logging.warning(f"Could not explain query {name}: {e}")
+            findings.append((name, f"NOT EXPLAINED: {e}"))
+            continue
+
+        has_filter = re.search(r"\bWHERE\b", query, flags=re.I) is not None
+        for position, (_, _, detail) in enumerate(plan):
+            if "AUTOMATIC" in detail:
+                findings.append((name, detail))
+            elif re.match(r"SCAN (TABLE )?\S+", detail) and " USING " not in detail:
+                # Reading every row of the outermost table is the point of a query without a filter
+                if position == 0 and not has_filter:
+                    continue
+                findings.append((name, detail))
+
+    for name, detail in findings:
+        logging.warning(f"Query {name} is not served by an index: {detail}")
+    logging.info(f"Checked {len(queries)} queries, {len(findings)} lookups are not served by an index")
+    return findings
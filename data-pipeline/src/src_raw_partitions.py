@@ -0,0 +1,330 @@
+"""
+Raw Tables Partition Module
+
+This module splits the raw tables database into a hot database holding the current data and read-only
+yearly archive databases holding the closed years, so the nightly loads, backups and VACUUMs only touch
+the small hot file while the full history can still be queried.
+
+The hot database stays at the `raw_tables` path of config.yaml and receives every load. A rollover moves
+the rows of the event tables dated in a closed year (by the column in `PARTITION_COLUMNS`) into the
+archive database of that year under `raw_partitions_dir`. Years older than the last `YEARLY_PARTITIONS`
+closed years share a single history archive, so the number of attached databases stays within the
+SQLite limit of 10:
+
+    raw_partitions_dir/
+        HazelCrestRawTables_history.db
+        HazelCrestRawTables_2023.db
+        HazelCrestRawTables_2024.db
+        attach_partitions.sql
+
+Readers see all years through the usual table names: `attach_partitions.sql` holds one statement per line
+that ATTACHes the archives read-only and creates a TEMP view per partitioned table, e.g.
+
+    CREATE TEMP VIEW "LawIncidentTable" AS
+        SELECT ... FROM main."LawIncidentTable"
+        UNION ALL SELECT ... FROM "partition_2024"."LawIncidentTable" WHERE <key not in a newer partition>
+        ...
+
+TEMP views take precedence over the tables of the same name, so unqualified queries read the views.
+When a record of a closed year is edited later, the load writes the new version to the hot database; the
+views return the version of the newest partition only, and the next rollover replaces the archived one.
+"""
+import logging
+import os
+import re
+import stat
+from datetime import datetime
+
+from src_sqlite_connection import connect
+
+# Column deciding the year of the rows of each partitioned table (see src_raw_timestamps)
+PARTITION_COLUMNS = {
+    "CADMasterCallTable": "TimeDateReportedISO",
+    "CADTrafficStopTable": "TimeDateRecordLastModifiedISO",
+    "LawIncidentTable": "TimeDateReportedISO",
+    "LawIncidentOffensesDetail": "TimeDateLastModifiedISO",
+    "OfficerRadioLogTable": "TimeOfStatusChangeISO",
+    "MasterCitationTable": "ViolationDateISO",
+    "JailOffenseTable": "TimeDateAddedISO",
+    "Offender": "TimeDateAddedISO",
+    "Victim": "TimeDateAddedISO",
+    "TableOfInvolvements": "DateInvolvementOccurredISO",
+}
+
+# Number of closed years kept in yearly archives, older years share the history archive. With the
+# history archive this attaches 9 databases, within the default SQLite limit of 10.
+YEARLY_PARTITIONS = 8
+
+# Name suffix of the archive holding the years older than the yearly archives
+HISTORY_PARTITION = "history"
+
+# File name of the statements attaching the archives
+ATTACH_FILE_NAME = "attach_partitions.sql"
+
+
+def partition_path(partitions_dir, db_path, partition):
+    """
+    Returns the path of an archive database.
+
+    Parameters:
+    partitions_dir (str): Directory holding the archive databases.
+    db_path (str): Path to the hot raw tables database.
+    partition (int or str): The year of a yearly archive, or HISTORY_PARTITION.
+
+    Returns:
+    str: The path of the archive database.
+    """
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(partitions_dir, f"{name}_{partition}.db")
+
+
+def list_partitions(partitions_dir, db_path):
+    """
+    Lists the archive databases, newest first: the yearly archives by year, then the history archive.
+
+    Parameters:
+    partitions_dir (str): Directory holding the archive databases.
+    db_path (str): Path to the hot raw tables database.
+
+    Returns:
+    list: The (partition, path) of each archive database, the partition being a year or HISTORY_PARTITION.
+    """
+    if not os.path.isdir(partitions_dir):
+        return []
+    name = re.escape(os.path.splitext(os.path.basename(db_path))[0])
+    partitions = []
+    for file_name in os.listdir(partitions_dir):
+        match = re.fullmatch(rf"{name}_(\d{{4}}|{HISTORY_PARTITION})\.db", file_name)
+        if match:
+            partition = match.group(1)
+            partitions.append((int(partition) if partition.isdigit() else partition,
+                               os.path.join(partitions_dir, file_name)))
+    return sorted(partitions, key=lambda partition: partition[0] if isinstance(partition[0], int) else 0,
+                  reverse=True)
+
+
+def _columns(connection, schema, table_name):
+    """
+    Returns the columns of a table, generated columns included, and its primary key columns.
+    """
+    rows = connection.execute(f'PRAGMA "{schema}".table_xinfo("{table_name}")').fetchall()
+    columns = [row[1] for row in rows]
+    primary_key = [row[1] for row in sorted(rows, key=lambda row: row[5]) if row[5] > 0]
+    return columns, primary_key
+
+
+def _set_read_only(path, read_only):
+    """
+    Makes an archive database file read-only, or writable again for a rollover.
+    """
+    mode = os.stat(path).st_mode
+    writable = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+    os.chmod(path, mode & ~writable if read_only else mode | stat.S_IWUSR)
+
+
+def _move_rows(connection, source, target, table_name, condition="1", parameters=()):
+    """
+    Moves the rows of a table matching a condition from one attached database to another, in one
+    transaction. The target table is created like the hot one, with its generated columns and indexes,
+    and gets the stored columns added to the hot table since it was created.
+
+    Returns:
+    int: The number of rows moved.
+    """
+    if connection.execute(f'SELECT 1 FROM "{source}".sqlite_master WHERE type = \'table\' AND name = ?',
+                          (table_name,)).fetchone() is None:
+        return 0
+
+    if connection.execute(f'SELECT 1 FROM "{target}".sqlite_master WHERE type = \'table\' AND name = ?',
+                          (table_name,)).fetchone() is None:
+        for (sql,) in connection.execute("""
+                SELECT sql FROM main.sqlite_master
+                WHERE tbl_name = ? AND sql IS NOT NULL ORDER BY type = 'index'""", (table_name,)).fetchall():
+            connection.execute(re.sub(r'^(CREATE\s+(?:UNIQUE\s+)?(?:TABLE|INDEX)\s+)', rf'\1"{target}".', sql,
+                                      flags=re.I))
+
+    # Generated columns are computed, so only the stored columns are copied
+    target_columns = {row[1] for row in connection.execute(f'PRAGMA "{target}".table_info("{table_name}")')}
+    stored = []
+    for row in connection.execute(f'PRAGMA "{source}".table_info("{table_name}")').fetchall():
+        if row[1] not in target_columns:
+            connection.execute(f'ALTER TABLE "{target}"."{table_name}" ADD COLUMN "{row[1]}" {row[2]}')
+        stored.append(f'"{row[1]}"')
+    stored = ', '.join(stored)
+
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        count = connection.execute(f"""
+            INSERT OR REPLACE INTO "{target}"."{table_name}" ({stored})
+            SELECT {stored} FROM "{source}"."{table_name}" WHERE {condition}""", parameters).rowcount
+        connection.execute(f'DELETE FROM "{source}"."{table_name}" WHERE {condition}', parameters)
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    return count
+
+
+def rollover(db_path, partitions_dir, before_year=None):
+    """
+    Moves the rows of the partitioned tables dated before a year from the hot database into the archive
+    databases: the last YEARLY_PARTITIONS years into yearly archives, older years into the history archive.
+    Yearly archives that fall out of that window are merged into the history archive.
+
+    Rows are copied to the archive, replacing older versions of the same key, before they are deleted
+    from the hot database, so a failure never loses rows: at worst a row is in both databases, and the
+    views return the hot version.
+
+    Parameters:
+    db_path (str): Path to the hot raw tables database.
+    partitions_dir (str): Directory holding the archive databases.
+    before_year (int, optional): Move the rows dated before this year. Defaults to the current year.
+
+    Returns:
+    dict: The number of rows moved per archive and table.
+    """
+    if before_year is None:
+        before_year = datetime.now().year
+    first_yearly = before_year - YEARLY_PARTITIONS
+    os.makedirs(partitions_dir, exist_ok=True)
+
+    connection = connect(db_path, profile="bulk-load", isolation_level=None)
+    moved = {}
+    try:
+        # Find the closed years with rows in the hot database
+        tables = {}
+        years = set()
+        for table_name, column in PARTITION_COLUMNS.items():
+            columns, _ = _columns(connection, "main", table_name)
+            if column not in columns:
+                logging.warning(f"Skipping {table_name}: column {column} not found, run the timestamp migration")
+                continue
+            tables[table_name] = column
+            years.update(int(year) for (year,) in connection.execute(f"""
+                SELECT DISTINCT substr("{column}", 1, 4) FROM "{table_name}"
+                WHERE "{column}" < ?""", (f"{before_year:04d}",)) if year)
+
+        # Yearly archives to merge into the history archive, oldest first
+        aged = [(partition, path) for partition, path in reversed(list_partitions(partitions_dir, db_path))
+                if isinstance(partition, int) and partition < first_yearly]
+
+        if aged or any(year < first_yearly for year in years):
+            years = {year for year in years if year >= first_yearly} | {HISTORY_PARTITION}
+
+        for partition in sorted(years, key=lambda partition: partition if isinstance(partition, int) else 0):
+            path = partition_path(partitions_dir, db_path, partition)
+            if os.path.exists(path):
+                _set_read_only(path, False)
+            connection.execute("ATTACH DATABASE ? AS archive", (path,))
+            try:
+                if partition == HISTORY_PARTITION:
+                    for year, aged_path in aged:
+                        connection.execute("ATTACH DATABASE ? AS aged", (aged_path,))
+                        try:
+                            for table_name in tables:
+                                count = _move_rows(connection, "aged", "archive", table_name)
+                                if count:
+                                    moved.setdefault(partition, {}).setdefault(table_name, 0)
+                                    moved[partition][table_name] += count
+                        finally:
+                            connection.execute("DETACH DATABASE aged")
+                        os.remove(aged_path)
+                        logging.info(f"Merged the archive of {year} into {path}")
+
+                for table_name, column in tables.items():
+                    if partition == HISTORY_PARTITION:
+                        condition, parameters = f'"{column}" < ?', (f"{first_yearly:04d}",)
+                    else:
+                        # A range rather than substr(), so the index of the column serves it
+                        condition = f'"{column}" >= ? AND "{column}" < ?'
+                        parameters = (f"{partition:04d}", f"{partition + 1:04d}")
+                    count = _move_rows(connection, "main", "archive", table_name, condition, parameters)
+                    if count:
+                        moved.setdefault(partition, {}).setdefault(table_name, 0)
+                        moved[partition][table_name] += count
+                        logging.info(f"Moved {count} rows of {table_name} to {path}")
+            finally:
+                connection.execute("DETACH DATABASE archive")
+                _set_read_only(path, True)
+    finally:
+        connection.close()
+
+    write_attach_file(db_path, partitions_dir)
+    return moved
+
+
+def attach_statements(db_path, partitions_dir):
+    """
+    Creates the statements attaching the archive databases to a connection to the hot database and
+    creating the TEMP views that read all years through the usual table names.
+
+    Parameters:
+    db_path (str): Path to the hot raw tables database.
+    partitions_dir (str): Directory holding the archive databases.
+
+    Returns:
+    list: The SQL statements, each on a single line.
+    """
+    partitions = list_partitions(partitions_dir, db_path)
+    if not partitions:
+        return []
+
+    # The archives are read-only files, so SQLite opens them read-only
+    statements = []
+    for partition, path in partitions:
+        quoted = os.path.abspath(path).replace("'", "''")
+        statements.append(f"ATTACH DATABASE '{quoted}' AS \"partition_{partition}\"")
+
+    connection = connect(db_path, profile="read-export")
+    try:
+        for partition, path in partitions:
+            connection.execute(f"ATTACH DATABASE ? AS \"partition_{partition}\"", (path,))
+
+        for table_name in PARTITION_COLUMNS:
+            columns, primary_key = _columns(connection, "main", table_name)
+            if not columns:
+                continue
+            column_list = ', '.join([f'"{column}"' for column in columns])
+            selects = [f'SELECT {column_list} FROM main."{table_name}"']
+            newer = ["main"]
+            for partition, _ in partitions:
+                schema = f"partition_{partition}"
+                archive_columns, _ = _columns(connection, schema, table_name)
+                if archive_columns:
+                    # Columns added to the hot table after the rollover read as NULL
+                    values = ', '.join([f'"{column}"' if column in archive_columns else f'NULL AS "{column}"'
+                                        for column in columns])
+                    # Keep only the newest version of each key
+                    exclusions = ' AND '.join([
+                        f'NOT EXISTS (SELECT 1 FROM "{other}"."{table_name}" AS newer WHERE '
+                        + ' AND '.join([f'newer."{pk}" = archived."{pk}"' for pk in primary_key]) + ')'
+                        for other in newer]) if primary_key else ''
+                    selects.append(f'SELECT {values} FROM "{schema}"."{table_name}" AS archived'
+                                   + (f' WHERE {exclusions}' if exclusions else ''))
+                    newer.append(schema)
+            statements.append(f'CREATE TEMP VIEW IF NOT EXISTS "{table_name}" AS {" UNION ALL ".join(selects)}')
+    finally:
+        connection.close()
+    return statements
+
+
+def write_attach_file(db_path, partitions_dir):
+    """
+    Writes the statements attaching the archive databases to `attach_partitions.sql`, which the R transforms
+    run on their connection to the hot database. The statements create TEMP views, so the connection must
+    not be read-only.
+
+    Parameters:
+    db_path (str): Path to the hot raw tables database.
+    partitions_dir (str): Directory holding the archive databases.
+
+    Returns:
+    str: The path of the file written.
+    """
+    path = os.path.join(partitions_dir, ATTACH_FILE_NAME)
+    with open(path, 'w') as file:
+        for statement in attach_statements(db_path, partitions_dir):
+            file.write(statement + "\n")
+    logging.info(f"Wrote the statements attaching the raw table partitions to {path}")
+    return path
+
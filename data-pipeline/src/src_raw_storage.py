@@ -0,0 +1,191 @@
+"""
+Raw Tables Storage Module
+
+This module converts raw tables between ordinary rowid tables and `WITHOUT ROWID` tables, and benchmarks
+the load of a table in both layouts.
+
+A rowid table with a TEXT primary key stores every row twice: once in the table, ordered by a hidden
+rowid, and once in the index of the primary key. Every upsert then searches two B-trees. A `WITHOUT ROWID`
+table is stored as a single B-tree ordered by its primary key, which saves the space of the key index and
+one lookup per row. That pays off most for tables with wide composite keys and narrow rows, such as
+`OfficerRadioLogTable`, `TableOfInvolvements` and `LawIncidentOffensesDetail`.
+
+Tables can optionally be made `STRICT` too, so SQLite rejects values of the wrong type instead of storing
+them. STRICT tables require SQLite 3.37 or newer.
+
+Note:
+    The primary key columns of a `WITHOUT ROWID` table are NOT NULL, unlike those of a rowid table, so rows
+    with a missing key are rejected by the load and quarantined.
+"""
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from src_sqlite_connection import connect
+from src_load_raw_data_sqlite_db import merge_csv
+
+# Raw tables with a composite primary key, which benefit the most from WITHOUT ROWID
+COMPOSITE_KEY_TABLES = ["OfficerRadioLogTable", "TableOfInvolvements", "LawIncidentOffensesDetail"]
+
+
+def get_table_sql(connection, table_name):
+    """
+    Returns the CREATE TABLE statement of a table.
+
+    Parameters:
+    connection (Connection): A connection to the database.
+    table_name (str): The name of the table.
+
+    Returns:
+    str: The statement, or None if the table does not exist.
+    """
+    row = connection.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                             (table_name,)).fetchone()
+    return row[0] if row else None
+
+
+def table_definition(sql, table_name, without_rowid=True, strict=False):
+    """
+    Rewrites a CREATE TABLE statement for another table name and storage layout.
+
+    Parameters:
+    sql (str): The CREATE TABLE statement of the table.
+    table_name (str): The name of the table to create.
+    without_rowid (bool, optional): Create a WITHOUT ROWID table. Default is True.
+    strict (bool, optional): Create a STRICT table. Default is False.
+
+    Returns:
+    str: The rewritten CREATE TABLE statement.
+    """
+    # Drop the current table options, everything after the closing parenthesis of the column list
+    body = sql[sql.index('('):sql.rindex(')') + 1]
+    options = [option for option, enabled in (("WITHOUT ROWID", without_rowid), ("STRICT", strict)) if enabled]
+    return f'CREATE TABLE "{table_name}" {body} {", ".join(options)}'.rstrip()
+
+
+def table_options(sql):
+    """
+    Returns the storage options of a CREATE TABLE statement.
+
+    Parameters:
+    sql (str): The CREATE TABLE statement.
+
+    Returns:
+    set: The options set, among "WITHOUT ROWID" and "STRICT".
+    """
+    options = sql[sql.rindex(')') + 1:].upper()
+    return {option for option in ("WITHOUT ROWID", "STRICT") if re.search(option.replace(' ', r'\s+'), options)}
+
+
+def rebuild_table(connection, table_name, without_rowid=True, strict=False):
+    """
+    Rebuilds a table with another storage layout, keeping its rows, generated columns and indexes.
+
+    Parameters:
+    connection (Connection): A connection to the database, opened with isolation_level=None.
+    table_name (str): The name of the table.
+    without_rowid (bool, optional): Rebuild as a WITHOUT ROWID table. Default is True.
+    strict (bool, optional): Rebuild as a STRICT table. Default is False.
+
+    Returns:
+    bool: True if the table was rebuilt, False if it already had the layout or does not exist.
+    """
+    sql = get_table_sql(connection, table_name)
+    if sql is None:
+        logging.warning(f"Table {table_name} not found, not rebuilt")
+        return False
+
+    wanted = {option for option, enabled in (("WITHOUT ROWID", without_rowid), ("STRICT", strict)) if enabled}
+    if table_options(sql) == wanted:
+        logging.info(f"Table {table_name} already has the requested layout")
+        return False
+    if strict and sqlite3.sqlite_version_info < (3, 37, 0):
+        raise RuntimeError(f"SQLite {sqlite3.sqlite_version} does not support STRICT tables")
+
+    new_table = f"{table_name}_rebuild"
+    # Generated columns are computed, so only the stored columns are copied
+    columns = ', '.join([f'"{row[1]}"' for row in connection.execute(f'PRAGMA table_info("{table_name}")')])
+    indexes = [index_sql for (index_sql,) in connection.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table_name,))]
+
+    started = time.perf_counter()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.execute(f'DROP TABLE IF EXISTS "{new_table}"')
+        connection.execute(table_definition(sql, new_table, without_rowid, strict))
+        connection.execute(f'INSERT INTO "{new_table}" ({columns}) SELECT {columns} FROM "{table_name}"')
+        connection.execute(f'DROP TABLE "{table_name}"')
+        connection.execute(f'ALTER TABLE "{new_table}" RENAME TO "{table_name}"')
+        for index_sql in indexes:
+            connection.execute(index_sql)
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+
+    logging.info(f"Rebuilt {table_name} as {' '.join(sorted(wanted)) or 'rowid'} table "
+                 f"in {time.perf_counter() - started:.1f} seconds")
+    return True
+
+
+def _database_size(db_path):
+    """
+    Returns the size of a database in bytes, after a checkpoint of its write-ahead log.
+    """
+    connection = connect(db_path)
+    try:
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        connection.close()
+    return page_count * page_size
+
+
+def benchmark_load(file_name, table_name, primary_key, sql, layouts=None):
+    """
+    Loads a CSV file into scratch databases holding the table in each storage layout, and measures the
+    time of a first load (all rows inserted), of a reload (all rows unchanged) and the database size.
+
+    Parameters:
+    file_name (str): Path to the CSV file of the table.
+    table_name (str): The name of the table.
+    primary_key (str or list): The primary key of the table.
+    sql (str): The CREATE TABLE statement of the table.
+    layouts (dict, optional): The layouts to compare, by name, as (without_rowid, strict) tuples.
+                              Defaults to rowid and WITHOUT ROWID.
+
+    Returns:
+    dict: The 'load_seconds', 'reload_seconds' and 'bytes' of each layout, by name.
+    """
+    if layouts is None:
+        layouts = {"rowid": (False, False), "without_rowid": (True, False)}
+
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="raw_storage_benchmark_")
+    try:
+        for name, (without_rowid, strict) in layouts.items():
+            db_path = os.path.join(work_dir, f"{name}.db")
+            connection = connect(db_path)
+            connection.execute(table_definition(sql, table_name, without_rowid, strict))
+            connection.commit()
+            connection.close()
+
+            started = time.perf_counter()
+            merge_csv(file_name, table_name, primary_key, db_path)
+            load_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            merge_csv(file_name, table_name, primary_key, db_path)
+            reload_seconds = time.perf_counter() - started
+
+            results[name] = {'load_seconds': load_seconds, 'reload_seconds': reload_seconds,
+                             'bytes': _database_size(db_path)}
+            logging.info(f"Benchmark of {table_name} as {name}: {results[name]}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
@@ -0,0 +1,106 @@
+"""
+Raw Tables Timestamp Module
+
+This module adds sortable companion columns to the timestamp columns of the raw tables.
+
+The DataExchange API returns timestamps as text formatted "%H:%M:%S %m/%d/%Y" (e.g. "15:18:57 01/02/2024"),
+and the raw tables store them as received. That text does not sort by time, so every consumer has to parse
+every row before it can filter on a date range, and no index can serve the range.
+
+Next to each timestamp column `<Column>` a generated column `<Column>ISO` holds the same timestamp as
+"YYYY-MM-DD HH:MM:SS" (or "YYYY-MM-DD" for date-only values), the format SQLite's date functions and R's
+`as.character(as.POSIXct(...))` use. Values in any other format are NULL. The timestamps stay in the local
+time of the source system, as the API returns them without a time zone.
+
+The columns are VIRTUAL generated columns: they are computed by SQLite, so the loader and the existing
+rows need no change, they take no space in the table, and they can be indexed (see src_raw_indexes), so
+a date-range filter becomes an index range scan:
+
+    SELECT * FROM LawIncidentTable
+    WHERE "TimeDateReportedISO" BETWEEN '2024-01-01' AND '2024-01-31 23:59:59'
+
+Generated columns require SQLite 3.31 or newer.
+"""
+import logging
+import sqlite3
+
+# Suffix of the name of the companion column of a timestamp column
+TIMESTAMP_SUFFIX = "ISO"
+
+# Timestamp columns of the raw tables that get a companion column
+TIMESTAMP_COLUMNS = {
+    "CADMasterCallTable": ["TimeDateReported", "TimeDateOccurredEarliest", "TimeDateOccurredLatest",
+                           "TimeDateRecordLastModified"],
+    "CADTrafficStopTable": ["TimeDateRecordLastModified"],
+    "LawIncidentTable": ["TimeDateReported", "TimeDateOccurredAfter", "TimeDateOccurredBefore",
+                         "TimeDateLastModified"],
+    "LawIncidentOffensesDetail": ["TimeDateLastModified"],
+    "OfficerRadioLogTable": ["TimeOfStatusChange"],
+    "MasterCitationTable": ["ViolationDate", "DateOfCitation", "TimeDateAdded", "TimeDateLastModified"],
+    "JailOffenseTable": ["TimeDate", "TimeDateAdded", "TimeDateRecordLastModified"],
+    "Offender": ["ArrestDate", "TimeDateAdded", "TimeDateRecordLastModified"],
+    "Victim": ["TimeDateAdded", "TimeDateRecordLastModified"],
+    "TableOfInvolvements": ["DateInvolvementOccurred"],
+    "MainNamesTable": ["TimeDateAdded", "TimeDateRecordLastModified"],
+}
+
+
+def timestamp_expression(column):
+    """
+    Creates the SQL expression converting a timestamp column of the API format to "YYYY-MM-DD HH:MM:SS".
+
+    Parameters:
+    column (str): The name of the timestamp column.
+
+    Returns:
+    str: The SQL expression, NULL for values in another format.
+    """
+    value = f'"{column}"'
+    return f"""CASE
+            WHEN {value} GLOB '[0-9][0-9]:[0-9][0-9]:[0-9][0-9] [0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]'
+            THEN substr({value}, 16, 4) || '-' || substr({value}, 10, 2) || '-' || substr({value}, 13, 2)
+                 || ' ' || substr({value}, 1, 8)
+            WHEN {value} GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]'
+            THEN substr({value}, 7, 4) || '-' || substr({value}, 1, 2) || '-' || substr({value}, 4, 2)
+        END"""
+
+
+def add_timestamp_columns(connection, timestamp_columns=None):
+    """
+    Adds the companion column of every timestamp column that does not have one yet. Missing tables and
+    columns are skipped.
+
+    Parameters:
+    connection (Connection): A connection to the raw tables database.
+    timestamp_columns (dict, optional): The timestamp columns per table. Defaults to TIMESTAMP_COLUMNS.
+
+    Returns:
+    list: The names of the columns added, as "table.column".
+    """
+    if timestamp_columns is None:
+        timestamp_columns = TIMESTAMP_COLUMNS
+
+    if sqlite3.sqlite_version_info < (3, 31, 0):
+        logging.error(f"SQLite {sqlite3.sqlite_version} does not support generated columns, "
+                      f"timestamp columns are not added.")
+        return []
+
+    added = []
+    for table_name, columns in timestamp_columns.items():
+        # Generated columns are hidden from table_info, table_xinfo lists them
+        table_columns = {row[1] for row in connection.execute(f'PRAGMA table_xinfo("{table_name}")')}
+        for column in columns:
+            companion = f"{column}{TIMESTAMP_SUFFIX}"
+            if companion in table_columns:
+                continue
+            if column not in table_columns:
+                logging.warning(f"Skipping timestamp column {table_name}.{column}: column not found")
+                continue
+
+            connection.execute(f"""
+                ALTER TABLE "{table_name}" ADD COLUMN "{companion}" TEXT
+                GENERATED ALWAYS AS ({timestamp_expression(column)}) VIRTUAL""")
+            added.append(f"{table_name}.{companion}")
+            logging.info(f"Added timestamp column {table_name}.{companion}")
+    connection.commit()
+    return added
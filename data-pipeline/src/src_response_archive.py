@@ -0,0 +1,292 @@
+"""
+Response Archive Module
+
+This module keeps a compressed copy of every raw XML response returned by the DataExchange API, so
+extracts can be reprocessed (e.g. after a fix to the parsing or hashing) without querying the
+production Spillman server again.
+
+Responses are stored gzip-compressed and content-addressed under the `archive_dir` of config.yaml:
+each response is saved once under the SHA-256 digest of its text, so identical responses (like the
+empty responses of quiet nights) take up space only once. A SQLite index maps every extract spec and
+query window to the digest of its response:
+
+    archive_dir/
+        index.db
+        objects/<first two hex digits>/<sha256>.xml.gz
+
+Responses are written to the archive as they are streamed from the API (see `ResponseWriter`), and
+read back as streams, so neither the extract nor a replay holds a whole response in memory.
+
+Note:
+    The archived responses are the raw data before hashing and contain identifying information. The
+    archive is created readable by its owner only and must be stored and handled with the same care
+    as the raw data.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import threading
+import yaml
+from datetime import datetime
+
+from src_sqlite_connection import connect
+
+home = os.environ.get('HOME')
+
+# Load the YAML configuration file for paths
+with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
+    config = yaml.safe_load(file)
+
+# Format of the query windows in the index, the same as the dates in the XML query
+ARCHIVE_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class ResponseArchive:
+    """
+    A content-addressed store of gzip-compressed API responses, indexed by extract spec and query window.
+
+    Parameters:
+    archive_dir (str): Directory holding the archive.
+    """
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self.objects_dir = os.path.join(archive_dir, "objects")
+
+        if not os.path.exists(self.objects_dir):
+            # Readable by the owner only, as the responses hold the unhashed data
+            os.makedirs(self.objects_dir, mode=0o700)
+            logging.info(f"Created response archive directory: {archive_dir}")
+
+        # Extracts run in parallel, so wait on locks and let readers run alongside a writer
+        self.connection = connect(os.path.join(archive_dir, "index.db"), profile="bulk-load", timeout=60)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                spec_name TEXT NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                archived_at TEXT NOT NULL,
+                PRIMARY KEY (spec_name, start_date, end_date)
+            )""")
+        self.connection.commit()
+
+    def _object_path(self, digest):
+        """
+        Returns the path of the compressed response with the given digest.
+
+        Parameters:
+        digest (str): SHA-256 hex digest of the response text.
+
+        Returns:
+        str: Path to the compressed response.
+        """
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}.xml.gz")
+
+    def writer(self, spec_name, start_date, end_date):
+        """
+        Starts archiving the response of an extract for a query window, written as it is read.
+
+        Parameters:
+        spec_name (str): The name of the extract spec.
+        start_date (datetime): Start datetime of the query.
+        end_date (datetime): End datetime of the query.
+
+        Returns:
+        ResponseWriter: The writer. Call `commit` once the whole response is written, or `abort`.
+        """
+        return ResponseWriter(self, spec_name, start_date, end_date)
+
+    def store(self, spec_name, start_date, end_date, text):
+        """
+        Archives the response of an extract for a query window.
+
+        Parameters:
+        spec_name (str): The name of the extract spec.
+        start_date (datetime): Start datetime of the query.
+        end_date (datetime): End datetime of the query.
+        text (str): The response text.
+
+        Returns:
+        str: The digest the response is stored under.
+        """
+        writer = self.writer(spec_name, start_date, end_date)
+        try:
+            writer.write(text.encode("utf-8"))
+        except Exception:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def _index(self, spec_name, start_date, end_date, digest, size):
+        """
+        Points the query window of an extract to the digest of its response.
+        """
+        self.connection.execute("""
+            INSERT OR REPLACE INTO responses (spec_name, start_date, end_date, digest, bytes, archived_at)
+            VALUES (?, ?, ?, ?, ?, ?)""",
+                                (spec_name, start_date.strftime(ARCHIVE_DATE_FORMAT),
+                                 end_date.strftime(ARCHIVE_DATE_FORMAT), digest, size,
+                                 datetime.now().strftime(ARCHIVE_DATE_FORMAT)))
+        self.connection.commit()
+        logging.info(f"Archived response of {spec_name} from {start_date} to {end_date} as {digest}")
+
+    def open(self, spec_name, start_date, end_date):
+        """
+        Opens the archived response of an extract for a query window, to be read as a stream.
+
+        Parameters:
+        spec_name (str): The name of the extract spec.
+        start_date (datetime): Start datetime of the query.
+        end_date (datetime): End datetime of the query.
+
+        Returns:
+        file object: The decompressed response, in binary mode, or None if no response is archived for this window.
+        """
+        row = self.connection.execute(
+            "SELECT digest FROM responses WHERE spec_name = ? AND start_date = ? AND end_date = ?",
+            (spec_name, start_date.strftime(ARCHIVE_DATE_FORMAT), end_date.strftime(ARCHIVE_DATE_FORMAT))).fetchone()
+        if row is None:
+            return None
+        return gzip.open(self._object_path(row[0]), 'rb')
+
+    def load(self, spec_name, start_date, end_date):
+        """
+        Reads the archived response of an extract for a query window.
+
+        Parameters:
+        spec_name (str): The name of the extract spec.
+        start_date (datetime): Start datetime of the query.
+        end_date (datetime): End datetime of the query.
+
+        Returns:
+        str: The response text, or None if no response is archived for this window.
+        """
+        file = self.open(spec_name, start_date, end_date)
+        if file is None:
+            return None
+        with file:
+            return file.read().decode("utf-8")
+
+    def windows(self, spec_name, start_date=None, end_date=None):
+        """
+        Lists the archived query windows of an extract spec, oldest first.
+
+        Parameters:
+        spec_name (str): The name of the extract spec.
+        start_date (datetime, optional): Only list windows starting at or after this datetime. Default is None.
+        end_date (datetime, optional): Only list windows ending at or before this datetime. Default is None.
+
+        Returns:
+        list: The (start datetime, end datetime) of each archived window.
+        """
+        query = "SELECT start_date, end_date FROM responses WHERE spec_name = ?"
+        parameters = [spec_name]
+        if start_date is not None:
+            query += " AND start_date >= ?"
+            parameters.append(start_date.strftime(ARCHIVE_DATE_FORMAT))
+        if end_date is not None:
+            query += " AND end_date <= ?"
+            parameters.append(end_date.strftime(ARCHIVE_DATE_FORMAT))
+
+        rows = self.connection.execute(query + " ORDER BY start_date, end_date", parameters).fetchall()
+        return [(datetime.strptime(start, ARCHIVE_DATE_FORMAT), datetime.strptime(end, ARCHIVE_DATE_FORMAT))
+                for start, end in rows]
+
+    def close(self):
+        """
+        Closes the index database connection.
+        """
+        self.connection.close()
+
+
+class ResponseWriter:
+    """
+    Writes a response to the archive as it is read, so it never has to be held in memory.
+
+    The response is compressed to a temporary file while its digest is computed, and moved to its
+    content address when committed, so a crash never leaves a truncated response behind.
+
+    Parameters:
+    archive (ResponseArchive): The archive the response is written to.
+    spec_name (str): The name of the extract spec.
+    start_date (datetime): Start datetime of the query.
+    end_date (datetime): End datetime of the query.
+    """
+
+    def __init__(self, archive, spec_name, start_date, end_date):
+        self.archive = archive
+        self.spec_name = spec_name
+        self.start_date = start_date
+        self.end_date = end_date
+        self.hash = hashlib.sha256()
+        self.bytes = 0
+
+        os.makedirs(archive.objects_dir, mode=0o700, exist_ok=True)
+        self.temporary_path = os.path.join(archive.objects_dir, f"{os.getpid()}.{threading.get_ident()}.tmp")
+        self.raw_file = open(os.open(self.temporary_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600), 'wb')
+        self.gzip_file = gzip.GzipFile(fileobj=self.raw_file, mode='wb')
+
+    def write(self, data):
+        """
+        Writes the next part of the response.
+
+        Parameters:
+        data (bytes): The part of the response.
+        """
+        self.gzip_file.write(data)
+        self.hash.update(data)
+        self.bytes += len(data)
+
+    def _close(self):
+        self.gzip_file.close()
+        self.raw_file.close()
+
+    def commit(self):
+        """
+        Moves the written response to its content address and indexes it.
+
+        Returns:
+        str: The digest the response is stored under.
+        """
+        self._close()
+        digest = self.hash.hexdigest()
+        object_path = self.archive._object_path(digest)
+        if os.path.exists(object_path):
+            os.remove(self.temporary_path)
+        else:
+            os.makedirs(os.path.dirname(object_path), mode=0o700, exist_ok=True)
+            os.replace(self.temporary_path, object_path)
+        self.archive._index(self.spec_name, self.start_date, self.end_date, digest, self.bytes)
+        return digest
+
+    def abort(self):
+        """
+        Discards the written part of the response.
+        """
+        try:
+            self._close()
+        finally:
+            if os.path.exists(self.temporary_path):
+                os.remove(self.temporary_path)
+
+
+def get_response_archive():
+    """
+    Opens the response archive configured under `archive_dir` in the `paths` section of config.yaml.
+
+    Returns:
+    ResponseArchive: The opened archive, or None if no archive is configured or it could not be opened.
+    """
+    archive_dir = config['paths'].get('archive_dir')
+    if not archive_dir:
+        logging.info("No response archive configured, responses are not archived.")
+        return None
+
+    try:
+        return ResponseArchive(os.path.join(home, archive_dir))
+    except Exception as e:
+        logging.error(f"Error opening response archive, responses are not archived: {e}")
+        return None
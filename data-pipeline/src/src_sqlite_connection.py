@@ -0,0 +1,137 @@
+"""
+SQLite Connection Module
+
+This module is the single place where the pipeline opens SQLite databases. Every connection is opened
+with a named performance profile, a set of PRAGMAs tuned for what the connection is used for:
+
+- "default": SQLite's own settings, for small reads and writes such as schema changes.
+- "bulk-load": for the loads into the raw tables. The database is switched to write-ahead logging, so
+  readers no longer block the load and the load no longer blocks readers, commits only sync at
+  checkpoints (`synchronous=NORMAL`, safe in WAL mode), and a large page cache and in-memory temporary
+  storage keep the staging tables and sorts off the disk. WAL mode is a property of the database file,
+  not of the connection: once a bulk load has run, the raw database stays in WAL mode for every reader,
+  including the R `dbConnect` connections of the transforms, which need write access to the directory of
+  the database for its `-wal` and `-shm` files. A copy of the database file alone misses the changes not
+  yet checkpointed from the `-wal` file, which is why the backups use the online backup API (see
+  src_backup_sqlite_db).
+- "read-export": for the frontend and download exports. The connection is read-only (`mode=ro` and
+  `query_only`), so a wrong path fails instead of creating an empty database, uses a shared cache and
+  memory-maps the database file, so reads avoid copying pages through the page cache.
+
+The PRAGMA values of a profile can be overridden in the optional `sqlite_profiles` section of
+config.yaml, e.g.:
+
+    sqlite_profiles:
+      bulk-load:
+        cache_size: -524288
+
+Index builds can be deferred during large loads with `defer_indexes`, which drops the secondary indexes
+of the loaded tables and recreates them in one pass once the load is done.
+"""
+import logging
+import os
+import pathlib
+import sqlite3
+import yaml
+from contextlib import contextmanager
+
+home = os.environ.get('HOME')
+
+# Load the YAML configuration file for paths
+with open(os.path.join(home, 'airflow/config.yaml'), 'r') as file:
+    config = yaml.safe_load(file)
+
+# PRAGMAs of every profile, applied in order. Negative cache sizes are in KiB.
+PROFILES = {
+    "default": {},
+    "bulk-load": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -262144,
+        "temp_store": "MEMORY",
+    },
+    "read-export": {
+        "mmap_size": 268435456,
+        "cache_size": -65536,
+        "temp_store": "MEMORY",
+        "query_only": "ON",
+    },
+}
+
+# Profiles opened through a shared cache
+SHARED_CACHE_PROFILES = {"read-export"}
+
+
+def get_profile(profile):
+    """
+    Returns the PRAGMAs of a profile, with the overrides of config.yaml applied.
+
+    Parameters:
+    profile (str): The name of the profile.
+
+    Returns:
+    dict: The PRAGMA names and values of the profile.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown SQLite profile: {profile}. Expected one of {', '.join(PROFILES)}.")
+
+    pragmas = dict(PROFILES[profile])
+    pragmas.update((config.get('sqlite_profiles') or {}).get(profile) or {})
+    return pragmas
+
+
+def connect(db_path, profile="default", **kwargs):
+    """
+    Opens an SQLite database with a performance profile.
+
+    Parameters:
+    db_path (str): Path to the SQLite database file.
+    profile (str, optional): The name of the profile, one of PROFILES. Default is "default".
+    **kwargs: Other arguments passed on to `sqlite3.connect`, e.g. `timeout` or `isolation_level`.
+
+    Returns:
+    Connection: The database connection.
+    """
+    pragmas = get_profile(profile)
+
+    if profile in SHARED_CACHE_PROFILES:
+        # Readers of the same database in this process share one page cache
+        uri = pathlib.Path(db_path).absolute().as_uri() + "?mode=ro&cache=shared"
+        connection = sqlite3.connect(uri, uri=True, **kwargs)
+    else:
+        connection = sqlite3.connect(db_path, **kwargs)
+
+    for name, value in pragmas.items():
+        connection.execute(f"PRAGMA {name} = {value}")
+    logging.debug(f"Opened {db_path} with the {profile} profile")
+    return connection
+
+
+@contextmanager
+def defer_indexes(connection, table_names):
+    """
+    Drops the secondary indexes of tables for the duration of a load and recreates them afterwards, so each
+    index is built once in sorted order instead of being updated row by row.
+
+    Only worth it for loads that write a large share of a table, such as backfills. The indexes are
+    recreated even if the load fails.
+
+    Parameters:
+    connection (Connection): A connection to the database, outside of a transaction.
+    table_names (list): The names of the loaded tables.
+    """
+    placeholders = ', '.join(['?'] * len(table_names))
+    indexes = connection.execute(f"""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})""",
+                                 list(table_names)).fetchall()
+    for name, _ in indexes:
+        connection.execute(f'DROP INDEX "{name}"')
+    logging.info(f"Deferred {len(indexes)} indexes of {', '.join(table_names)}")
+
+    try:
+        yield
+    finally:
+        for _, sql in indexes:
+            connection.execute(sql)
+        logging.info(f"Rebuilt {len(indexes)} indexes of {', '.join(table_names)}")
@@ -0,0 +1,53 @@
+"""
+Tests of the online backups of the SQLite databases (src_backup_sqlite_db).
+
+The modules under src read airflow/config.yaml from HOME when imported, so the tests point HOME at a
+temporary directory holding a minimal configuration first.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+
+home = tempfile.mkdtemp()
+os.makedirs(os.path.join(home, 'airflow'))
+with open(os.path.join(home, 'airflow/config.yaml'), 'w') as file:
+    file.write("paths:\n  src_dir: src\n")
+os.environ['HOME'] = home
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from src_backup_sqlite_db import backup_sqlite_db  # noqa: E402
+
+
+def create_without_rowid_db(db_path):
+    """
+    Creates a database with a WITHOUT ROWID table shaped like the raw tables: a composite primary key whose
+    columns are not the leading ones and a generated column.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute('''CREATE TABLE "LawIncidentOffensesDetail" (
+                    "StatuteCode" TEXT,
+                    "SequenceNumber" TEXT,
+                    "OffenseCode" TEXT,
+                    "TimeDateLastModified" TEXT,
+                    "IncidentNumber" TEXT,
+                    "TimeDateLastModifiedISO" TEXT GENERATED ALWAYS AS (substr("TimeDateLastModified", 7, 4)) VIRTUAL,
+                    Primary Key ("IncidentNumber", "StatuteCode", "OffenseCode", "SequenceNumber")
+                    ) WITHOUT ROWID''')
+    conn.executemany('INSERT INTO "LawIncidentOffensesDetail" VALUES (?, ?, ?, ?, ?)',
+                     [(f"S{i}", str(i), f"O{i}", "01/02/2024", f"I{i % 7}") for i in range(500)])
+    conn.commit()
+    conn.close()
+
+
+def test_backup_without_rowid_db_passes_integrity_check(tmp_path, caplog):
+    db_path = str(tmp_path / "raw.db")
+    create_without_rowid_db(db_path)
+
+    backup_path = backup_sqlite_db(db_path, str(tmp_path / "backups"), "raw", integrity_check=True)
+
+    assert backup_path is not None
+    assert not [record for record in caplog.records if record.levelname == "ERROR"]
+    conn = sqlite3.connect(backup_path)
+    assert conn.execute('SELECT count(*) FROM "LawIncidentOffensesDetail"').fetchone()[0] == 500
+    conn.close()